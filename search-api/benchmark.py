@@ -11,20 +11,48 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""Tools for testing database performance."""
+"""Benchmark the searches, director detail and export against a database.
 
+Each scenario runs --warmup untimed iterations, then --iterations timed ones. For each, the report gives the
+p50/p95/p99 of the time to the first row, to a full page (50 rows) and to the last row (at most 500, fetched a
+page at a time as the search endpoints page them), the rows per second, and the SQL the scenario ran. Use
+--output to save the results as JSON, and --compare to compare them with a saved run.
+
+    python benchmark.py                                  # every scenario, against DATABASE_URL
+    python benchmark.py exact nicknames --iterations 50
+    python benchmark.py --database-url sqlite:// --seed  # against an in-memory database of bootstrap.py's data
+    python benchmark.py --database-url sqlite:// --seed --scale 100000  # ...and 100,000 generated parties
+    python benchmark.py --output after.json --compare before.json
+
+With --plans, it captures the query plan of each director search field/operator combination instead (see
+search_api/utils/query_plans.py), and flags any that fully scan a large table or, with --compare, that got worse
+than the saved plans. It exits with 1 if any got worse.
+
+    python benchmark.py --plans --output plans.json
+    python benchmark.py --plans --compare plans.json
+"""
+
+import argparse
+import datetime
+import json
+import sys
 import time
 
-from sqlalchemy.sql import literal_column
-from sqlalchemy.dialects import oracle
+from sqlalchemy import event, func
 from werkzeug.datastructures import ImmutableMultiDict
 
 from search_api import create_app
 from search_api.models.base import db
 from search_api.models.corp_party import CorpParty
 from search_api.models.corporation import Corporation
+from search_api.utils.pagination import MAX_PAGED_RESULTS, get_page
+from search_api.utils.query_plans import capture_plans, find_regressions
+from search_api.utils.utils import percentile
+
 
-# Compare original COBRS system performance.
+PER_PAGE = 50
+
+# Compare original COBRS system performance. Oracle only.
 COBRS_SQL = """SELECT
        UPPER(LAST_NME)
       ,UPPER(FIRST_NME)
@@ -32,8 +60,6 @@ COBRS_SQL = """SELECT
       ,CASE  PARTY_TYP_CD       WHEN 'FIO' THEN 'OWNER'
                                 WHEN 'DIR' THEN 'DIR'
                                 ELSE 'OFF' END AS TITLE
-    #   , CASE OS.OP_STATE_TYP_CD WHEN 'ACT' THEN 'A'
-    #                             ELSE 'H' END AS STATUS
       ,CORP_PARTY_ID
       ,CORP_CLASS
   FROM CORP_PARTY P
@@ -42,7 +68,6 @@ COBRS_SQL = """SELECT
       ,CORPORATION  C
       ,CORP_TYPE    CT
 WHERE UPPER(FIRST_NME) LIKE 'JOHN'
-    #AND PARTY_TYP_CD IN ('FIO', 'DIR','OFF')
     AND P.END_EVENT_ID IS NULL
     AND P.CORP_NUM = S.CORP_NUM
     AND S.END_EVENT_ID IS NULL
@@ -51,292 +76,269 @@ WHERE UPPER(FIRST_NME) LIKE 'JOHN'
     AND C.CORP_TYP_CD = CT.CORP_TYP_CD
     AND ROWNUM <= 165
 ORDER BY UPPER(LAST_NME)
-#, UPPER(FIRST_NME), STATUS,CORP_CLASS,CORP_NUM DESC
-"""
-
-# Director search sql example.
-DS_OPT = """
-SELECT
-    corp_party.corp_party_id,
-       corp_party.mailing_addr_id,
-       corp_party.delivery_addr_id,
-       corp_party.corp_num,
-       corp_party.party_typ_cd,
-       corp_party.start_event_id,
-       corp_party.end_event_id,
-       corp_party.prev_party_id,
-       corp_party.corr_typ_cd,
-       corp_party.last_report_dt,
-       corp_party.appointment_dt,
-       corp_party.cessation_dt,
-       corp_party.last_nme,
-       corp_party.middle_nme,
-       corp_party.first_nme,
-       corp_party.business_nme,
-       corp_party.bus_company_num,
-       corp_party.email_address,
-       corp_party.corp_party_seq_num,
-       corp_party.phone,
-       corp_party.reason_typ_cd,
-       corp_name.corp_nme,
-       address.addr_line_1,
-       address.addr_line_2,
-       address.addr_line_3,
-       address.postal_cd
-FROM
-    corp_party
-    JOIN corporation ON corporation.corp_num = corp_party.corp_num
-    JOIN corp_state ON corp_state.corp_num = corp_party.corp_num
-    JOIN corp_op_state ON corp_op_state.state_typ_cd = corp_state.state_typ_cd
-    LEFT OUTER JOIN corp_name ON corporation.corp_num = corp_name.corp_num
-    LEFT OUTER JOIN address ON corp_party.mailing_addr_id = address.addr_id
-WHERE upper(corp_party.last_nme) LIKE 'JOHN'
-    AND corp_party.END_EVENT_ID IS NULL
-    and corp_state.end_event_id is null
-    and corp_name.end_event_id is null
-    #AND ROWNUM <= 50
-ORDER BY upper(corp_party.last_nme)
 """
 
+_SORT = [('mode', 'ALL'), ('sort_type', 'dsc'), ('sort_value', 'lastNme'), ('additional_cols', 'none')]
+
+# The director searches, by scenario name. The values match bootstrap.py's data.
+DIRECTOR_SEARCHES = {
+    'exact': [('field', 'lastNme'), ('operator', 'exact'), ('value', 'Patterson')],
+    'startswith': [
+        ('field', 'firstNme'), ('operator', 'startswith'), ('value', 'ab'),
+        ('field', 'lastNme'), ('operator', 'startswith'), ('value', 'pat'),
+    ],
+    'similar': [('field', 'lastNme'), ('operator', 'similar'), ('value', 'Paterson')],
+    'nicknames': [('field', 'firstNme'), ('operator', 'nicknames'), ('value', 'Lily')],
+    'addr': [('field', 'addrLine1'), ('operator', 'contains'), ('value', 'Rue')],
+    'postalCd': [('field', 'postalCd'), ('operator', 'exact'), ('value', 'T0M0G0')],
+}
+
+CORPORATION_SEARCH = [('query', 'Energy'), ('sort_type', 'dsc'), ('sort_value', 'corpNme')]
+
+EXPORT_SEARCH = DIRECTOR_SEARCHES['startswith']
+
+
+def _pages(query):
+    """Fetch the first MAX_PAGED_RESULTS rows of query a page at a time, with get_page(), as the search endpoints do."""
+    page = 1
+    rows = get_page(query, page, PER_PAGE)
+    while rows:
+        yield from rows
+        if len(rows) < PER_PAGE:
+            break
+        page += 1
+        rows = get_page(query, page, PER_PAGE)
 
-def _benchmark(start_time, result_set):
-    """Benchmark utility"""
-    if hasattr(result_set, 'statement'):
-        oracle_dialect = oracle.dialect(max_identifier_length=30)
-        raw_sql = str(result_set.statement.compile(dialect=oracle_dialect))
-        print(raw_sql)
 
+def _time_rows(rows):
+    """Consume rows, returning the times (in seconds) to the first row, a full page and the last, and the count."""
+    start = time.perf_counter()
+    first_row = full_page = None
     count = 0
-    for row in result_set:
-        if count >= 50:
-            break
-        print(row)
-        count += 1
-    print('raw query time:', time.time() - start_time, ' number of results >=:', count)
-
-
-def corporations():
-    """Search corporations"""
-    return (
-        Corporation.search_corporations(
-            ImmutableMultiDict(
-                [
-                    ('query', 'countable'),
-                    ('page', '1'),
-                    ('sort_type', 'dsc'),
-                    ('sort_value', 'corpNme'),
-                ]
-            )
-        )
-        .filter(literal_column('rownum') <= 500)
-        .yield_per(50)
-    )
-
-
-def corp_party_search():
-    """Search Corp Party"""
-
-    args = ImmutableMultiDict(
-        [
-            ('field', 'firstNme'),
-            ('operator', 'exact'),
-            ('value', 'john'),
-            ('mode', 'ALL'),
-            ('page', '1'),
-            ('sort_type', 'dsc'),
-            ('sort_value', 'lastNme'),
-            ('additional_cols', 'none'),
-        ]
-    )
-
-    return (
-        CorpParty.search_corp_parties(args)
-        .filter(literal_column('rownum') <= 500)
-        .yield_per(50)
-    )
-
-
-def corp_party_similar_search():
-    """Search Corp Party by similar"""
-
-    args = ImmutableMultiDict(
-        [
-            ('field', 'firstNme'),
-            ('field', 'lastNme'),
-            ('operator', 'similar'),
-            ('operator', 'exact'),
-            ('value', 'john'),
-            ('value', 'smith'),
-            ('mode', 'ALL'),
-            ('additional_cols', 'none'),
-            ('page', '1'),
-            ('sort_type', 'dsc'),
-            ('sort_value', 'lastNme'),
-        ]
-    )
-
-    return (
-        CorpParty.search_corp_parties(args)
-        .filter(literal_column('rownum') <= 500)
-        .yield_per(50)
-    )
-
-
-def corp_party_nickname_search():
-    """Search Corp Party by nickname"""
-
-    args = ImmutableMultiDict(
-        [
-            ('field', 'firstNme'),
-            ('field', 'lastNme'),
-            ('operator', 'nicknames'),
-            ('operator', 'exact'),
-            ('value', 'john'),
-            ('value', 'smith'),
-            ('mode', 'ALL'),
-            ('additional_cols', 'none'),
-            ('page', '1'),
-            ('sort_type', 'dsc'),
-            ('sort_value', 'lastNme'),
-        ]
-    )
-
-    return (
-        CorpParty.search_corp_parties(args)
-        .filter(literal_column('rownum') <= 500)
-        .yield_per(50)
-    )
-
-
-def corp_party_2param_search():
-    """Corp party 2 params"""
-    args = ImmutableMultiDict(
-        [
-            ('field', 'firstNme'),
-            ('field', 'lastNme'),
-            ('operator', 'startswith'),
-            ('operator', 'startswith'),
-            ('value', 'clark'),
-            ('value', 'van'),
-            ('mode', 'ALL'),
-            ('additional_cols', 'none'),
-            ('page', '1'),
-            ('sort_type', 'dsc'),
-            ('sort_value', 'lastNme'),
-        ]
-    )
-    return (
-        CorpParty.search_corp_parties(args)
-        .filter(literal_column('rownum') <= 500)
-        .yield_per(50)
-    )
-
-
-def corp_party_addr_search():
-    """Search Corp Party by Address"""
-
-    args = ImmutableMultiDict(
-        [
-            # ('field', 'firstNme'),
-            # ('operator', 'exact'),
-            # ('value', 'donna'),
-            ('field', 'addrLine1'),
-            ('operator', 'contains'),
-            ('value', '123 main st'),
-            ('mode', 'ALL'),
-            ('page', '1'),
-            ('sort_type', 'dsc'),
-            ('sort_value', 'lastNme'),
-            ('additional_cols', 'none'),
-        ]
-    )
-
-    return (
-        CorpParty.search_corp_parties(args)
-        .filter(literal_column('rownum') <= literal_column('500'))
-        .yield_per(50)
-    )
-
-
-def corp_party_postal_cd_search():
-    """Search Corp Party by Postal Code"""
-    # Notes -
-    # Ideally we'd like an index of UPPER(TRIM(POSTAL_CD)) for address.
-    # Instead, the implementation is to try the 2 common versions. Uppercase with a space and
-    # uppercase without.
-    args = ImmutableMultiDict(
-        [
-            ('field', 'postalCd'),
-            ('operator', 'exact'),
-            ('value', 'V0H2B0'),
-            ('mode', 'ALL'),
-            ('page', '1'),
-            ('sort_type', 'dsc'),
-            ('sort_value', 'lastNme'),
-            ('additional_cols', 'none'),
-        ]
-    )
-
-    return (
-        CorpParty.search_corp_parties(args)
-        .filter(literal_column('rownum') <= 500)
-        .yield_per(50)
-    )
-
-
-def benchmark_raw_sql(sql):
-    """Benchmark raw SQL"""
-    sql = '\n'.join([s for s in sql.split('\n') if '#' not in s])
-    return db.session.execute(sql)
-
-
-SQL = """
-SELECT 1 FROM CORP_PARTY WHERE ROWNUM = 1
-"""
-# SQL = """
-# SELECT  *
-# FROM    all_indexes
-# WHERE   table_name = 'ADDRESS'"""
-SQL = """
+    for count, _ in enumerate(rows, start=1):
+        if count == 1:
+            first_row = time.perf_counter() - start
+        if count == PER_PAGE:
+            full_page = time.perf_counter() - start
 
-"""
+    total = time.perf_counter() - start
+    return {
+        'first_row': total if first_row is None else first_row,
+        'full_page': total if full_page is None else full_page,
+        'total': total,
+        'rows': count,
+    }
 
-if __name__ == '__main__':
 
-    app = create_app('benchmark')  # pylint: disable=invalid-name
-    with app.app_context():
-        for i in range(1):
+def director_search(args):
+    """Return a scenario that runs a director search."""
+    args = ImmutableMultiDict(args + _SORT)
+    return lambda app: _time_rows(
+        _pages(CorpParty.get_best_search_results(args, CorpParty.search_corp_parties(args), MAX_PAGED_RESULTS)))
 
-            print('warmup')
-            # t = time.time()
-            # rs = benchmark_raw_sql(SQL)
-            # _benchmark(t, rs)
 
-            # print('cobrs')
-            # t = time.time()
-            # rs = benchmark_raw_sql(COBRS_SQL)
-            # _benchmark(t, rs)
+def corporation_search(args):
+    """Return a scenario that runs a corporation search."""
+    args = ImmutableMultiDict(args)
+    return lambda app: _time_rows(_pages(Corporation.search_corporations(args)))
 
-            t = time.time()
-            rs = corp_party_addr_search()
-            _benchmark(t, rs)
 
-            # t = time.time()
-            # rs = corp_party_search()
-            # _benchmark(t, rs)
+def director_detail(app):
+    """Get a director's detail, as the API does."""
+    # local import, as the resources need the app's config
+    from search_api.resources.directors import get_corp_party_by_id  # pylint: disable=import-outside-toplevel
+
+    corp_party_id = db.session.query(func.min(CorpParty.corp_party_id)).scalar()
+
+    def detail():
+        yield get_corp_party_by_id.__wrapped__(corp_party_id)
+
+    with app.test_request_context():
+        return _time_rows(detail())
+
+
+def director_export(app):
+    """Export a director search to .xlsx, as the API does. Each "row" is a chunk of the file."""
+    from search_api.resources.directors import corpparty_search_export  # pylint: disable=import-outside-toplevel
+
+    with app.test_request_context(query_string=EXPORT_SEARCH + _SORT):
+        return _time_rows(corpparty_search_export.__wrapped__().response)
+
+
+def cobrs(app):  # pylint: disable=unused-argument
+    """Run the original COBRS system's search, for comparison. Oracle only."""
+    return _time_rows(db.session.execute(COBRS_SQL))
+
+
+SCENARIOS = {
+    **{name: director_search(args) for name, args in DIRECTOR_SEARCHES.items()},
+    'corpNme': corporation_search(CORPORATION_SEARCH),
+    'detail': director_detail,
+    'export': director_export,
+    'cobrs': cobrs,
+}
+
+DEFAULT_SCENARIOS = [name for name in SCENARIOS if name != 'cobrs']
+
+
+def _summarize(seconds):
+    return {'p{}'.format(p): round(percentile(seconds, p) * 1000, 3) for p in (50, 95, 99)}
+
+
+def run_scenario(app, scenario, iterations, warmup):
+    """Run a scenario, returning its timings (in milliseconds), row count and SQL."""
+    for _ in range(warmup):
+        scenario(app)
+        db.session.rollback()
+
+    timings = []
+    statements = []
+
+    def record_statement(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+        statements.append(statement)
+
+    for _ in range(iterations):
+        del statements[:]
+        event.listen(db.engine, 'before_cursor_execute', record_statement)
+        try:
+            timings.append(scenario(app))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record_statement)
+        db.session.rollback()
+
+    total_seconds = sum(timing['total'] for timing in timings)
+    total_rows = sum(timing['rows'] for timing in timings)
+    return {
+        'iterations': iterations,
+        'rows': timings[-1]['rows'],
+        'first_row_ms': _summarize([timing['first_row'] for timing in timings]),
+        'full_page_ms': _summarize([timing['full_page'] for timing in timings]),
+        'total_ms': _summarize([timing['total'] for timing in timings]),
+        'rows_per_sec': round(total_rows / total_seconds, 1) if total_seconds else None,
+        'queries': len(statements),
+        'sql': list(statements),
+    }
+
+
+def run(app, names, iterations, warmup):
+    """Run the named scenarios, returning the results. A scenario that fails reports its error instead."""
+    results = {
+        'started': datetime.datetime.utcnow().isoformat(),
+        'database': db.engine.dialect.name,
+        'scenarios': {},
+    }
+    for name in names:
+        try:
+            results['scenarios'][name] = run_scenario(app, SCENARIOS[name], iterations, warmup)
+        except Exception as err:  # pylint: disable=broad-except
+            db.session.rollback()
+            results['scenarios'][name] = {'error': str(err).splitlines()[0]}
+    return results
 
-            # t = time.time()
-            # rs = corp_party_postal_cd_search()
-            # _benchmark(t, rs)
 
-            # t = time.time()
-            # rs = corp_party_nickname_search()
-            # _benchmark(t, rs)
+def print_report(results, baseline=None):
+    """Print the results as a table, with the change in p50 and p95 total time from a baseline, if given."""
+    print('{:<12} {:>6} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'scenario', 'rows', 'queries', 'first p50', 'page p50', 'p50 ms', 'p95 ms', 'p99 ms', 'rows/s'))
 
-            # t = time.time()
-            # rs = corp_party_similar_search()
-            # _benchmark(t, rs)
+    for name, result in results['scenarios'].items():
+        if 'error' in result:
+            print('{:<12} error: {}'.format(name, result['error']))
+            continue
+
+        print('{:<12} {:>6} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+            name, result['rows'], result['queries'], result['first_row_ms']['p50'], result['full_page_ms']['p50'],
+            result['total_ms']['p50'], result['total_ms']['p95'], result['total_ms']['p99'], result['rows_per_sec']))
+
+        before = (baseline or {}).get('scenarios', {}).get(name)
+        if before and 'error' not in before:
+            changes = ', '.join(
+                '{} {:+.1%}'.format(p, result['total_ms'][p] / before['total_ms'][p] - 1)
+                for p in ('p50', 'p95') if before['total_ms'][p]
+            )
+            print('{:<12} vs baseline: {}'.format('', changes))
+
+
+def print_plans(results, baseline=None):
+    """Print each search case's plan and its regressions, returning whether any regressed from the baseline."""
+    regressed = False
+    for name, plan in results['plans'].items():
+        if 'error' in plan:
+            print('{}: error: {}'.format(name, plan['error']))
+            continue
+
+        before = (baseline or {}).get('plans', {}).get(name)
+        if before and 'error' in before:
+            before = None
+        regressions = find_regressions(plan, before)
+        regressed = regressed or bool(regressions and before)
+
+        print('{}{}'.format(name, ': ' + '; '.join(regressions) if regressions else ''))
+        for line in plan['plan']:
+            print('    ' + line)
+    return regressed
+
+
+def main(argv=None):
+    """Run the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help='the scenarios to run (default: all but cobrs): ' + ', '.join(SCENARIOS))
+    parser.add_argument('--plans', action='store_true', help='capture the query plans of the searches instead')
+    parser.add_argument('--iterations', type=int, default=10, help='timed iterations of each scenario')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed iterations before the timed ones')
+    parser.add_argument('--database-url', help='the database to use, instead of DATABASE_URL')
+    parser.add_argument('--seed', action='store_true', help="create the tables and load bootstrap.py's data first")
+    parser.add_argument('--scale', type=int, help='with --seed, also generate this many parties (generate_data.py)')
+    parser.add_argument('--output', help='save the results as JSON to this file')
+    parser.add_argument('--compare', help='compare with the results saved in this file')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error('unknown scenario: {} (choose from {})'.format(', '.join(unknown), ', '.join(SCENARIOS)))
+
+    app = create_app('benchmark')
+    if args.database_url:
+        app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+
+    with app.app_context():
+        if args.seed:
+            # local import, as bootstrap needs the app
+            from bootstrap import populate  # pylint: disable=import-outside-toplevel
+            from generate_data import generate  # pylint: disable=import-outside-toplevel
+
+            db.create_all()
+            populate()
+            db.session.commit()
+            if args.scale:
+                generate(args.scale)
+
+        if args.plans:
+            results = {
+                'started': datetime.datetime.utcnow().isoformat(),
+                'database': db.engine.dialect.name,
+                'plans': capture_plans(),
+            }
+        else:
+            results = run(app, args.scenarios or DEFAULT_SCENARIOS, args.iterations, args.warmup)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    regressed = False
+    if args.plans:
+        regressed = print_plans(results, baseline)
+    else:
+        print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    return 1 if regressed else 0
 
-            # t = time.time()
-            # rs = corporations()
-            # _benchmark(t, rs)
+
+if __name__ == '__main__':
+    sys.exit(main())
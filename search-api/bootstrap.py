@@ -19,6 +19,7 @@ from search_api.models.corporation import Corporation
 from search_api.models.corp_op_state import CorpOpState
 from search_api.models.corp_state import CorpState
 from search_api.models.corp_party import CorpParty
+from search_api.models.corp_party_search import CorpPartySearch, CorpPartySearchRefresh
 from search_api.models.corp_name import CorpName
 from search_api.models.address import Address
 from search_api.models.office import Office
@@ -30,14 +31,20 @@ from search_api.models.event import Event
 from search_api.models.filing import Filing
 from search_api.models.filing_type import FilingType
 from search_api.models.nickname import NickName
+from search_api.models.name_gram import NameGram
+from search_api.models.name_key import NameKey
 
 
 def reset():
     """Clear the database"""
     assert 'oracle' not in app.config.get("SQLALCHEMY_DATABASE_URI").lower()
     db.session.query(NickName).delete(synchronize_session=False)
+    db.session.query(NameGram).delete(synchronize_session=False)
+    db.session.query(NameKey).delete(synchronize_session=False)
     db.session.query(Corporation).delete(synchronize_session=False)
     db.session.query(CorpParty).delete(synchronize_session=False)
+    db.session.query(CorpPartySearch).delete(synchronize_session=False)
+    db.session.query(CorpPartySearchRefresh).delete(synchronize_session=False)
     db.session.query(CorpName).delete(synchronize_session=False)
     db.session.query(CorpOpState).delete(synchronize_session=False)
     db.session.query(CorpState).delete(synchronize_session=False)
@@ -241,6 +248,11 @@ def populate():
     populate_base()
     populate_corps()
 
+    # Index the names for the similar and phonetic searches, as refresh_search.py does for the real data.
+    NameGram.refresh()
+    NameKey.refresh()
+    db.session.commit()
+
 
 def populate_base():
     """
@@ -1,3 +1,4 @@
 #!/bin/bash
 
-gunicorn -b 0.0.0.0:5000 wsgi --worker-class=gevent --worker-connections=1000 --timeout 90
+# gunicorn_config.py sets up the workers, and the directory they share their Prometheus metrics through.
+gunicorn -c gunicorn_config.py -b 0.0.0.0:5000 wsgi --worker-class=gevent --worker-connections=1000 --timeout 90
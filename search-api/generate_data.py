@@ -0,0 +1,372 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Generate a synthetic database at a scale close to production's, for benchmarks and query plans.
+
+bootstrap.py inserts a handful of rows; production has about 2.2M corporations, 11.7M corp_party, 17.6M event and
+20.2M address rows (see the model docstrings). This generates --scale parties in those proportions, with
+related corporation, corp_state, corp_name, office, address, event, filing and offices_held rows. Names, corporation
+names and addresses follow skewed (Zipf) distributions, as real ones do, so common names match many rows and rare
+names few. Rows are bulk-loaded in batches: with COPY on Postgres, and as executemany inserts elsewhere.
+
+    python generate_data.py --scale 100000
+    python generate_data.py --scale 10000000 --database-url postgresql://postgres@localhost/search
+
+The code tables and NICKNAMES are loaded from bootstrap.py first, unless --no-base is given. IDs start after the
+largest already in the database, so it can be run more than once to grow the data.
+"""
+
+import argparse
+import bisect
+import csv
+import datetime
+import io
+import itertools
+import random
+
+from sqlalchemy import func
+
+from bootstrap import CORP_TYP_CDS, NICKNAMES, populate_base
+from search_api.models.address import Address
+from search_api.models.base import db
+from search_api.models.corp_name import CorpName
+from search_api.models.corp_party import CorpParty
+from search_api.models.corp_state import CorpState
+from search_api.models.corporation import Corporation
+from search_api.models.event import Event
+from search_api.models.name_gram import NameGram
+from search_api.models.name_key import NameKey
+from search_api.models.filing import Filing
+from search_api.models.office import Office
+from search_api.models.offices_held import OfficesHeld
+
+
+# Production proportions, per party.
+PARTIES_PER_CORPORATION = 5.3
+ENDED_PARTY_RATIO = 0.53
+MAILING_ADDRESS_RATIO = 0.71
+DELIVERY_ADDRESS_RATIO = 0.65
+MIDDLE_NAME_RATIO = 0.4
+NUMBERED_COMPANY_RATIO = 0.3
+
+FIRST_NAMES = [
+    'JOHN', 'DAVID', 'MICHAEL', 'ROBERT', 'JAMES', 'MARY', 'WILLIAM', 'RICHARD', 'JENNIFER', 'SUSAN', 'PETER',
+    'LINDA', 'PAUL', 'KAREN', 'BRIAN', 'THOMAS', 'PATRICIA', 'DANIEL', 'ELIZABETH', 'BARBARA', 'MARK', 'KEVIN',
+    'STEVEN', 'CHRISTOPHER', 'JASON', 'DONALD', 'NANCY', 'MARGARET', 'LISA', 'DOUGLAS', 'KENNETH', 'MICHELLE',
+    'ANDREW', 'GARY', 'HEATHER', 'SANDRA', 'CATHERINE', 'GORDON', 'WEI', 'JAGDEEP', 'HARPREET', 'MANDEEP', 'LI',
+    'MOHAMMED', 'ALEXANDRE', 'SIMON', 'TREVOR', 'CRAIG', 'SCOTT', 'GRAHAM', 'ABC', 'CADENCE',
+] + [nickname['name'] for nickname in NICKNAMES]
+
+LAST_NAMES = [
+    'SMITH', 'BROWN', 'TREMBLAY', 'MARTIN', 'ROY', 'WILSON', 'MACDONALD', 'GAGNON', 'JOHNSON', 'TAYLOR', 'LEE',
+    'CAMPBELL', 'ANDERSON', 'WONG', 'WHITE', 'THOMPSON', 'CHAN', 'WILLIAMS', 'JONES', 'MILLER', 'SINGH', 'LI',
+    'CHEN', 'YOUNG', 'SCOTT', 'STEWART', 'KING', 'MOORE', 'CLARK', 'BELL', 'GILL', 'SANDHU', 'GREWAL', 'WANG',
+    'ZHANG', 'LIU', 'NGUYEN', 'KIM', 'FRASER', 'ROSS', 'MURRAY', 'GRANT', 'HUGHES', 'PATTERSON', 'PATTISON',
+    'PATTEN', 'MADDEN', 'VAN DER MERWE', 'O\'BRIEN', 'MCGEE', 'MARSH', 'DUNLAP', 'KANE', 'BURTON', 'STEELE',
+]
+
+NAME_WORDS = [
+    'PACIFIC', 'COAST', 'NORTHERN', 'MOUNTAIN', 'VALLEY', 'ISLAND', 'WEST', 'CEDAR', 'RIVER', 'OCEAN', 'SUMMIT',
+    'GOLDEN', 'HARBOUR', 'LAKE', 'FRASER', 'OKANAGAN', 'COASTAL', 'EAGLE', 'MAPLE', 'ALPINE', 'CASCADE', 'ROYAL',
+    'ENERGY', 'HOLDINGS', 'CONSTRUCTION', 'CONSULTING', 'ENTERPRISES', 'INVESTMENTS', 'PROPERTIES', 'SERVICES',
+    'DEVELOPMENTS', 'TRADING', 'MINING', 'RESOURCES', 'LOGISTICS', 'TECHNOLOGIES', 'MANAGEMENT', 'FOODS',
+]
+
+NAME_SUFFIXES = ['LTD.', 'INC.', 'CORP.', 'LIMITED', 'INCORPORATED', 'ULC', 'CO.']
+
+# Each province's share of addresses, postal code prefixes and cities. Most are in BC.
+PROVINCES = [
+    ('BC', 0.78, 'V', [
+        'VANCOUVER', 'SURREY', 'BURNABY', 'RICHMOND', 'VICTORIA', 'KELOWNA', 'KAMLOOPS', 'NANAIMO', 'PRINCE GEORGE',
+        'ABBOTSFORD', 'COQUITLAM', 'CRESTON',
+    ]),
+    ('AB', 0.07, 'T', ['CALGARY', 'EDMONTON', 'RED DEER', 'LETHBRIDGE', 'BEISEKER']),
+    ('ON', 0.07, 'KLMN', ['TORONTO', 'OTTAWA', 'MISSISSAUGA', 'KITCHENER', 'KANATA', 'NEPEAN']),
+    ('QC', 0.03, 'GHJ', ['MONTREAL', 'QUEBEC', 'LAVAL', 'KIRKLAND', 'LA PRAIRIE', 'CHICOUTIMI']),
+    ('SK', 0.02, 'S', ['SASKATOON', 'REGINA']),
+    ('MB', 0.02, 'R', ['WINNIPEG', 'DAUPHIN']),
+    ('NS', 0.01, 'B', ['HALIFAX', 'DARTMOUTH']),
+]
+
+STREET_NAMES = [
+    'MAIN', 'OAK', 'PINE', 'MAPLE', 'CEDAR', 'GEORGIA', 'HASTINGS', 'GRANVILLE', 'KINGSWAY', 'BROADWAY',
+    'DOUGLAS', 'FORT', 'YATES', 'VICTORIA', 'MARINE', 'FRASER', 'KNIGHT', 'COMMERCIAL', 'NORTHVIEW', 'HOUDE',
+    '1ST', '2ND', '3RD', '4TH', '6', '83', '58A', '104', '152', '200',
+]
+
+STREET_TYPES = ['ST', 'AVE', 'RD', 'BLVD', 'DR', 'CRES', 'WAY', 'PL', 'HWY', 'RUE']
+
+CORP_STATES = [('ACT', 0.6), ('HIS', 0.4)]
+PARTY_TYPES = [('DIR', 0.85), ('FIO', 0.15)]
+OFFICER_TYPES = ['DIR', 'SEC', 'INC']
+FILING_TYPES = ['ANNBC', 'NOCAS', 'TILHO', 'COGS1']
+
+_EPOCH = datetime.date(1900, 1, 1)
+_TODAY = datetime.date(2020, 1, 1)
+_POSTAL_CHARACTERS = 'ABCEGHJKLMNPRSTVWXYZ'
+
+
+def _zipf_weights(count, exponent=1.0):
+    """Return cumulative Zipf weights for count items: the n'th is 1/n**exponent as likely as the first."""
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class _Choice:
+    """Choose from values with fixed cumulative weights, faster than random.choices() for one at a time."""
+
+    def __init__(self, rng, values, cum_weights):
+        """Choose from values, weighted by cum_weights."""
+        self.rng = rng
+        self.values = values
+        self.cum_weights = cum_weights
+        self.total = cum_weights[-1]
+
+    def __call__(self):
+        """Return a value."""
+        return self.values[bisect.bisect(self.cum_weights, self.rng.random() * self.total)]
+
+
+class _Loader:
+    """Buffer the rows for each table, and bulk-load them a batch at a time."""
+
+    def __init__(self, batch_size):
+        """Load each table's rows batch_size at a time."""
+        self.batch_size = batch_size
+        self.counts = {}
+        self._rows = {}
+        self._copy = db.engine.dialect.name == 'postgresql'
+
+    def add(self, model, **row):
+        """Add a row to model's table."""
+        rows = self._rows.setdefault(model.__table__, [])
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self._load(model.__table__, rows)
+            rows.clear()
+
+    def flush(self):
+        """Load every buffered row."""
+        for table, rows in self._rows.items():
+            if rows:
+                self._load(table, rows)
+                rows.clear()
+
+    def _load(self, table, rows):
+        self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+        if not self._copy:
+            db.session.execute(table.insert(), rows)
+            return
+
+        # COPY in the session's transaction, through the DB-API connection.
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['\\N' if row[column] is None else row[column] for column in columns])
+        buffer.seek(0)
+
+        cursor = db.session.connection().connection.cursor()
+        cursor.copy_expert(
+            "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')".format(table.name, ', '.join(columns)), buffer)
+        cursor.close()
+
+
+def _get_corp_prefix(corp_typ_cd):
+    """Return the prefix of the generated numbers of a type of corporation."""
+    return corp_typ_cd if len(corp_typ_cd) < 3 else 'C'
+
+
+class Generator:  # pylint: disable=too-many-instance-attributes
+    """Generate parties, their corporations, and everything related to them, with IDs after the existing ones."""
+
+    def __init__(self, loader, seed=0):
+        """Generate rows into loader, reproducibly for a given seed."""
+        self.loader = loader
+        self.rng = random.Random(seed)
+
+        self.first_name = _Choice(self.rng, FIRST_NAMES, _zipf_weights(len(FIRST_NAMES)))
+        self.last_name = _Choice(self.rng, LAST_NAMES, _zipf_weights(len(LAST_NAMES), 0.8))
+        self.name_word = _Choice(self.rng, NAME_WORDS, _zipf_weights(len(NAME_WORDS), 0.7))
+        self.street_name = _Choice(self.rng, STREET_NAMES, _zipf_weights(len(STREET_NAMES), 0.5))
+        self.province = _Choice(
+            self.rng, PROVINCES, list(itertools.accumulate(province[1] for province in PROVINCES)))
+        # Most corporations are BC companies.
+        corp_typ_cds = sorted(CORP_TYP_CDS, key=lambda corp_typ_cd: corp_typ_cd != 'BC')
+        self.corp_typ_cd = _Choice(self.rng, corp_typ_cds, _zipf_weights(len(corp_typ_cds), 2))
+
+        self.next_corp = self._get_max_corp() + 1
+        self.next_party_id = (db.session.query(func.max(CorpParty.corp_party_id)).scalar() or 0) + 1
+        self.next_addr_id = (db.session.query(func.max(Address.addr_id)).scalar() or 0) + 1
+        self.next_event_id = (db.session.query(func.max(Event.event_id)).scalar() or 0) + 1
+
+    def generate(self, parties):
+        """Generate parties parties, in corporations of about PARTIES_PER_CORPORATION each."""
+        while parties > 0:
+            count = min(parties, 1 + int(self.rng.expovariate(1 / (PARTIES_PER_CORPORATION - 1))))
+            self._add_corporation(count)
+            parties -= count
+        self.loader.flush()
+
+    def _weighted(self, choices):
+        value = self.rng.random()
+        for choice, weight in choices:
+            if value < weight:
+                return choice
+            value -= weight
+        return choices[-1][0]
+
+    def _date(self, start=_EPOCH):
+        # Skewed to recent dates, as most filings are.
+        days = (_TODAY - start).days
+        return _TODAY - datetime.timedelta(days=int(days * self.rng.random() ** 2))
+
+    def _add_event(self, corp_num, date, filing_typ_cd):
+        event_id = self.next_event_id
+        self.next_event_id += 1
+        self.loader.add(Event, event_id=event_id, corp_num=corp_num, event_type_cd='FILE', event_timestmp=date,
+                        trigger_dts=date)
+        self.loader.add(Filing, event_id=event_id, filing_typ_cd=filing_typ_cd, effective_dt=date)
+        return event_id
+
+    def _add_address(self):
+        addr_id = self.next_addr_id
+        self.next_addr_id += 1
+
+        province, _, prefixes, cities = self.province()
+        postal_cd = '{}{}{} {}{}{}'.format(
+            self.rng.choice(prefixes), self.rng.randint(0, 9), self.rng.choice(_POSTAL_CHARACTERS),
+            self.rng.randint(0, 9), self.rng.choice(_POSTAL_CHARACTERS), self.rng.randint(0, 9))
+        if self.rng.random() < 0.05:
+            addr_line_1 = 'PO BOX {}'.format(self.rng.randint(1, 9999))
+        else:
+            addr_line_1 = '{} {} {}'.format(
+                self.rng.randint(1, 20000), self.street_name(), self.rng.choice(STREET_TYPES))
+
+        self.loader.add(Address, addr_id=addr_id, province=province, country_typ_cd='CA', postal_cd=postal_cd,
+                        addr_line_1=addr_line_1, addr_line_2=None, addr_line_3=None, city=self.rng.choice(cities))
+        return addr_id
+
+    def _get_corp_nme(self, corp_num):
+        if corp_num.startswith('BC') and self.rng.random() < NUMBERED_COMPANY_RATIO:
+            return '{} B.C. LTD.'.format(corp_num[-7:])
+        words = [self.name_word() for _ in range(self.rng.randint(1, 3))]
+        return ' '.join(words + [self.rng.choice(NAME_SUFFIXES)])
+
+    @staticmethod
+    def _get_max_corp():
+        """Return the largest number of the existing corporation numbers in the generated format, or 0."""
+        numbers = [0]
+        for prefix in {_get_corp_prefix(corp_typ_cd) for corp_typ_cd in CORP_TYP_CDS}:
+            corp_num = db.session.query(func.max(Corporation.corp_num)).filter(
+                Corporation.corp_num.like(prefix + '%'), func.length(Corporation.corp_num) == len(prefix) + 7).scalar()
+            if corp_num and corp_num[len(prefix):].isdigit():
+                numbers.append(int(corp_num[len(prefix):]))
+        return max(numbers)
+
+    def _add_corporation(self, parties):
+        corp_typ_cd = self.corp_typ_cd()
+        corp_num = '{}{:07d}'.format(_get_corp_prefix(corp_typ_cd), self.next_corp)
+        self.next_corp += 1
+
+        recognition_dts = self._date()
+        start_event_id = self._add_event(corp_num, recognition_dts, FILING_TYPES[0])
+        corp_nme = self._get_corp_nme(corp_num)
+
+        self.loader.add(Corporation, corp_num=corp_num, corp_typ_cd=corp_typ_cd, recognition_dts=recognition_dts)
+        self.loader.add(CorpState, corp_num=corp_num, start_event_id=start_event_id, end_event_id=None,
+                        state_typ_cd=self._weighted(CORP_STATES))
+        self.loader.add(CorpName, corp_num=corp_num, corp_name_seq_num=0, corp_name_typ_cd='CO',
+                        start_event_id=start_event_id, end_event_id=None, srch_nme=corp_nme[:35], corp_nme=corp_nme)
+        self.loader.add(Office, corp_num=corp_num, office_typ_cd='RG', start_event_id=start_event_id,
+                        end_event_id=None, mailing_addr_id=self._add_address(), delivery_addr_id=self._add_address())
+
+        for _ in range(parties):
+            self._add_party(corp_num, recognition_dts)
+
+    def _add_party(self, corp_num, recognition_dts):
+        corp_party_id = self.next_party_id
+        self.next_party_id += 1
+
+        appointment_dt = self._date(recognition_dts)
+        start_event_id = self._add_event(corp_num, appointment_dt, self.rng.choice(FILING_TYPES))
+        end_event_id = cessation_dt = None
+        if self.rng.random() < ENDED_PARTY_RATIO:
+            cessation_dt = self._date(appointment_dt)
+            end_event_id = self._add_event(corp_num, cessation_dt, self.rng.choice(FILING_TYPES))
+
+        party_typ_cd = self._weighted(PARTY_TYPES)
+        self.loader.add(
+            CorpParty,
+            corp_party_id=corp_party_id,
+            mailing_addr_id=self._add_address() if self.rng.random() < MAILING_ADDRESS_RATIO else None,
+            delivery_addr_id=self._add_address() if self.rng.random() < DELIVERY_ADDRESS_RATIO else None,
+            corp_num=corp_num,
+            party_typ_cd=party_typ_cd,
+            start_event_id=start_event_id,
+            end_event_id=end_event_id,
+            appointment_dt=appointment_dt,
+            cessation_dt=cessation_dt,
+            first_nme=self.first_name(),
+            middle_nme=self.first_name() if self.rng.random() < MIDDLE_NAME_RATIO else None,
+            last_nme=self.last_name(),
+        )
+
+        officer_types = {'DIR'} if party_typ_cd == 'DIR' else {'INC'}
+        if self.rng.random() < 0.2:
+            officer_types.add(self.rng.choice(OFFICER_TYPES))
+        for officer_typ_cd in sorted(officer_types):
+            self.loader.add(OfficesHeld, corp_party_id=corp_party_id, officer_typ_cd=officer_typ_cd)
+
+
+def generate(scale, seed=0, batch_size=10000):
+    """Generate scale parties and everything related to them, returning the number of rows loaded per table."""
+    loader = _Loader(batch_size)
+    Generator(loader, seed).generate(scale)
+    # Index the names for the similar and phonetic searches, as refresh_search.py does for the real data.
+    NameGram.refresh()
+    NameKey.refresh()
+    db.session.commit()
+    return loader.counts
+
+
+def main(argv=None):
+    """Generate data from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10000, help='the number of parties to generate')
+    parser.add_argument('--seed', type=int, default=0, help='the random seed, for reproducible data')
+    parser.add_argument('--batch-size', type=int, default=10000, help='the rows to load at a time')
+    parser.add_argument('--database-url', help='the database to use, instead of DATABASE_URL')
+    parser.add_argument('--create', action='store_true', help='create the tables first')
+    parser.add_argument('--no-base', action='store_true', help="don't load the code tables and nicknames")
+    args = parser.parse_args(argv)
+
+    # local import, so the models can be imported without configuring an app
+    from search_api import create_app  # pylint: disable=import-outside-toplevel
+
+    app = create_app('development')
+    if args.database_url:
+        app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+
+    with app.app_context():
+        if args.create:
+            db.create_all()
+        if not args.no_base:
+            populate_base()
+            db.session.commit()
+
+        for table, count in sorted(generate(args.scale, args.seed, args.batch_size).items()):
+            print('{:<15} {:>10}'.format(table, count))
+
+
+if __name__ == '__main__':
+    main()
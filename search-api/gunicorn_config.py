@@ -17,9 +17,29 @@
 '''
 
 import os
+import shutil
+
+# Share the Prometheus metrics of the workers through files (see search_api/utils/metrics.py). It's set here, before
+# the workers import prometheus_client, so every way of starting gunicorn with this file gets it.
+os.environ.setdefault('prometheus_multiproc_dir', '/tmp/prometheus-metrics')
 
 workers = int(os.environ.get('GUNICORN_PROCESSES', '2'))  # pylint: disable=invalid-name
 threads = int(os.environ.get('GUNICORN_THREADS', '1'))  # pylint: disable=invalid-name
 
 forwarded_allow_ips = '*'  # pylint: disable=invalid-name
 secure_scheme_headers = {'X-Forwarded-Proto': 'https'}  # pylint: disable=invalid-name
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Start with no metrics files, so the metrics of workers from before a restart aren't counted."""
+    metrics_dir = os.environ['prometheus_multiproc_dir']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Remove a stopped worker's live gauges from the shared Prometheus metrics (see search_api/utils/metrics.py)."""
+    if 'prometheus_multiproc_dir' in os.environ:
+        from prometheus_client import multiprocess  # pylint: disable=import-outside-toplevel
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,261 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Replay a mix of API requests with many concurrent clients, and report how the API holds up.
+
+The requests are read from a JSONL file, one object per line, for example
+    {"path": "/api/v1/directors/", "params": {"field": "lastNme", "operator": "exact", "value": "Smith"}}
+    {"method": "GET", "path": "/api/v1/businesses/?query=energy"}
+    {"path": "/api/v1/directors/", "params": [["field", "firstNme"], ["value", "john"], ["field", "lastNme"], ...]}
+or from an access log (gunicorn's, or any other with a quoted "GET /path?query HTTP/1.1" request line).
+
+They are replayed in order, round and round, by --concurrency clients until --requests have been made or
+--duration seconds have passed. The report gives the throughput, latency percentiles, error rate (responses of
+500 and up, and failed connections) and time spent waiting for a database connection, per endpoint.
+
+Requests go to the app in this process, created with BenchmarkConfig so they need no token:
+    python loadtest.py searches.jsonl --concurrency 50 --duration 60 --gevent
+or to a server on localhost, run with FLASK_ENV=benchmark the way it runs in production:
+    FLASK_ENV=benchmark gunicorn -c gunicorn_config.py wsgi --worker-class=gevent --worker-connections=1000
+    python loadtest.py access.log --url http://localhost:8000 --concurrency 200 --requests 10000
+
+--gevent runs the clients as greenlets, with the standard library patched, as gunicorn's gevent workers do. The
+database connection wait can only be measured in-process. With SQLite, use a file, as each thread has its own
+in-memory database.
+"""
+
+import sys
+
+if __name__ == '__main__' and '--gevent' in sys.argv:
+    from gevent import monkey  # pylint: disable=import-error
+
+    monkey.patch_all()
+
+# pylint: disable=wrong-import-position
+import argparse  # noqa: E402
+from concurrent.futures import ThreadPoolExecutor  # noqa: E402
+import itertools  # noqa: E402
+import json  # noqa: E402
+import re  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+from urllib.parse import urlencode, urlsplit  # noqa: E402
+
+import requests  # noqa: E402
+from werkzeug.exceptions import HTTPException  # noqa: E402
+
+from search_api import create_app  # noqa: E402
+from search_api.utils.metrics import get_pool_wait  # noqa: E402
+from search_api.utils.utils import percentile  # noqa: E402
+
+
+_REQUEST_LINE = re.compile(r'"(GET|POST|PUT|DELETE) (/\S*) HTTP/[\d.]+"')
+
+
+def load_requests(lines):
+    """Return the (method, path) of each request in lines of JSONL or an access log. Other lines are skipped."""
+    replay = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith('{'):
+            request = json.loads(line)
+            path = request['path']
+            params = request.get('params')
+            if params:
+                # A list of [name, value] pairs, for repeated names, or an object.
+                params = [tuple(param) for param in params] if isinstance(params, list) else params
+                path += ('&' if '?' in path else '?') + urlencode(params, doseq=True)
+            replay.append((request.get('method', 'GET').upper(), path))
+            continue
+
+        match = _REQUEST_LINE.search(line)
+        if match:
+            replay.append(match.groups())
+    return replay
+
+
+class InProcessClient:
+    """Make requests to an app in this process, measuring the time spent waiting for database connections."""
+
+    def __init__(self, app):
+        """Make requests to app. Its engine's pool times each connection checkout (see metrics.instrument_pool)."""
+        self.app = app
+
+    def request(self, method, path):
+        """Make a request, returning its status code and the seconds spent waiting for database connections."""
+        pool_wait = get_pool_wait()
+        with self.app.test_client() as client:
+            response = client.open(path, method=method)
+            response.get_data()
+        return response.status_code, get_pool_wait() - pool_wait
+
+
+class HttpClient:
+    """Make requests to a server, keeping a connection open for each client."""
+
+    def __init__(self, url):
+        """Make requests to the server at url."""
+        self.url = url.rstrip('/')
+        self._local = threading.local()
+
+    def request(self, method, path):
+        """Make a request, returning its status code. The database connection wait isn't known."""
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        response = self._local.session.request(method, self.url + path)
+        return response.status_code, None
+
+
+class Results:
+    """Collect each request's latency, status and database connection wait, by endpoint."""
+
+    def __init__(self, app):
+        """Name each request's endpoint with app's URL rules."""
+        self._urls = app.url_map.bind('localhost')
+        self._lock = threading.Lock()
+        self.endpoints = {}
+
+    def get_endpoint(self, method, path):
+        """Return the name of the endpoint that serves a request, or its path if none does."""
+        path = urlsplit(path).path
+        try:
+            return self._urls.match(path, method)[0]
+        except HTTPException:
+            return path
+
+    def add(self, endpoint, latency, error, pool_wait):
+        """Record a request."""
+        with self._lock:
+            result = self.endpoints.setdefault(endpoint, {'latencies': [], 'errors': 0, 'pool_waits': []})
+            result['latencies'].append(latency)
+            result['errors'] += error
+            if pool_wait is not None:
+                result['pool_waits'].append(pool_wait)
+
+    def summarize(self, elapsed):
+        """Return the throughput, latency percentiles, error rate and connection wait for each endpoint, in ms."""
+        summary = {}
+        for endpoint, result in sorted(self.endpoints.items()):
+            latencies, pool_waits = result['latencies'], result['pool_waits']
+            summary[endpoint] = {
+                'requests': len(latencies),
+                'requests_per_sec': round(len(latencies) / elapsed, 1),
+                'error_rate': round(result['errors'] / len(latencies), 4),
+                'latency_ms': {
+                    'p{}'.format(p): round(percentile(latencies, p) * 1000, 1) for p in (50, 95, 99)
+                },
+                'pool_wait_ms': {
+                    'mean': round(sum(pool_waits) / len(pool_waits) * 1000, 1),
+                    'p95': round(percentile(pool_waits, 95) * 1000, 1),
+                } if pool_waits else None,
+            }
+        return summary
+
+
+def run(client, results, replay, concurrency, total_requests=None, duration=None, use_gevent=False):
+    """Replay requests with concurrency clients until total_requests are made or duration seconds pass.
+
+    Returns the seconds it took.
+    """
+    replay = itertools.cycle(replay)
+    if total_requests is not None:
+        replay = itertools.islice(replay, total_requests)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_request():
+        with lock:
+            if deadline and time.perf_counter() > deadline:
+                return None
+            return next(replay, None)
+
+    def client_loop():
+        request = next_request()
+        while request:
+            method, path = request
+            start = time.perf_counter()
+            try:
+                status, pool_wait = client.request(method, path)
+                error = status >= 500
+            except Exception:  # pylint: disable=broad-except
+                pool_wait, error = None, True
+            results.add(results.get_endpoint(method, path), time.perf_counter() - start, error, pool_wait)
+            request = next_request()
+
+    start = time.perf_counter()
+    if use_gevent:
+        import gevent  # pylint: disable=import-error, import-outside-toplevel
+
+        gevent.joinall([gevent.spawn(client_loop) for _ in range(concurrency)])
+    else:
+        with ThreadPoolExecutor(concurrency) as executor:
+            for future in [executor.submit(client_loop) for _ in range(concurrency)]:
+                future.result()
+    return time.perf_counter() - start
+
+
+def print_report(summary, elapsed):
+    """Print the summary as a table."""
+    total = sum(result['requests'] for result in summary.values())
+    print('{} requests in {:.1f}s: {:.1f}/s'.format(total, elapsed, total / elapsed if elapsed else 0))
+    print('{:<45} {:>8} {:>8} {:>7} {:>8} {:>8} {:>8} {:>10}'.format(
+        'endpoint', 'requests', 'req/s', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'pool wait'))
+    for endpoint, result in summary.items():
+        pool_wait = result['pool_wait_ms']
+        print('{:<45} {:>8} {:>8} {:>7.1%} {:>8} {:>8} {:>8} {:>10}'.format(
+            endpoint, result['requests'], result['requests_per_sec'], result['error_rate'],
+            result['latency_ms']['p50'], result['latency_ms']['p95'], result['latency_ms']['p99'],
+            pool_wait['p95'] if pool_wait else '-'))
+
+
+def main(argv=None):
+    """Run a load test from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file', help='the requests to replay: a JSONL file, or an access log')
+    parser.add_argument('--concurrency', type=int, default=10, help='the number of concurrent clients')
+    parser.add_argument('--requests', type=int, help='stop after this many requests')
+    parser.add_argument('--duration', type=float, help='stop after this many seconds')
+    parser.add_argument('--url', help='the server to send requests to, instead of the app in this process')
+    parser.add_argument('--database-url', help='in-process, the database to use, instead of DATABASE_URL')
+    parser.add_argument('--no-cache', action='store_true', help="in-process, don't cache search responses")
+    parser.add_argument('--gevent', action='store_true', help='run the clients as greenlets')
+    parser.add_argument('--output', help='save the results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    with open(args.file) as replay_file:
+        replay = load_requests(replay_file)
+    if not replay:
+        parser.error('no requests found in {}'.format(args.file))
+
+    app = create_app('benchmark')
+    if args.database_url:
+        app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    if args.no_cache:
+        app.config['SEARCH_CACHE_BACKEND'] = 'none'
+
+    client = HttpClient(args.url) if args.url else InProcessClient(app)
+    results = Results(app)
+    total_requests = args.requests if args.requests or args.duration else len(replay)
+    elapsed = run(client, results, replay, args.concurrency, total_requests, args.duration, args.gevent)
+
+    summary = results.summarize(elapsed)
+    print_report(summary, elapsed)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(
+                {'concurrency': args.concurrency, 'seconds': elapsed, 'endpoints': summary}, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
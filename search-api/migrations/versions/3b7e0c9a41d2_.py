@@ -0,0 +1,70 @@
+'''Add the corp_party_search table, a denormalized copy of the current directors
+
+Revision ID: 3b7e0c9a41d2
+Revises: 5d636cfe1a5e
+Create Date: 2020-05-04 16:12:08.274913
+
+'''
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e0c9a41d2'
+down_revision = '5d636cfe1a5e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('corp_party_search',
+    sa.Column('corp_party_id', sa.Integer(), nullable=False),
+    sa.Column('start_event_id', sa.Integer(), nullable=True),
+    sa.Column('corp_num', sa.String(length=10), nullable=True),
+    sa.Column('corp_typ_cd', sa.String(length=3), nullable=True),
+    sa.Column('recognition_dts', sa.Date(), nullable=True),
+    sa.Column('party_typ_cd', sa.String(length=3), nullable=True),
+    sa.Column('first_nme', sa.String(length=30), nullable=True),
+    sa.Column('middle_nme', sa.String(length=30), nullable=True),
+    sa.Column('last_nme', sa.String(length=30), nullable=True),
+    sa.Column('appointment_dt', sa.Date(), nullable=True),
+    sa.Column('cessation_dt', sa.Date(), nullable=True),
+    sa.Column('corp_nme', sa.String(length=150), nullable=True),
+    sa.Column('state_typ_cd', sa.String(length=3), nullable=True),
+    sa.Column('addr_line_1', sa.String(length=50), nullable=True),
+    sa.Column('addr_line_2', sa.String(length=50), nullable=True),
+    sa.Column('addr_line_3', sa.String(length=50), nullable=True),
+    sa.Column('city', sa.String(length=40), nullable=True),
+    sa.Column('province', sa.String(length=2), nullable=True),
+    sa.Column('postal_cd', sa.String(length=15), nullable=True),
+    sa.Column('upper_first_nme', sa.String(length=30), nullable=True),
+    sa.Column('upper_middle_nme', sa.String(length=30), nullable=True),
+    sa.Column('upper_last_nme', sa.String(length=30), nullable=True),
+    sa.Column('upper_corp_nme', sa.String(length=150), nullable=True),
+    sa.Column('upper_addr', sa.String(length=156), nullable=True),
+    sa.Column('upper_postal_cd', sa.String(length=15), nullable=True),
+    sa.PrimaryKeyConstraint('corp_party_id')
+    )
+    op.create_index(op.f('ix_corp_party_search_corp_num'), 'corp_party_search', ['corp_num'], unique=False)
+    op.create_index(op.f('ix_corp_party_search_upper_first_nme'), 'corp_party_search', ['upper_first_nme'], unique=False)
+    op.create_index(op.f('ix_corp_party_search_upper_middle_nme'), 'corp_party_search', ['upper_middle_nme'], unique=False)
+    op.create_index(op.f('ix_corp_party_search_upper_last_nme'), 'corp_party_search', ['upper_last_nme'], unique=False)
+    op.create_index(op.f('ix_corp_party_search_upper_corp_nme'), 'corp_party_search', ['upper_corp_nme'], unique=False)
+    op.create_index(op.f('ix_corp_party_search_upper_postal_cd'), 'corp_party_search', ['upper_postal_cd'], unique=False)
+    op.create_table('corp_party_search_refresh',
+    sa.Column('refresh_id', sa.Integer(), nullable=False),
+    sa.Column('last_event_id', sa.Integer(), nullable=True),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('refresh_id')
+    )
+
+
+def downgrade():
+    op.drop_table('corp_party_search_refresh')
+    op.drop_index(op.f('ix_corp_party_search_upper_postal_cd'), table_name='corp_party_search')
+    op.drop_index(op.f('ix_corp_party_search_upper_corp_nme'), table_name='corp_party_search')
+    op.drop_index(op.f('ix_corp_party_search_upper_last_nme'), table_name='corp_party_search')
+    op.drop_index(op.f('ix_corp_party_search_upper_middle_nme'), table_name='corp_party_search')
+    op.drop_index(op.f('ix_corp_party_search_upper_first_nme'), table_name='corp_party_search')
+    op.drop_index(op.f('ix_corp_party_search_corp_num'), table_name='corp_party_search')
+    op.drop_table('corp_party_search')
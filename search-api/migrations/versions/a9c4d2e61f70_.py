@@ -0,0 +1,54 @@
+'''Add indexes for the search: on the upper-cased names, the normalized postal code and the join keys
+
+The search filters and sorts on upper(column), so these are expression indexes. The name indexes use
+text_pattern_ops, so startswith (LIKE 'X%') can use them as well as exact, and are partial, of the current rows
+(with no end_event_id) that the search considers.
+
+Revision ID: a9c4d2e61f70
+Revises: 3b7e0c9a41d2
+Create Date: 2020-05-06 10:41:27.518302
+
+'''
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c4d2e61f70'
+down_revision = '3b7e0c9a41d2'
+branch_labels = None
+depends_on = None
+
+CURRENT = sa.text('end_event_id IS NULL')
+
+
+def upgrade():
+    op.create_index('ix_corp_party_upper_last_nme', 'corp_party',
+                    [sa.text('upper(last_nme) text_pattern_ops')], postgresql_where=CURRENT)
+    op.create_index('ix_corp_party_upper_first_nme', 'corp_party',
+                    [sa.text('upper(first_nme) text_pattern_ops')], postgresql_where=CURRENT)
+    op.create_index('ix_corp_party_upper_middle_nme', 'corp_party',
+                    [sa.text('upper(middle_nme) text_pattern_ops')], postgresql_where=CURRENT)
+    op.create_index('ix_corp_party_upper_last_nme_sort', 'corp_party',
+                    [sa.text('upper(last_nme)'), 'corp_num'], postgresql_where=CURRENT)
+    op.create_index('ix_corp_name_upper_corp_nme', 'corp_name',
+                    [sa.text('upper(corp_nme) text_pattern_ops')], postgresql_where=CURRENT)
+    op.create_index('ix_address_normalized_postal_cd', 'address', [sa.text("replace(upper(postal_cd), ' ', '')")])
+    op.create_index('ix_corp_party_corp_num_end_event_id', 'corp_party', ['corp_num', 'end_event_id'])
+    op.create_index('ix_corp_state_corp_num_end_event_id', 'corp_state', ['corp_num', 'end_event_id'])
+    op.create_index('ix_corp_name_corp_num_end_event_id', 'corp_name',
+                    ['corp_num', 'end_event_id', 'corp_name_typ_cd'])
+    op.create_index('ix_office_corp_num_end_event_id', 'office', ['corp_num', 'end_event_id'])
+
+
+def downgrade():
+    op.drop_index('ix_office_corp_num_end_event_id', table_name='office')
+    op.drop_index('ix_corp_name_corp_num_end_event_id', table_name='corp_name')
+    op.drop_index('ix_corp_state_corp_num_end_event_id', table_name='corp_state')
+    op.drop_index('ix_corp_party_corp_num_end_event_id', table_name='corp_party')
+    op.drop_index('ix_address_normalized_postal_cd', table_name='address')
+    op.drop_index('ix_corp_name_upper_corp_nme', table_name='corp_name')
+    op.drop_index('ix_corp_party_upper_last_nme_sort', table_name='corp_party')
+    op.drop_index('ix_corp_party_upper_middle_nme', table_name='corp_party')
+    op.drop_index('ix_corp_party_upper_first_nme', table_name='corp_party')
+    op.drop_index('ix_corp_party_upper_last_nme', table_name='corp_party')
@@ -0,0 +1,38 @@
+'''Add the name_key table, the phonetic keys of the parties' names, and copies of the keys on corp_party_search
+
+Revision ID: b5e81d3f2a67
+Revises: e7a3c5d90b42
+Create Date: 2020-05-13 10:02:17.518302
+
+'''
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e81d3f2a67'
+down_revision = 'e7a3c5d90b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('name_key',
+    sa.Column('name', sa.String(length=30), nullable=False),
+    sa.Column('soundex', sa.String(length=4), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_index(op.f('ix_name_key_soundex'), 'name_key', ['soundex'], unique=False)
+    op.add_column('corp_party_search', sa.Column('first_nme_key', sa.String(length=4), nullable=True))
+    op.add_column('corp_party_search', sa.Column('last_nme_key', sa.String(length=4), nullable=True))
+    op.create_index(op.f('ix_corp_party_search_first_nme_key'), 'corp_party_search', ['first_nme_key'], unique=False)
+    op.create_index(op.f('ix_corp_party_search_last_nme_key'), 'corp_party_search', ['last_nme_key'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_corp_party_search_last_nme_key'), table_name='corp_party_search')
+    op.drop_index(op.f('ix_corp_party_search_first_nme_key'), table_name='corp_party_search')
+    op.drop_column('corp_party_search', 'last_nme_key')
+    op.drop_column('corp_party_search', 'first_nme_key')
+    op.drop_index(op.f('ix_name_key_soundex'), table_name='name_key')
+    op.drop_table('name_key')
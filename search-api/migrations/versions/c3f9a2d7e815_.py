@@ -0,0 +1,29 @@
+'''Key corp_name by its corporation and name sequence number, as the source table is, so a corporation can have
+several names
+
+Revision ID: c3f9a2d7e815
+Revises: b5e81d3f2a67
+Create Date: 2020-05-20 09:41:52.207316
+
+'''
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f9a2d7e815'
+down_revision = 'b5e81d3f2a67'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_constraint('corp_name_pkey', 'corp_name', type_='primary')
+    op.alter_column('corp_name', 'corp_name_seq_num', existing_type=sa.Integer(), nullable=False)
+    op.create_primary_key('corp_name_pkey', 'corp_name', ['corp_num', 'corp_name_seq_num'])
+
+
+def downgrade():
+    op.drop_constraint('corp_name_pkey', 'corp_name', type_='primary')
+    op.alter_column('corp_name', 'corp_name_seq_num', existing_type=sa.Integer(), nullable=True)
+    op.create_primary_key('corp_name_pkey', 'corp_name', ['corp_num'])
@@ -0,0 +1,52 @@
+'''Add pg_trgm (trigram) indexes for the contains, endswith and text searches
+
+The search filters with upper(column) LIKE '%X%', which a btree index can't serve. A GIN index of the same
+expression with gin_trgm_ops can, for values of 3 or more characters, so substring searches no longer scan the
+table. The name indexes are partial, of the current rows (with no end_event_id) that the search considers. Only
+address lines 1 and 2 are indexed, as those are what the address search looks in.
+
+Revision ID: d4b1f7e2c386
+Revises: a9c4d2e61f70
+Create Date: 2020-05-08 14:03:52.906417
+
+'''
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b1f7e2c386'
+down_revision = 'a9c4d2e61f70'
+branch_labels = None
+depends_on = None
+
+CURRENT = sa.text('end_event_id IS NULL')
+
+# (index, table, indexed expression, whether it's partial)
+INDEXES = [
+    ('ix_corp_party_upper_last_nme_trgm', 'corp_party', 'upper(last_nme)', True),
+    ('ix_corp_party_upper_first_nme_trgm', 'corp_party', 'upper(first_nme)', True),
+    ('ix_corp_party_upper_middle_nme_trgm', 'corp_party', 'upper(middle_nme)', True),
+    ('ix_corp_name_upper_corp_nme_trgm', 'corp_name', 'upper(corp_nme)', True),
+    ('ix_address_upper_addr_line_1_trgm', 'address', 'upper(addr_line_1)', False),
+    ('ix_address_upper_addr_line_2_trgm', 'address', 'upper(addr_line_2)', False),
+    # corp_party_search holds the current parties only, already upper-cased.
+    ('ix_corp_party_search_upper_last_nme_trgm', 'corp_party_search', 'upper_last_nme', False),
+    ('ix_corp_party_search_upper_first_nme_trgm', 'corp_party_search', 'upper_first_nme', False),
+    ('ix_corp_party_search_upper_middle_nme_trgm', 'corp_party_search', 'upper_middle_nme', False),
+    ('ix_corp_party_search_upper_corp_nme_trgm', 'corp_party_search', 'upper_corp_nme', False),
+    ('ix_corp_party_search_upper_addr_trgm', 'corp_party_search', 'upper_addr', False),
+]
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, expression, partial in INDEXES:
+        op.create_index(name, table, [sa.text(expression + ' gin_trgm_ops')], postgresql_using='gin',
+                        postgresql_where=CURRENT if partial else None)
+
+
+def downgrade():
+    # The pg_trgm extension is left installed, as other database objects may use it.
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,28 @@
+'''Add the name_gram table, the names of the parties by their bigrams, for the similar search
+
+Revision ID: e7a3c5d90b42
+Revises: d4b1f7e2c386
+Create Date: 2020-05-11 11:26:44.731058
+
+'''
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c5d90b42'
+down_revision = 'd4b1f7e2c386'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('name_gram',
+    sa.Column('gram', sa.String(length=2), nullable=False),
+    sa.Column('name', sa.String(length=30), nullable=False),
+    sa.PrimaryKeyConstraint('gram', 'name')
+    )
+
+
+def downgrade():
+    op.drop_table('name_gram')
@@ -0,0 +1,71 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Refresh the corp_party_search table, the denormalized copy of the current directors the search can use.
+
+Only the corporations with an event since the last refresh are reloaded, so it's quick to run after each load of
+the data. The first run, or a run with --full, rebuilds the whole table. See DIRECTOR_SEARCH_DENORMALIZED.
+
+It first adds any new names to the name_gram table, which the similar search finds similar names in, and to the
+name_key table, which has their phonetic keys. The table copies the keys of its names from name_key, and rows loaded
+before their names had keys are backfilled with them.
+
+    python refresh_search.py
+    python refresh_search.py --full --database-url postgresql://postgres@localhost/search
+"""
+
+import argparse
+
+from search_api.models.base import db
+from search_api.models.corp_party_search import REFRESH_BATCH_SIZE, CorpPartySearch
+from search_api.models.name_gram import NameGram
+from search_api.models.name_key import NameKey
+
+
+def main(argv=None):
+    """Refresh the table from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true', help='rebuild the whole table')
+    parser.add_argument(
+        '--batch-size', type=int, default=REFRESH_BATCH_SIZE, help='the corporations to reload at a time')
+    parser.add_argument('--database-url', help='the database to use, instead of DATABASE_URL')
+    parser.add_argument('--create', action='store_true', help='create the tables first')
+    args = parser.parse_args(argv)
+
+    # local import, so the models can be imported without configuring an app
+    from search_api import create_app  # pylint: disable=import-outside-toplevel
+
+    app = create_app()
+    if args.database_url:
+        app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+
+    with app.app_context():
+        if args.create:
+            db.create_all()
+
+        names = NameGram.refresh()
+        keys = NameKey.refresh()
+        result = CorpPartySearch.refresh(args.full, args.batch_size)
+        db.session.commit()
+
+    if result['full']:
+        print('Rebuilt corp_party_search: {rows} rows, up to event {last_event_id}.'.format(**result))
+    else:
+        print('Refreshed corp_party_search: {rows} rows of {corporations} corporations, up to event '
+              '{last_event_id}.'.format(**result))
+    print('Indexed {} new names for the similar search.'.format(names))
+    print('Added the phonetic keys of {} new names, and filled in {} rows\' missing keys.'.format(keys, result['keys']))
+
+
+if __name__ == '__main__':
+    main()
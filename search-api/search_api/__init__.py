@@ -30,6 +30,7 @@ from search_api.config import _Config, CONFIGURATION
 from search_api.auth import jwt
 from search_api.resources import DIRECTORS_API, BUSINESSES_API, OPS_API, AUTH_API
 from search_api.models.base import db
+from search_api.utils import metrics, query_timing
 from search_api.utils.util_logging import setup_logging
 
 load_dotenv(verbose=True)
@@ -57,6 +58,7 @@ def create_app(run_mode=os.getenv('FLASK_ENV', 'production')):
     """Return a configured Flask App using the Factory method."""
     app = Flask(__name__)
     app.config.from_object(CONFIGURATION[run_mode])
+    app.config['RUN_MODE'] = run_mode  # So processes started by the app (export jobs) can create one like it.
     app.logger.setLevel(logging.INFO)  # pylint: disable=no-member
 
     db.init_app(app)
@@ -78,6 +80,8 @@ def create_app(run_mode=os.getenv('FLASK_ENV', 'production')):
     app.register_blueprint(OPS_API)
     app.register_blueprint(AUTH_API)
     app.after_request(convert_to_camel)
+    query_timing.init_app(app)
+    metrics.init_app(app)
 
     if not app.config.get('BENCHMARK', None):
         setup_jwt_manager(app, jwt)
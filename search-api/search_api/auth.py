@@ -13,14 +13,34 @@
 # limitations under the License.
 """Authorization service for the Search API."""
 
+import hashlib
 import json
+import time
 
-from flask import current_app
+from flask import current_app, g
 from flask_jwt_oidc import JwtManager
 import requests
+from requests.adapters import HTTPAdapter
 
+from search_api.utils.cache import SingleFlight, TTLCache
+from search_api.utils.metrics import AUTH_API_LATENCY, count_cache_lookup
 
-jwt = JwtManager()  # pylint: disable=invalid-name
+
+class _JwtManager(JwtManager):
+    """A JwtManager that accepts every request, as user 'benchmark', when the app is configured with BENCHMARK.
+
+    So load tests (loadtest.py) can call the API without tokens. BENCHMARK is only set by BenchmarkConfig.
+    """
+
+    def _require_auth_validation(self, *args, **kwargs):
+        if current_app.config.get('BENCHMARK'):
+            g.jwt_oidc_token_info = {'sub': 'benchmark'}
+            return
+        super()._require_auth_validation(*args, **kwargs)
+
+
+jwt = _JwtManager()  # pylint: disable=invalid-name
+_AUTH_API_CALLS = SingleFlight()
 
 
 def authorized(jwt_instance, account_id):
@@ -28,6 +48,9 @@ def authorized(jwt_instance, account_id):
     Assert that the user is authorized to access Director Search.
 
     The user should have an orgMembership in the Director Search (DIR_SEARCH) application.
+
+    The answer is cached per (token, account), for AUTH_CACHE_TTL seconds if the user is authorized, or
+    AUTH_CACHE_NEGATIVE_TTL seconds if not, and never beyond the token's expiry.
     """
     # When running tests, just mock out this entire user membership authorization check as it requires
     # an external service.
@@ -39,19 +62,86 @@ def authorized(jwt_instance, account_id):
         return False
 
     token = jwt_instance.get_token_auth_header()
+
+    cache = _get_auth_cache()
+    cache_key = (hashlib.sha256(token.encode('utf-8')).hexdigest(), account_id)
+    is_authorized = cache.get(cache_key)
+    count_cache_lookup('auth', is_authorized is not None)
+    if is_authorized is not None:
+        return is_authorized
+
+    # Concurrent requests with the same token and account (e.g. several tabs, or the UI's parallel requests)
+    # share a single call to the auth api.
+    return _AUTH_API_CALLS.do(cache_key, _check_and_cache_authorization, cache, cache_key, token, account_id)
+
+
+def _check_and_cache_authorization(cache, cache_key, token, account_id):
+    is_authorized, cacheable = _check_authorization(token, account_id)
+    if cacheable:
+        cache.set(cache_key, is_authorized, ttl=_get_cache_ttl(is_authorized))
+
+    return is_authorized
+
+
+def _check_authorization(token, account_id):
+    """Ask the auth api whether the user is authorized, returning whether they are and if the answer can be cached."""
     auth_api_url_base = current_app.config['AUTH_API_URL']
     auth_api_url = '{auth_api_url_base}/api/v1/accounts/{account_id}/products/DIR_SEARCH/authorizations'.format(
         auth_api_url_base=auth_api_url_base, account_id=account_id)
 
     headers = {'Authorization': 'Bearer {token}'.format(token=token)}
-    response = requests.get(auth_api_url, headers=headers)
+    timeout = current_app.config.get('AUTH_API_TIMEOUT', 5)
+    try:
+        with AUTH_API_LATENCY.time():
+            response = _get_auth_api_session().get(auth_api_url, headers=headers, timeout=timeout)
+    except requests.exceptions.Timeout:
+        # An outage: refuse, as for a 5xx response, without remembering it.
+        current_app.logger.warning('The auth api did not answer within %s seconds', timeout)
+        return False, False
 
     try:
         response_json = response.json()
     except json.decoder.JSONDecodeError:
         raise Exception('Invalid JSON in auth rsp: `{}`'.format(response.text))
 
+    # Don't remember a refusal caused by an auth api outage.
+    cacheable = response.status_code < 500
+
     if 'orgMembership' in response_json:
-        return True
+        return True, cacheable
+
+    return False, cacheable
+
+
+def _get_cache_ttl(is_authorized):
+    if is_authorized:
+        ttl = current_app.config.get('AUTH_CACHE_TTL', 300)
+    else:
+        ttl = current_app.config.get('AUTH_CACHE_NEGATIVE_TTL', 30)
+
+    # Never trust the answer for longer than the token is valid.
+    expires_at = getattr(g, 'jwt_oidc_token_info', {}).get('exp')
+    if expires_at:
+        ttl = min(ttl, expires_at - time.time())
+
+    return ttl
+
+
+def _get_auth_cache():
+    if 'auth_cache' not in current_app.extensions:
+        current_app.extensions['auth_cache'] = TTLCache(
+            current_app.config.get('AUTH_CACHE_SIZE', 10000),
+            current_app.config.get('AUTH_CACHE_TTL', 300),
+        )
+    return current_app.extensions['auth_cache']
+
 
-    return False
+def _get_auth_api_session():
+    """Return a requests Session that keeps a pool of connections to the auth api alive between requests."""
+    if 'auth_api_session' not in current_app.extensions:
+        pool_size = current_app.config.get('AUTH_API_POOL_SIZE', 10)
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        current_app.extensions['auth_api_session'] = session
+    return current_app.extensions['auth_api_session']
@@ -63,6 +63,10 @@ class _Config:  # pylint: disable=too-few-public-methods
 
     SECRET_KEY = 'a secret'
 
+    # Signs search pagination cursors. This must be the same for every worker, so that a cursor issued by one
+    # worker is accepted by the others. Falls back to SECRET_KEY.
+    CURSOR_SECRET_KEY = os.getenv('CURSOR_SECRET_KEY', None)
+
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
     SENTRY_DSN = os.getenv('SENTRY_DSN', '')
@@ -98,6 +102,65 @@ class _Config:  # pylint: disable=too-few-public-methods
         JWT_OIDC_JWKS_CACHE_TIMEOUT = 300
 
     AUTH_API_URL = os.getenv('AUTH_API_URL')
+    AUTH_API_POOL_SIZE = int(os.getenv('AUTH_API_POOL_SIZE', '10'))
+    # Seconds to wait for the auth api to connect, and then to answer. A check that times out is refused.
+    AUTH_API_TIMEOUT = float(os.getenv('AUTH_API_TIMEOUT', '5'))
+
+    # Authorization checks against the auth api are cached per token and account. Refusals are cached for less
+    # time, and nothing is cached beyond the token's expiry.
+    AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', '300'))
+    AUTH_CACHE_NEGATIVE_TTL = int(os.getenv('AUTH_CACHE_NEGATIVE_TTL', '30'))
+    AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', '10000'))
+
+    # Nicknames are cached in memory by each process, and reloaded after this many seconds (0 to never reload).
+    # POST /ops/nicknames/refresh, with the OPS_ROLE (constants.py), reloads them immediately.
+    NICKNAME_REFRESH_INTERVAL = int(os.getenv('NICKNAME_REFRESH_INTERVAL', '3600'))
+
+    # The refreshes through /ops touch a stamp in REFRESH_STAMP_DIR, and the other workers reload their copies when
+    # they see it. Put it on a volume shared by the pods to refresh every pod.
+    REFRESH_STAMP_DIR = os.getenv('REFRESH_STAMP_DIR', '/tmp/refresh-stamps')
+
+    # The code tables (party, officer and filing types, and corporation op states) are cached the same way.
+    # POST /ops/reference-data/refresh, with the OPS_ROLE, reloads them immediately.
+    REFERENCE_DATA_REFRESH_INTERVAL = int(os.getenv('REFERENCE_DATA_REFRESH_INTERVAL', '3600'))
+
+    # Search result counts (the /count/ endpoints). Counting stops after SEARCH_COUNT_BUDGET rows, and larger
+    # counts are estimated instead. Set the budget to 0 to always count exactly.
+    SEARCH_COUNT_BUDGET = int(os.getenv('SEARCH_COUNT_BUDGET', '10000'))
+    SEARCH_COUNT_CACHE_SIZE = int(os.getenv('SEARCH_COUNT_CACHE_SIZE', '1000'))
+    SEARCH_COUNT_CACHE_TTL = int(os.getenv('SEARCH_COUNT_CACHE_TTL', '300'))
+
+    # Search the corp_party_search table, a denormalized copy of the current directors, instead of joining the
+    # tables it's built from. Keep it up to date by running refresh_search.py after each load of the data.
+    DIRECTOR_SEARCH_DENORMALIZED = os.getenv('DIRECTOR_SEARCH_DENORMALIZED', 'False').lower() == 'true'
+
+    # The names similar to each search value (the 'similar' operator) are cached for this many seconds. They're
+    # found in the name_gram table, which refresh_search.py keeps up to date.
+    SIMILAR_NAMES_CACHE_TTL = int(os.getenv('SIMILAR_NAMES_CACHE_TTL', '300'))
+
+    # Search responses are cached by their canonical search arguments. SEARCH_CACHE_BACKEND is 'memory' (per
+    # process), 'filesystem' (in SEARCH_CACHE_DIR, shared by the workers on a host), 'redis' (at
+    # SEARCH_CACHE_REDIS_URL, shared by every worker) or 'none'.
+    SEARCH_CACHE_BACKEND = os.getenv('SEARCH_CACHE_BACKEND', 'memory')
+    SEARCH_CACHE_DIR = os.getenv('SEARCH_CACHE_DIR', '/tmp/search-cache')
+    SEARCH_CACHE_REDIS_URL = os.getenv('SEARCH_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '1000'))
+    SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '60'))
+
+    # Export jobs (POST /api/v1/directors/export/jobs/) run on EXPORT_JOB_WORKERS processes per worker, and write
+    # their files to EXPORT_JOB_DIR, fetching EXPORT_JOB_PAGE_SIZE rows at a time. A job that isn't updated for
+    # EXPORT_JOB_STALE_AFTER seconds is reported as failed, and jobs are deleted after EXPORT_JOB_TTL seconds.
+    EXPORT_JOB_DIR = os.getenv('EXPORT_JOB_DIR', '/tmp/export-jobs')
+    EXPORT_JOB_WORKERS = int(os.getenv('EXPORT_JOB_WORKERS', '2'))
+    EXPORT_JOB_ACCOUNT_LIMIT = int(os.getenv('EXPORT_JOB_ACCOUNT_LIMIT', '2'))
+    EXPORT_JOB_PAGE_SIZE = int(os.getenv('EXPORT_JOB_PAGE_SIZE', '1000'))
+    EXPORT_JOB_STALE_AFTER = int(os.getenv('EXPORT_JOB_STALE_AFTER', '900'))
+    EXPORT_JOB_TTL = int(os.getenv('EXPORT_JOB_TTL', '86400'))
+
+    # The SQL statements of this fraction of requests are timed, and reported in their Server-Timing header and
+    # log. Any statement slower than QUERY_TIMING_SLOW_MS is logged.
+    QUERY_TIMING_SAMPLE_RATE = float(os.getenv('QUERY_TIMING_SAMPLE_RATE', '1.0'))
+    QUERY_TIMING_SLOW_MS = int(os.getenv('QUERY_TIMING_SLOW_MS', '1000'))
 
     TESTING = False
     DEBUG = False
@@ -118,6 +181,9 @@ class TestConfig(_Config):  # pylint: disable=too-few-public-methods
 
     SQLALCHEMY_DATABASE_URI = 'sqlite://'
 
+    # The in-memory database can't be shared with other processes, so export jobs run as they're submitted.
+    EXPORT_JOB_WORKERS = 0
+
     # JWT OIDC settings
     # JWT_OIDC_TEST_MODE will set jwt_manager to use
     JWT_OIDC_TEST_MODE = True
@@ -190,6 +256,6 @@ class ProdConfig(_Config):  # pylint: disable=too-few-public-methods
 
 
 class BenchmarkConfig(DevConfig):  # pylint: disable=too-few-public-methods
-    """Config for running benchmarks (benchmark.py)."""
+    """Config for running benchmarks (benchmark.py) and load tests (loadtest.py). Requests need no token."""
 
     BENCHMARK = True
@@ -18,3 +18,6 @@ STATE_TYP_CD_HIS = 'HIS'
 
 ADDITIONAL_COLS_ADDRESS = 'addr'
 ADDITIONAL_COLS_ACTIVE = 'active'
+
+# The role that may call the /ops endpoints that change the service's state.
+OPS_ROLE = 'system'
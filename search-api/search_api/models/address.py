@@ -13,9 +13,11 @@
 # limitations under the License.
 """This model manages an Address entity."""
 
-from functools import reduce
-
 from search_api.models.base import BaseModel, db
+from search_api.utils.model_utils import _get_trigram_index, _normalize_postal_cd
+
+
+IN_CLAUSE_LIMIT = 1000
 
 
 class Address(BaseModel):
@@ -78,6 +80,14 @@ class Address(BaseModel):
     route_service_no = db.Column(db.String(4))
     province_state_name = db.Column(db.String(30))
 
+    # The postal code search compares postal codes without spaces, except on Oracle.
+    __table_args__ = (
+        db.Index('ix_address_normalized_postal_cd', _normalize_postal_cd(postal_cd)),
+        # The address search looks in lines 1 and 2.
+        _get_trigram_index('ix_address_upper_addr_line_1_trgm', addr_line_1),
+        _get_trigram_index('ix_address_upper_addr_line_2_trgm', addr_line_2),
+    )
+
     @staticmethod
     def get_address_by_id(address_id):
         """Get an Address by id."""
@@ -97,13 +107,31 @@ class Address(BaseModel):
         if not address_id:
             return ''
 
-        address = Address.get_address_by_id(address_id)
+        return Address.normalize_addrs([address_id])[address_id]
+
+    @staticmethod
+    def normalize_addrs(address_ids):
+        """Normalize many Addresses at once, as a dict of addr_id to the format normalize_addr() returns.
+
+        The addresses are fetched in one query per IN_CLAUSE_LIMIT ids, rather than one query per address. Ids
+        that are empty, or don't match an Address, map to ''.
+        """
+        address_ids = list({address_id for address_id in address_ids if address_id})
+        normalized = {address_id: '' for address_id in address_ids}
+
+        # Oracle allows at most 1000 expressions in an IN list.
+        for i in range(0, len(address_ids), IN_CLAUSE_LIMIT):
+            rows = db.session.query(
+                Address.addr_id,
+                Address.addr_line_1,
+                Address.addr_line_2,
+                Address.addr_line_3,
+                Address.city,
+                Address.province,
+                Address.country_typ_cd,
+            ).filter(Address.addr_id.in_(address_ids[i:i + IN_CLAUSE_LIMIT]))
 
-        def address_reducer(accumulator, address_field):
-            if address_field:
-                return ((accumulator or '') + ', ' if accumulator else '') + (address_field or '')
-            return accumulator or ''
+            for row in rows:
+                normalized[row.addr_id] = ', '.join(field for field in row[1:] if field)
 
-        return reduce(
-            address_reducer, [address.addr_line_1, address.addr_line_2, address.addr_line_3,
-                              address.city, address.province, address.country_typ_cd])
+        return normalized
@@ -19,6 +19,8 @@ from decimal import Decimal
 import flask.json
 from flask_sqlalchemy import SQLAlchemy
 
+from search_api.utils.metrics import instrument_pool
+
 
 class MyJSONEncoder(flask.json.JSONEncoder):
     """This class extends the default Flask JSON encoder."""
@@ -31,8 +33,18 @@ class MyJSONEncoder(flask.json.JSONEncoder):
         return super(MyJSONEncoder, self).default(o)
 
 
+class _SQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy, with the connection pools of its engines timed for /ops/metrics."""
+
+    def create_engine(self, sa_url, engine_opts):
+        """Create an engine, and time its pool from its first connection."""
+        engine = super().create_engine(sa_url, engine_opts)
+        instrument_pool(engine.pool)
+        return engine
+
+
 flask.json_encoder = MyJSONEncoder
-db = SQLAlchemy()  # pylint: disable=invalid-name
+db = _SQLAlchemy()  # pylint: disable=invalid-name
 
 
 class BaseModel(db.Model):
@@ -16,6 +16,7 @@
 from sqlalchemy import desc
 
 from search_api.models.base import BaseModel, db
+from search_api.utils.model_utils import _get_trigram_index, _get_upper_index
 
 
 class CorpName(BaseModel):
@@ -34,7 +35,7 @@ class CorpName(BaseModel):
     __tablename__ = 'corp_name'
 
     corp_num = db.Column(db.String(10), primary_key=True)
-    corp_name_seq_num = db.Column(db.Integer)
+    corp_name_seq_num = db.Column(db.Integer, primary_key=True)
     corp_name_typ_cd = db.Column(db.String(2))
     start_event_id = db.Column(db.Integer)
     end_event_id = db.Column(db.Integer)
@@ -42,6 +43,12 @@ class CorpName(BaseModel):
     corp_nme = db.Column(db.String(150))
     dd_corp_num = db.Column(db.String(10))
 
+    __table_args__ = (
+        _get_upper_index('ix_corp_name_upper_corp_nme', corp_nme, end_event_id.is_(None)),
+        _get_trigram_index('ix_corp_name_upper_corp_nme_trgm', corp_nme, end_event_id.is_(None)),
+        db.Index('ix_corp_name_corp_num_end_event_id', corp_num, end_event_id, corp_name_typ_cd),
+    )
+
     def __repr__(self):
         """Return string representation of a CorpName entity."""
         return 'corp num: {}'.format(self.corp_num)
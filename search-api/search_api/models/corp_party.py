@@ -13,25 +13,27 @@
 # limitations under the License.
 """This model manages a CorpParty entity."""
 
-from functools import reduce
 import logging
 
-from sqlalchemy import func, and_
+from flask import current_app
+from sqlalchemy import func, and_, union
 from sqlalchemy.orm.exc import NoResultFound
 
 from search_api.constants import ADDITIONAL_COLS_ACTIVE, ADDITIONAL_COLS_ADDRESS
 from search_api.models.base import BaseModel, db
 from search_api.models.corp_name import CorpName
 from search_api.models.corp_state import CorpState
-from search_api.models.corp_op_state import CorpOpState
 from search_api.models.address import Address
 from search_api.models.event import Event
 from search_api.models.filing import Filing
-from search_api.models.filing_type import FilingType
 from search_api.models.offices_held import OfficesHeld
-from search_api.models.officer_type import OfficerType
+from search_api.models.reference_data import get_reference_data
 from search_api.utils.model_utils import (
-    _get_filter,
+    _get_filters,
+    _get_similarity_score,
+    _get_sort_expr,
+    _get_trigram_index,
+    _get_upper_index,
     _sort_by_field,
     _is_addr_search,
     _merge_addr_fields,
@@ -92,6 +94,20 @@ class CorpParty(BaseModel):
     phone = db.Column(db.String(30))
     reason_typ_cd = db.Column(db.String(3))
 
+    # The search only considers current parties (with no end_event_id).
+    __table_args__ = (
+        _get_upper_index('ix_corp_party_upper_last_nme', last_nme, end_event_id.is_(None)),
+        _get_upper_index('ix_corp_party_upper_first_nme', first_nme, end_event_id.is_(None)),
+        _get_upper_index('ix_corp_party_upper_middle_nme', middle_nme, end_event_id.is_(None)),
+        _get_trigram_index('ix_corp_party_upper_last_nme_trgm', last_nme, end_event_id.is_(None)),
+        _get_trigram_index('ix_corp_party_upper_first_nme_trgm', first_nme, end_event_id.is_(None)),
+        _get_trigram_index('ix_corp_party_upper_middle_nme_trgm', middle_nme, end_event_id.is_(None)),
+        # text_pattern_ops doesn't sort in the collation's order, so the default sort needs its own index.
+        db.Index('ix_corp_party_upper_last_nme_sort', func.upper(last_nme), corp_num,
+                 postgresql_where=end_event_id.is_(None)),
+        db.Index('ix_corp_party_corp_num_end_event_id', corp_num, end_event_id),
+    )
+
     def __repr__(self):
         """Return string representation of a CorpParty entity."""
         return 'corp num: {}'.format(self.corp_party_id)
@@ -106,15 +122,27 @@ class CorpParty(BaseModel):
             return None
 
     @staticmethod
-    def get_corporation_info_by_corp_party_id(corp_party_id):
-        """Get Corporation info by CorpParty id."""
+    def get_corp_party_detail_by_id(corp_party_id):
+        """Get a CorpParty with everything the director detail needs from its own row's relations, in one query.
+
+        Adds the Corporation info, and the start Event timestamp and filing type to the CorpParty. Look the
+        descriptions of the party and filing types up in the reference data.
+        """
         # local import to prevent circular import
         from search_api.models.corporation import Corporation  # pylint: disable=import-outside-toplevel, cyclic-import
 
         query = (
             CorpParty.query.filter(CorpParty.corp_party_id == int(corp_party_id))
             .join(Corporation, Corporation.corp_num == CorpParty.corp_num)
-            .add_columns(Corporation.corp_typ_cd, Corporation.admin_email)
+            .outerjoin(Event, Event.event_id == CorpParty.start_event_id)
+            .outerjoin(Filing, Filing.event_id == Event.event_id)
+            .add_columns(
+                Corporation.corp_typ_cd,
+                Corporation.admin_email,
+                Event.event_id,
+                Event.event_timestmp,
+                Filing.filing_typ_cd,
+            )
         )
 
         try:
@@ -122,40 +150,32 @@ class CorpParty(BaseModel):
         except NoResultFound:
             return None
 
-    @staticmethod
-    def get_filing_description_by_corp_party_id(corp_party_id):
-        """Get FilingType info by CorpParty id."""
-        return (
-            CorpParty.query.join(Event, Event.event_id == CorpParty.start_event_id)
-            .join(Filing, Filing.event_id == Event.event_id)
-            .join(FilingType, FilingType.filing_typ_cd == Filing.filing_typ_cd)
-            .add_columns(FilingType.full_desc)
-            .filter(CorpParty.corp_party_id == int(corp_party_id))
-            .all()
-        )
-
     @staticmethod
     def get_offices_held_by_corp_party_id(corp_party_id):
-        """Get OfficesHeld info by CorpParty id."""
+        """Get OfficesHeld info by CorpParty id. Look the officer type descriptions up in the reference data."""
+        # Only offices of a known officer type, as when this joined the officer_type table.
+        officer_types = get_reference_data().get_codes('officer_type')
         return (
             CorpParty.query.join(OfficesHeld, OfficesHeld.corp_party_id == CorpParty.corp_party_id)
-            .join(OfficerType, OfficerType.officer_typ_cd == OfficesHeld.officer_typ_cd)
             .join(Event, Event.event_id == CorpParty.start_event_id)
             .add_columns(
                 CorpParty.corp_party_id,
-                OfficerType.officer_typ_cd,
-                OfficerType.short_desc,
+                OfficesHeld.officer_typ_cd,
                 CorpParty.appointment_dt,
                 Event.event_timestmp,
             )
             .filter(CorpParty.corp_party_id == int(corp_party_id))
+            .filter(OfficesHeld.officer_typ_cd.in_(officer_types))
             .all()
         )
 
     @staticmethod
-    def get_corp_party_at_same_addr(corp_party_id):
-        """Get CorpParty entities at the same mailing or delivery address."""
-        person = CorpParty.get_corp_party_by_id(corp_party_id)
+    def get_corp_party_at_same_addr(corp_party_id, person=None):
+        """Get CorpParty entities at the same mailing or delivery address.
+
+        Pass the CorpParty as `person` if it has already been loaded, to save fetching it again.
+        """
+        person = person or CorpParty.get_corp_party_by_id(corp_party_id)
 
         if not person:
             return None
@@ -182,9 +202,12 @@ class CorpParty(BaseModel):
         return same_addr
 
     @staticmethod
-    def get_corp_party_same_name_at_same_addr(corp_party_id):
-        """Get CorpParty entities with the same CorpParty name and delivery or mailing address."""
-        person = CorpParty.get_corp_party_by_id(corp_party_id)
+    def get_corp_party_same_name_at_same_addr(corp_party_id, person=None):
+        """Get CorpParty entities with the same CorpParty name and delivery or mailing address.
+
+        Pass the CorpParty as `person` if it has already been loaded, to save fetching it again.
+        """
+        person = person or CorpParty.get_corp_party_by_id(corp_party_id)
 
         if not person:
             return None
@@ -204,6 +227,16 @@ class CorpParty(BaseModel):
 
         return same_name_and_company
 
+    @staticmethod
+    def get_current_names():
+        """Return the set of distinct upper-cased first, middle and last names of the current parties."""
+        current = CorpParty.end_event_id == None  # noqa: E711 # pylint: disable=singleton-comparison
+        names = union(*[
+            db.session.query(func.upper(column).label('name')).filter(current, column != None)  # noqa: E711
+            for column in (CorpParty.first_nme, CorpParty.middle_nme, CorpParty.last_nme)
+        ])
+        return {name for name, in db.session.execute(names) if name}
+
     @staticmethod
     def search_corp_parties(args):
         """Search for CorpParty entities.
@@ -239,8 +272,22 @@ class CorpParty(BaseModel):
         return results
 
     @staticmethod
-    def query_corp_parties(args):
-        """Construct db query for CorpParty search."""
+    def is_search_denormalized(denormalized=None):
+        """Return whether to search the corp_party_search table: denormalized, or DIRECTOR_SEARCH_DENORMALIZED."""
+        if denormalized is None:
+            return bool(current_app.config.get('DIRECTOR_SEARCH_DENORMALIZED'))
+        return denormalized
+
+    @staticmethod
+    def query_corp_parties(args, denormalized=None):
+        """Construct db query for CorpParty search.
+
+        Set denormalized to query the corp_party_search table alone, rather than joining the tables it's built
+        from. It defaults to DIRECTOR_SEARCH_DENORMALIZED. The rows have the same columns either way.
+        """
+        if CorpParty.is_search_denormalized(denormalized):
+            return CorpParty.query_corp_party_search(args)
+
         # local import to prevent circular import
         from search_api.models.corporation import Corporation  # pylint: disable=import-outside-toplevel, cyclic-import
 
@@ -292,31 +339,124 @@ class CorpParty(BaseModel):
 
         results = CorpParty.add_additional_cols_to_search_query(additional_cols, fields, results)
 
-        # Determine if we will combine clauses with OR or AND. mode=ALL means we use AND. Default mode is OR
-        if mode == 'ALL':
-
-            def filter_reducer(accumulator, filter_value):
-                return accumulator & _get_filter(*filter_value)
+        results = results.filter(_get_filters(clauses, mode))
 
+        # Sorting
+        if sort_type is None:
+            # The most similar first, if any clause is a similar search.
+            score = _get_similarity_score(clauses)
+            if score is not None:
+                results = results.order_by(score.desc())
+            results = results.order_by(func.upper(CorpParty.last_nme), CorpParty.corp_num)
         else:
+            sort_field = _sort_by_field(sort_type, sort_value)
+            results = results.order_by(sort_field)
+        return results
+
+    @staticmethod
+    def query_corp_party_search(args):
+        """Construct db query for CorpParty search of the corp_party_search table, which needs no joins."""
+        # local import to prevent circular import
+        from search_api.models.corp_party_search import CorpPartySearch  # noqa # pylint: disable=import-outside-toplevel, cyclic-import
 
-            def filter_reducer(accumulator, filter_value):
-                return accumulator | _get_filter(*filter_value)
+        fields = args.getlist('field')
+        clauses = list(zip(fields, args.getlist('operator'), args.getlist('value')))
+        sort_type = args.get('sort_type')
+        additional_cols = args.get('additional_cols')
 
-        # We use reduce here to join all the items in clauses with the & operator or the | operator.
-        # Similar to if we did "|".join(clause), but calling the boolean operator instead.
+        results = CorpPartySearch.query.with_entities(
+            CorpPartySearch.corp_party_id,
+            CorpPartySearch.first_nme,
+            CorpPartySearch.middle_nme,
+            CorpPartySearch.last_nme,
+            CorpPartySearch.appointment_dt,
+            CorpPartySearch.cessation_dt,
+            CorpPartySearch.corp_num,
+            CorpPartySearch.party_typ_cd,
+            CorpPartySearch.corp_nme,
+        )
 
-        filter_grp = reduce(filter_reducer, clauses[1:], _get_filter(*clauses[0]))
+        if _is_addr_search(fields) or additional_cols == ADDITIONAL_COLS_ADDRESS:
+            results = results.add_columns(
+                CorpPartySearch.addr_line_1, CorpPartySearch.addr_line_2, CorpPartySearch.addr_line_3,
+                CorpPartySearch.postal_cd)
 
-        results = results.filter(filter_grp)
+        if additional_cols == ADDITIONAL_COLS_ACTIVE:
+            op_states = get_reference_data().get_codes('corp_op_state')
+            results = results.filter(CorpPartySearch.state_typ_cd.in_(op_states))
+            results = results.add_columns(CorpPartySearch.state_typ_cd)
+
+        results = results.filter(_get_filters(clauses, args.get('mode'), denormalized=True))
 
-        # Sorting
         if sort_type is None:
-            results = results.order_by(func.upper(CorpParty.last_nme), CorpParty.corp_num)
+            score = _get_similarity_score(clauses, denormalized=True)
+            if score is not None:
+                results = results.order_by(score.desc())
+            return results.order_by(CorpPartySearch.upper_last_nme, CorpPartySearch.corp_num)
+        return results.order_by(_sort_by_field(sort_type, args.get('sort_value'), denormalized=True))
+
+    @staticmethod
+    def get_search_sort_keys(args, denormalized=None):
+        """Return the (expression, descending) keys that order CorpParty search results.
+
+        This is the same ordering query_corp_parties() uses, with corp_party_id appended as a tiebreaker so
+        that keyset pagination never skips or repeats a row.
+        """
+        sort_type = args.get('sort_type')
+        sort_value = args.get('sort_value')
+        denormalized = CorpParty.is_search_denormalized(denormalized)
+
+        keys = []
+        if sort_type is None:
+            clauses = list(zip(args.getlist('field'), args.getlist('operator'), args.getlist('value')))
+            score = _get_similarity_score(clauses, denormalized)
+            if score is not None:
+                keys.append((score, True))
+
+        if denormalized:
+            # local import to prevent circular import
+            from search_api.models.corp_party_search import CorpPartySearch  # noqa # pylint: disable=import-outside-toplevel, cyclic-import
+
+            if sort_type is None:
+                keys += [(CorpPartySearch.upper_last_nme, False), (CorpPartySearch.corp_num, False)]
+            else:
+                keys += [(_get_sort_expr(sort_value, denormalized=True), sort_type == 'dsc')]
+            keys.append((CorpPartySearch.corp_party_id, False))
+            return keys
+
+        if sort_type is None:
+            keys += [(func.upper(CorpParty.last_nme), False), (CorpParty.corp_num, False)]
         else:
-            sort_field = _sort_by_field(sort_type, sort_value)
-            results = results.order_by(sort_field)
-        return results
+            keys += [(_get_sort_expr(sort_value), sort_type == 'dsc')]
+
+        keys.append((CorpParty.corp_party_id, False))
+        return keys
+
+    @staticmethod
+    def get_best_search_results(args, results, limit, denormalized=None):
+        """Keep only the limit best-scoring rows of a CorpParty search with fuzzy clauses, in the search's order.
+
+        Rows are scored by their relevance to the similar, nicknames and phonetic clauses. Without this, a search
+        sorted by a column would return its first limit rows in that order, which can leave out the best matches.
+        On Oracle, ROWNUM is applied before ORDER BY, so it would return whichever rows were found first, whatever
+        the sort. A search without fuzzy clauses is returned as it is.
+        """
+        denormalized = CorpParty.is_search_denormalized(denormalized)
+        clauses = list(zip(args.getlist('field'), args.getlist('operator'), args.getlist('value')))
+        score = _get_similarity_score(clauses, denormalized)
+        if score is None:
+            return results
+
+        if denormalized:
+            # local import to prevent circular import
+            from search_api.models.corp_party_search import CorpPartySearch  # noqa # pylint: disable=import-outside-toplevel, cyclic-import
+
+            id_column = CorpPartySearch.corp_party_id
+        else:
+            id_column = CorpParty.corp_party_id
+
+        best = results.with_entities(id_column).order_by(None).order_by(score.desc(), id_column).limit(limit)
+        return results.filter(id_column.in_(best.subquery()))
 
     @staticmethod
     def add_additional_cols_to_search_query(additional_cols, fields, query):
@@ -326,8 +466,10 @@ class CorpParty(BaseModel):
             query = query.add_columns(Address.addr_line_1, Address.addr_line_2, Address.addr_line_3, Address.postal_cd,)
 
         if additional_cols == ADDITIONAL_COLS_ACTIVE:
-            query = query.join(CorpOpState, CorpOpState.state_typ_cd == CorpState.state_typ_cd)
-            query = query.add_columns(CorpOpState.state_typ_cd)
+            # Only states in the corp_op_state table, as when this joined it, but without the join.
+            op_states = get_reference_data().get_codes('corp_op_state')
+            query = query.filter(CorpState.state_typ_cd.in_(op_states))
+            query = query.add_columns(CorpState.state_typ_cd)
 
         return query
 
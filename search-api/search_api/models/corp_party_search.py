@@ -0,0 +1,251 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""This model manages the CorpPartySearch table, a denormalized copy of the current directors for searching.
+
+A director search joins corp_party to corporation, corp_state, corp_name and address over 11M+ rows. This table
+holds the result of those joins for the current parties only (no end event, and not of type 'OFF'), with the names,
+the merged address and the postal code already upper-cased, so a search is an index scan of a single table.
+
+It's kept up to date by refresh(): it reloads the parties of every corporation with an event since the last
+refresh, and records the last event it has seen in corp_party_search_refresh. Run it with refresh_search.py.
+"""
+
+import datetime
+
+from sqlalchemy import and_, exists, func, or_
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql.expression import case
+
+from search_api.models.address import Address
+from search_api.models.base import BaseModel, db
+from search_api.models.corp_name import CorpName
+from search_api.models.corp_party import CorpParty
+from search_api.models.corp_state import CorpState
+from search_api.models.corporation import Corporation
+from search_api.models.event import Event
+from search_api.models.name_key import NameKey
+from search_api.utils.model_utils import _get_trigram_index, _normalize_postal_cd
+
+
+# How many corporations to reload at a time. Oracle allows at most 1000 values in an IN list.
+REFRESH_BATCH_SIZE = 1000
+
+
+class CorpPartySearch(BaseModel):
+    """CorpPartySearch entity. Corresponds to the 'corp_party_search' table.
+
+    The columns are those of corp_party, corporation, corp_name, corp_state and the mailing address that the
+    director search returns or filters on, plus upper-cased copies of the searched names and address.
+    """
+
+    __tablename__ = 'corp_party_search'
+
+    corp_party_id = db.Column(db.Integer, primary_key=True)
+    start_event_id = db.Column(db.Integer)
+    corp_num = db.Column(db.String(10), index=True)
+    corp_typ_cd = db.Column(db.String(3))
+    recognition_dts = db.Column(db.Date)
+    party_typ_cd = db.Column(db.String(3))
+    first_nme = db.Column(db.String(30))
+    middle_nme = db.Column(db.String(30))
+    last_nme = db.Column(db.String(30))
+    appointment_dt = db.Column(db.Date)
+    cessation_dt = db.Column(db.Date)
+    corp_nme = db.Column(db.String(150))
+    state_typ_cd = db.Column(db.String(3))
+    addr_line_1 = db.Column(db.String(50))
+    addr_line_2 = db.Column(db.String(50))
+    addr_line_3 = db.Column(db.String(50))
+    city = db.Column(db.String(40))
+    province = db.Column(db.String(2))
+    postal_cd = db.Column(db.String(15))
+    upper_first_nme = db.Column(db.String(30), index=True)
+    upper_middle_nme = db.Column(db.String(30), index=True)
+    upper_last_nme = db.Column(db.String(30), index=True)
+    upper_corp_nme = db.Column(db.String(150), index=True)
+    # Address lines 1, 2 and 3, joined by ', ' as the search results show them.
+    upper_addr = db.Column(db.String(156))
+    # Without spaces, so 'V8W 1A1' and 'V8W1A1' are the same.
+    upper_postal_cd = db.Column(db.String(15), index=True)
+    # The Soundex keys of the names, from name_key, for the phonetic search.
+    first_nme_key = db.Column(db.String(4), index=True)
+    last_nme_key = db.Column(db.String(4), index=True)
+
+    __table_args__ = tuple(
+        _get_trigram_index('ix_corp_party_search_{}_trgm'.format(column), column, upper_cased=True)
+        for column in ('upper_last_nme', 'upper_first_nme', 'upper_middle_nme', 'upper_corp_nme', 'upper_addr')
+    )
+
+    def __str__(self):
+        """Return string representation of a CorpPartySearch entity."""
+        return 'corp party id: {}'.format(self.corp_party_id)
+
+    @staticmethod
+    def get_source_query():
+        """Return the query of the current parties, with this table's columns in order, from the source tables."""
+        def merge(accumulator, line):
+            # Concatenating NULL gives NULL, except on Oracle.
+            skip = line == None  # noqa: E711 # pylint: disable=singleton-comparison
+            return accumulator + case([(skip, '')], else_=', ' + line)
+
+        addr = merge(merge(func.coalesce(Address.addr_line_1, ''), Address.addr_line_2), Address.addr_line_3)
+        first_nme_key = aliased(NameKey)
+        last_nme_key = aliased(NameKey)
+        # A corporation can have a current name of each type, or several of one. Take its CO name, the lowest
+        # numbered one, over any NB name, so there's one row per party: corp_party_id is the key.
+        other_name = aliased(CorpName)
+        better_name = exists().where(and_(
+            other_name.corp_num == CorpName.corp_num,
+            other_name.end_event_id == None,  # noqa: E711 # pylint: disable=singleton-comparison
+            other_name.corp_name_typ_cd.in_(('CO', 'NB')),
+            or_(
+                and_(other_name.corp_name_typ_cd == 'CO', CorpName.corp_name_typ_cd == 'NB'),
+                and_(
+                    other_name.corp_name_typ_cd == CorpName.corp_name_typ_cd,
+                    other_name.corp_name_seq_num < CorpName.corp_name_seq_num,
+                ),
+            ),
+        ))
+
+        return (
+            db.session.query(
+                CorpParty.corp_party_id,
+                CorpParty.start_event_id,
+                CorpParty.corp_num,
+                Corporation.corp_typ_cd,
+                Corporation.recognition_dts,
+                CorpParty.party_typ_cd,
+                CorpParty.first_nme,
+                CorpParty.middle_nme,
+                CorpParty.last_nme,
+                CorpParty.appointment_dt,
+                CorpParty.cessation_dt,
+                CorpName.corp_nme,
+                CorpState.state_typ_cd,
+                Address.addr_line_1,
+                Address.addr_line_2,
+                Address.addr_line_3,
+                Address.city,
+                Address.province,
+                Address.postal_cd,
+                func.upper(CorpParty.first_nme),
+                func.upper(CorpParty.middle_nme),
+                func.upper(CorpParty.last_nme),
+                func.upper(CorpName.corp_nme),
+                func.upper(addr),
+                _normalize_postal_cd(Address.postal_cd),
+                first_nme_key.soundex,
+                last_nme_key.soundex,
+            )
+            .join(Corporation, Corporation.corp_num == CorpParty.corp_num)
+            .join(
+                CorpState,
+                and_(
+                    CorpState.corp_num == CorpParty.corp_num,
+                    CorpState.end_event_id == None,  # noqa: E711 # pylint: disable=singleton-comparison
+                ),
+            )
+            .outerjoin(
+                CorpName,
+                and_(
+                    CorpName.end_event_id == None,  # noqa: E711 # pylint: disable=singleton-comparison
+                    CorpName.corp_name_typ_cd.in_(('CO', 'NB')),
+                    Corporation.corp_num == CorpName.corp_num,
+                    ~better_name,
+                ),
+            )
+            .outerjoin(Address, CorpParty.mailing_addr_id == Address.addr_id)
+            .outerjoin(first_nme_key, first_nme_key.name == func.upper(CorpParty.first_nme))
+            .outerjoin(last_nme_key, last_nme_key.name == func.upper(CorpParty.last_nme))
+            .filter(
+                CorpParty.end_event_id == None,  # noqa: E711 # pylint: disable=singleton-comparison
+                CorpParty.party_typ_cd != 'OFF',
+            )
+        )
+
+    @staticmethod
+    def refresh(full=False, batch_size=REFRESH_BATCH_SIZE):
+        """Bring the table up to date with the source tables, in the current transaction. The caller commits.
+
+        Reloads the parties of each corporation with an event after the last refresh's, or every party if full is
+        set or the table has never been refreshed. Then fills in any missing name keys. Return the number of
+        corporations and rows reloaded, the number of rows given keys, and the last event id seen.
+        """
+        state = CorpPartySearchRefresh.query.get(1)
+        last_event_id = db.session.query(func.max(Event.event_id)).scalar() or 0
+        columns = [column.name for column in CorpPartySearch.__table__.columns]
+        insert = CorpPartySearch.__table__.insert()
+        result = {'full': full or state is None, 'corporations': None, 'rows': 0, 'last_event_id': last_event_id}
+
+        if result['full']:
+            CorpPartySearch.query.delete(synchronize_session=False)
+            result['rows'] = db.session.execute(
+                insert.from_select(columns, CorpPartySearch.get_source_query().statement)).rowcount
+        else:
+            corp_nums = [
+                corp_num for corp_num, in db.session.query(Event.corp_num).distinct().filter(
+                    Event.event_id > state.last_event_id,
+                    Event.event_id <= last_event_id,
+                    Event.corp_num != None,  # noqa: E711 # pylint: disable=singleton-comparison
+                )
+            ]
+            result['corporations'] = len(corp_nums)
+
+            for start in range(0, len(corp_nums), batch_size):
+                batch = corp_nums[start:start + batch_size]
+                CorpPartySearch.query.filter(CorpPartySearch.corp_num.in_(batch)).delete(synchronize_session=False)
+                query = CorpPartySearch.get_source_query().filter(CorpParty.corp_num.in_(batch))
+                result['rows'] += db.session.execute(insert.from_select(columns, query.statement)).rowcount
+
+        result['keys'] = CorpPartySearch.fill_name_keys()
+
+        if state is None:
+            state = CorpPartySearchRefresh(refresh_id=1)
+            db.session.add(state)
+        state.last_event_id = last_event_id
+        state.refreshed_at = datetime.datetime.utcnow()
+        db.session.flush()
+
+        return result
+
+    @staticmethod
+    def fill_name_keys():
+        """Copy the keys of the names from name_key to the rows that don't have them, in the current transaction.
+
+        The rows get their keys as they're loaded, so this only backfills rows loaded before their names had keys.
+        Return the number of rows updated.
+        """
+        rows = 0
+        for key_column, name_column in (
+                (CorpPartySearch.first_nme_key, CorpPartySearch.upper_first_nme),
+                (CorpPartySearch.last_nme_key, CorpPartySearch.upper_last_nme)):
+            soundex = db.session.query(NameKey.soundex).filter(NameKey.name == name_column).as_scalar()
+            rows += CorpPartySearch.query.filter(
+                key_column == None,  # noqa: E711 # pylint: disable=singleton-comparison
+                name_column.in_(db.session.query(NameKey.name).subquery()),
+            ).update({key_column: soundex}, synchronize_session=False)
+        return rows
+
+
+class CorpPartySearchRefresh(BaseModel):
+    """CorpPartySearchRefresh entity. Corresponds to the 'corp_party_search_refresh' table.
+
+    It has a single row, recording the last event the corp_party_search table is up to date with.
+    """
+
+    __tablename__ = 'corp_party_search_refresh'
+
+    refresh_id = db.Column(db.Integer, primary_key=True)
+    last_event_id = db.Column(db.Integer)
+    refreshed_at = db.Column(db.DateTime)
@@ -34,6 +34,8 @@ class CorpState(BaseModel):
     state_typ_cd = db.Column(db.String(3))
     dd_corp_num = db.Column(db.String(10))
 
+    __table_args__ = (db.Index('ix_corp_state_corp_num_end_event_id', corp_num, end_event_id),)
+
     @staticmethod
     def get_corp_states_by_corp_id(corp_id):
         """Get CorpState by corp_num."""
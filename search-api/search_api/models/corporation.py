@@ -22,7 +22,7 @@ from search_api.models.corp_name import CorpName
 from search_api.models.corp_state import CorpState
 from search_api.models.office import Office
 from search_api.models.address import Address
-from search_api.utils.model_utils import _sort_by_field
+from search_api.utils.model_utils import _contains, _get_sort_expr, _sort_by_field
 
 
 class Corporation(BaseModel):
@@ -105,6 +105,24 @@ class Corporation(BaseModel):
         results = Corporation.query_corporations(query, search_field, sort_type, sort_value, include_addr)
         return results
 
+    @staticmethod
+    def get_search_sort_keys(args):
+        """Return the (expression, descending) keys that order Corporation search results.
+
+        This is the same ordering query_corporations() uses, with corp_num appended as a tiebreaker so that
+        keyset pagination never skips or repeats a row.
+        """
+        sort_type = args.get('sort_type')
+        sort_value = args.get('sort_value')
+
+        if sort_type is None:
+            keys = [(func.upper(CorpName.corp_nme), False)]
+        else:
+            keys = [(_get_sort_expr(sort_value), sort_type == 'dsc')]
+
+        keys.append((Corporation.corp_num, False))
+        return keys
+
     @staticmethod
     def query_corporations(query, search_field, sort_type, sort_value, include_addr=False):
         """Construct Corporation search db query."""
@@ -125,18 +143,20 @@ class Corporation(BaseModel):
                     CorpState.end_event_id == None,  # noqa  # pylint: disable=singleton-comparison
                 ),
             )
-            .outerjoin(
+        )
+
+        if include_addr:
+            # Only join the offices when the address is returned: a corporation with several offices would
+            # otherwise show up once per office.
+            results = results.outerjoin(
                 Office,
                 and_(
                     Office.corp_num == Corporation.corp_num,  # noqa
                     Office.office_typ_cd != literal_column("'RG'"),  # noqa
                     Office.end_event_id == None,  # noqa  # pylint: disable=singleton-comparison
                 ),
-            )
-            .outerjoin(Address, Office.mailing_addr_id == Address.addr_id)
-        )
+            ).outerjoin(Address, Office.mailing_addr_id == Address.addr_id)
 
-        if include_addr:
             results = results.with_entities(
                 CorpName.corp_nme,
                 Corporation.corp_num,
@@ -165,8 +185,7 @@ class Corporation(BaseModel):
                 # For now, we only support company names.
                 #    Corporation.corp_num == query.upper(),
                 CorpName.corp_name_typ_cd == literal_column("'CO'"),
-                # Doing a full CONTAINS search is quite slow. Use STARTSWITH for this reason.
-                func.upper(CorpName.corp_nme).like('%' + query.upper() + '%')
+                _contains(func.upper(CorpName.corp_nme), query.upper())
                 # )
             )
         elif search_field == 'corpNum':
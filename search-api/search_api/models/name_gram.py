@@ -0,0 +1,77 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""This model manages the NameGram table, an index of the parties' names by their bigrams, for the similar search.
+
+Each distinct upper-cased first, middle and last name of a current party has a row for each of its bigrams (pairs
+of adjacent letters, with the start and end of the name marked by '#'). Names that share enough bigrams with a
+search value are the candidates the similar search scores. See search_api.utils.similarity.
+"""
+
+from sqlalchemy import func
+
+from search_api.models.base import BaseModel, db
+
+
+def get_grams(name):
+    """Return the set of bigrams of an upper-cased name, including the '#'-marked first and last letters."""
+    padded = '#{}#'.format(name)
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+class NameGram(BaseModel):
+    """NameGram entity. Corresponds to the 'name_gram' table."""
+
+    __tablename__ = 'name_gram'
+
+    gram = db.Column(db.String(2), primary_key=True)
+    name = db.Column(db.String(30), primary_key=True)
+
+    def __repr__(self):
+        """Return string representation of a NameGram entity."""
+        return 'name gram: {} {}'.format(self.gram, self.name)
+
+    @staticmethod
+    def get_candidates(name, min_shared, limit=None):
+        """Return the names that share at least min_shared bigrams with an upper-cased name.
+
+        With a limit, return at most that many, those that share the most bigrams.
+        """
+        query = (
+            db.session.query(NameGram.name)
+            .filter(NameGram.gram.in_(sorted(get_grams(name))))
+            .group_by(NameGram.name)
+            .having(func.count() >= min_shared)
+        )
+        if limit:
+            query = query.order_by(func.count().desc(), NameGram.name).limit(limit)
+        return [candidate for candidate, in query]
+
+    @staticmethod
+    def refresh(batch_size=10000):
+        """Index the names of the current parties that aren't indexed yet, in the current transaction.
+
+        Names that are no longer used are left in place: they only add candidates that match no rows. Return the
+        number of names added.
+        """
+        # local import to prevent circular import
+        from search_api.models.corp_party import CorpParty  # pylint: disable=import-outside-toplevel, cyclic-import
+
+        indexed = {name for name, in db.session.query(NameGram.name).distinct()}
+        new_names = sorted(CorpParty.get_current_names() - indexed)
+
+        rows = [{'gram': gram, 'name': name} for name in new_names for gram in get_grams(name)]
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(NameGram.__table__.insert(), rows[start:start + batch_size])
+
+        return len(new_names)
@@ -0,0 +1,82 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""This model manages the NameKey table, the parties' names by their phonetic (Soundex) key, for the phonetic search.
+
+Each distinct upper-cased first, middle and last name of a current party has a row with its Soundex key, so the
+names that sound like a search value ('SMITH', 'SMYTH', 'SMYTHE') are an indexed lookup of the value's key. The
+corp_party_search table copies the keys of its first and last names from here.
+"""
+
+from search_api.models.base import BaseModel, db
+
+
+# The Soundex digit of each consonant. Vowels (and Y) separate letters with the same digit; H and W don't.
+_SOUNDEX_DIGITS = {
+    letter: str(digit)
+    for digit, letters in enumerate(('AEIOUY', 'BFPV', 'CGJKQSXZ', 'DT', 'L', 'MN', 'R'))
+    for letter in letters
+}
+
+
+def get_soundex(name):
+    """Return the American Soundex key of a name: its first letter and three digits, e.g. 'S530' for 'Smith'.
+
+    Characters other than the letters A to Z are ignored. Return '' if there are none.
+    """
+    letters = [letter for letter in name.upper() if letter in _SOUNDEX_DIGITS or letter in 'HW']
+    if not letters:
+        return ''
+
+    key = letters[0]
+    previous = _SOUNDEX_DIGITS.get(letters[0])
+    for letter in letters[1:]:
+        if letter in 'HW':
+            continue
+        digit = _SOUNDEX_DIGITS[letter]
+        if digit not in ('0', previous):
+            key += digit
+            if len(key) == 4:
+                break
+        previous = digit
+
+    return key.ljust(4, '0')
+
+
+class NameKey(BaseModel):
+    """NameKey entity. Corresponds to the 'name_key' table."""
+
+    __tablename__ = 'name_key'
+
+    name = db.Column(db.String(30), primary_key=True)
+    soundex = db.Column(db.String(4), index=True)
+
+    def __repr__(self):
+        """Return string representation of a NameKey entity."""
+        return 'name key: {} {}'.format(self.name, self.soundex)
+
+    @staticmethod
+    def refresh(batch_size=10000):
+        """Add the names of the current parties that have no key yet, in the current transaction.
+
+        Return the number of names added.
+        """
+        # local import to prevent circular import
+        from search_api.models.corp_party import CorpParty  # pylint: disable=import-outside-toplevel, cyclic-import
+
+        keyed = {name for name, in db.session.query(NameKey.name)}
+        rows = [{'name': name, 'soundex': get_soundex(name)} for name in sorted(CorpParty.get_current_names() - keyed)]
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(NameKey.__table__.insert(), rows[start:start + batch_size])
+
+        return len(rows)
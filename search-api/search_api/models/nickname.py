@@ -13,8 +13,16 @@
 # limitations under the License.
 """Table of related NickNames. Any name with equivalent name_id is considered related."""
 
+import threading
+import time
+
+from flask import current_app
 from sqlalchemy import func
 from search_api.models.base import BaseModel, db
+from search_api.utils.refresh_stamps import get_stamp, touch_stamp
+
+
+NICKNAME_STAMP = 'nicknames'
 
 
 class NickName(BaseModel):
@@ -26,15 +34,94 @@ class NickName(BaseModel):
     name = db.Column(db.String(30), primary_key=True)
 
     @staticmethod
-    def get_nickname_search_expr(field, value):
+    def get_nickname_map():
+        """Load the nickname table as a dict of each name to the frozenset of its aliases (including itself)."""
+        return _get_alias_map(db.session.query(NickName.name_id, NickName.name))
+
+    @staticmethod
+    def get_aliases(name):
+        """Return the frozenset of names related to name (including itself), or an empty set if it has none."""
+        return _get_nickname_cache().get_aliases(name)
+
+    @staticmethod
+    def refresh_nicknames():
+        """Reload this process's copy of the nickname table now, and every other's when it's next used.
+
+        Return the number of names loaded.
+        """
+        touch_stamp(NICKNAME_STAMP)
+        return _get_nickname_cache().refresh()
+
+    @staticmethod
+    def get_nickname_search_expr(field, value, upper_cased=False):
         """Nickname search.
 
         Generate an expression to return instances where a field matches any nickname related to the provided value.
+        Set upper_cased if the field is already upper-cased.
         """
-        aliases = db.session.query(NickName.name).filter(
-            NickName.name_id ==
-            db.session.query(NickName.name_id).filter(NickName.name == value)
-        )
+        alias_list = sorted(NickName.get_aliases(value))
+        if not upper_cased:
+            field = func.upper(field)
+        return field.in_(alias_list)
+
+
+class NickNameCache:
+    """An in-memory copy of the nickname table, which is small, static reference data.
+
+    It's loaded on first use, and reloaded when it is older than refresh_interval seconds (0 to never reload),
+    or on demand via refresh(). Each process has its own copy, and reloads it when the table's refresh stamp is
+    newer than the copy.
+    """
+
+    def __init__(self, refresh_interval):
+        """Create an empty cache, loaded on first use."""
+        self.refresh_interval = refresh_interval
+        self._nicknames = None
+        self._loaded_at = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _is_stale(self):
+        if self._nicknames is None or get_stamp(NICKNAME_STAMP) != self._stamp:
+            return True
+        return bool(self.refresh_interval) and time.monotonic() - self._loaded_at > self.refresh_interval
+
+    def get_aliases(self, name):
+        """Return the frozenset of names related to name (including itself), or an empty set if it has none."""
+        if self._is_stale():
+            with self._lock:
+                if self._is_stale():
+                    self.refresh()
+
+        return self._nicknames.get(name, frozenset())
+
+    def refresh(self):
+        """Reload the nickname table. Return the number of names loaded."""
+        # Read the stamp first, so a refresh elsewhere during the load isn't missed.
+        stamp = get_stamp(NICKNAME_STAMP)
+        nicknames = NickName.get_nickname_map()
+        self._nicknames, self._loaded_at, self._stamp = nicknames, time.monotonic(), stamp
+        return len(nicknames)
+
+
+def _get_alias_map(rows):
+    """Return a dict of each name to the frozenset of its aliases, from (name_id, name) rows.
+
+    A name in several groups (name_ids) has the aliases of all of them.
+    """
+    names_by_id = {}
+    for name_id, name in rows:
+        names_by_id.setdefault(name_id, set()).add(name)
+
+    aliases = {}
+    for names in names_by_id.values():
+        for name in names:
+            aliases.setdefault(name, set()).update(names)
+    return {name: frozenset(names) for name, names in aliases.items()}
+
 
-        alias_list = list(a[0] for a in aliases)
-        return func.upper(field).in_(alias_list)
+def _get_nickname_cache():
+    if 'nickname_cache' not in current_app.extensions:
+        current_app.extensions['nickname_cache'] = NickNameCache(
+            current_app.config.get('NICKNAME_REFRESH_INTERVAL', 3600))
+    return current_app.extensions['nickname_cache']
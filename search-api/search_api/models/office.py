@@ -41,6 +41,8 @@ class Office(BaseModel):
     dd_corp_num = db.Column(db.String(10))
     email_address = db.Column(db.String(75))
 
+    __table_args__ = (db.Index('ix_office_corp_num_end_event_id', corp_num, end_event_id),)
+
     @staticmethod
     def get_offices_by_corp_id(corp_id):
         """Get offices by corp_num."""
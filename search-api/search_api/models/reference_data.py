@@ -0,0 +1,124 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""An in-memory copy of the code tables, so queries don't have to join them for their descriptions."""
+
+import threading
+import time
+
+from flask import current_app
+
+from search_api.models.base import db
+from search_api.models.corp_op_state import CorpOpState
+from search_api.models.filing_type import FilingType
+from search_api.models.officer_type import OfficerType
+from search_api.models.party_type import PartyType
+from search_api.utils.refresh_stamps import get_stamp, touch_stamp
+
+
+REFERENCE_DATA_STAMP = 'reference_data'
+
+
+# Each cached table, by name, as its model and code column.
+REFERENCE_TABLES = {
+    'party_type': (PartyType, PartyType.party_typ_cd),
+    'officer_type': (OfficerType, OfficerType.officer_typ_cd),
+    'filing_type': (FilingType, FilingType.filing_typ_cd),
+    'corp_op_state': (CorpOpState, CorpOpState.state_typ_cd),
+}
+
+
+class ReferenceData:
+    """The code tables (party, officer and filing types, and corporation op states), which are small and static.
+
+    Each table is a dict of code to its row, as a dict. They're loaded on first use, and reloaded when they are older
+    than refresh_interval seconds (0 to never reload), or on demand via refresh(). Each load gets a new version
+    number, so anything derived from the tables can tell when it's out of date. Each process has its own copy, and
+    reloads it when the tables' refresh stamp is newer than the copy.
+    """
+
+    def __init__(self, refresh_interval):
+        """Create an empty cache, loaded on first use."""
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self._tables = None
+        self._loaded_at = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _is_stale(self):
+        if self._tables is None or get_stamp(REFERENCE_DATA_STAMP) != self._stamp:
+            return True
+        return bool(self.refresh_interval) and time.monotonic() - self._loaded_at > self.refresh_interval
+
+    def get_table(self, table_name):
+        """Return the dict of code to row for a table in REFERENCE_TABLES."""
+        if self._is_stale():
+            with self._lock:
+                if self._is_stale():
+                    self._load()
+
+        return self._tables[table_name]
+
+    def get(self, table_name, code):
+        """Return the row for a code as a dict, or None if the code is empty or unknown."""
+        if code is None:
+            return None
+        # The codes are CHAR columns, which Oracle pads with spaces.
+        return self.get_table(table_name).get(code.strip())
+
+    def get_codes(self, table_name):
+        """Return a table's codes, sorted, as the database has them, to match against CHAR columns in an IN list.
+
+        The dict keys are stripped for lookups, but Oracle compares 'VP ' to 'VP' as different values.
+        """
+        code_key = REFERENCE_TABLES[table_name][1].key
+        return sorted(row[code_key] for row in self.get_table(table_name).values())
+
+    def refresh(self):
+        """Reload the tables now, and make every other process reload its copy when it's next used.
+
+        Return the new version.
+        """
+        touch_stamp(REFERENCE_DATA_STAMP)
+        with self._lock:
+            self._load()
+        return self.version
+
+    def _load(self):
+        # Read the stamp first, so a refresh elsewhere during the load isn't missed.
+        stamp = get_stamp(REFERENCE_DATA_STAMP)
+        tables = {}
+        for table_name, (model, code_column) in REFERENCE_TABLES.items():
+            columns = model.__table__.columns
+            rows = db.session.query(*columns)
+            tables[table_name] = {
+                getattr(row, code_column.key).strip(): dict(zip(columns.keys(), row)) for row in rows
+            }
+
+        self._tables, self._loaded_at, self._stamp = tables, time.monotonic(), stamp
+        self.version += 1
+
+
+def get_reference_data():
+    """Return this process's ReferenceData."""
+    if 'reference_data' not in current_app.extensions:
+        current_app.extensions['reference_data'] = ReferenceData(
+            current_app.config.get('REFERENCE_DATA_REFRESH_INTERVAL', 3600))
+    return current_app.extensions['reference_data']
+
+
+def get_description(table_name, code, desc_column='short_desc'):
+    """Return a code's description from a table in REFERENCE_TABLES, or None if the code is unknown."""
+    row = get_reference_data().get(table_name, code)
+    return row[desc_column] if row else None
@@ -13,14 +13,10 @@
 # limitations under the License.
 """API endpoints for searching for and retrieving information about Corporations."""
 
-import datetime
 from http import HTTPStatus
 import logging
-from tempfile import NamedTemporaryFile
 
-from flask import Blueprint, request, jsonify, send_from_directory, current_app
-from openpyxl import Workbook
-from sqlalchemy.sql import literal_column
+from flask import Blueprint, request, jsonify
 
 from search_api.auth import jwt, authorized
 # Address removed for now, we're not permitted to show this currently.
@@ -28,7 +24,16 @@ from search_api.auth import jwt, authorized
 from search_api.models.corporation import Corporation
 from search_api.models.corp_name import CorpName
 from search_api.models.office import Office
-from search_api.utils.model_utils import _format_office_typ_cd
+from search_api.utils.export import EXPORT_FORMATS, get_export_response
+from search_api.utils.model_utils import (
+    BadSearchValue,
+    _format_office_typ_cd,
+    _get_corporation_export_column_headers,
+    _get_corporation_export_column_values,
+)
+from search_api.utils.pagination import get_first_results, get_page, seek
+from search_api.utils.search_cache import get_search_cache, get_search_cache_key
+from search_api.utils.search_count import count_search_results
 from search_api.utils.utils import convert_to_snake_case
 
 logger = logging.getLogger(__name__)
@@ -43,6 +48,8 @@ def corporation_search():
     This function takes the following query arguments:
     - query={search keyword}
     - page={page number}
+    - after={cursor}, to page with a signed cursor instead of a page number. An empty value returns the first
+      page, and each response includes the `next_cursor` for the following page (null on the last page).
     """
     account_id = request.headers.get('X-Account-Id', None)
 
@@ -59,22 +66,69 @@ def corporation_search():
     if not args.get('query'):
         return 'No search query was received', 400
 
+    search_cache = get_search_cache()
+    cache_key = get_search_cache_key('businesses', args)
+    response = search_cache.get(cache_key)
+    if response is not None:
+        return jsonify(response)
+
     # Due to performance issues, exclude address.
     results = Corporation.search_corporations(args, include_addr=False)
 
     # Pagination
     per_page = 50
+
+    # Keyset pagination: seek straight to the rows after the cursor, so any page only fetches per_page + 1 rows.
+    if 'after' in args:
+        try:
+            results, next_cursor = seek(
+                results, Corporation.get_search_sort_keys(args), args.get('after'), per_page)
+        except BadSearchValue as e:
+            return 'Invalid search: {}'.format(str(e)), 400
+
+        response = {
+            'results': [_get_corporation_search_result(row) for row in results],
+            'next_cursor': next_cursor,
+        }
+        search_cache.set(cache_key, response)
+        return jsonify(response)
+
     page = int(args.get('page')) if 'page' in args else 1
-    # We've switched to using ROWNUM rather than pagination, for performance reasons.
-    # This means queries with more than 500 results are invalid.
-    # results = results.limit(50).offset((page - 1) * 50).all()
-    if current_app.config.get('IS_ORACLE'):
-        results = results.filter(
-            literal_column('rownum') <= 500
-        ).yield_per(50)
-    else:
-        results = results.limit(500)
+    # Fetch only the requested page, of the first 500 results, and don't count them: the total is
+    # corporation_search_count()'s.
+    response = {'results': [_get_corporation_search_result(row) for row in get_page(results, page, per_page)]}
+    search_cache.set(cache_key, response)
+    return jsonify(response)
+
+
+@API.route('/count/')
+@jwt.requires_auth
+def corporation_search_count():
+    """Count the Corporation search results. Uses the same parameters as corporation_search().
+
+    Counting is separate from corporation_search(), so fetching a page of results doesn't pay for it. Very large
+    counts are estimated, in which case num_results_estimated is true.
+    """
+    account_id = request.headers.get('X-Account-Id', None)
+    if not authorized(jwt, account_id):
+        return jsonify({'message': 'User is not authorized to access Director Search'}), HTTPStatus.UNAUTHORIZED
+
+    args = request.args
+    if not args.get('query'):
+        return 'No search query was received', 400
+
+    try:
+        num_results, estimated = count_search_results(Corporation.search_corporations(args, include_addr=False))
+    except BadSearchValue as e:
+        return 'Invalid search: {}'.format(str(e)), 400
 
+    return jsonify({
+        'num_results': num_results,
+        'num_results_estimated': estimated,
+    })
+
+
+def _get_corporation_search_result(row):
     result_fields = [
         'corpNum',
         'corpNme',
@@ -85,30 +139,20 @@ def corporation_search():
         # 'postalCd'
     ]
 
-    corporations = []
-    index = 0
-    for row in results:
-        if (page - 1) * per_page <= index < page * per_page:
-
-            result_dict = {key: getattr(row, convert_to_snake_case(key)) for key in result_fields}
-            # Due to performance issues, exclude address.
-            result_dict['addr'] = ''  # _merge_addr_fields(row)
-
-            corporations.append(result_dict)
-        index += 1
+    result_dict = {key: getattr(row, convert_to_snake_case(key)) for key in result_fields}
+    # Due to performance issues, exclude address.
+    result_dict['addr'] = ''  # _merge_addr_fields(row)
 
-    return jsonify({
-        'results': corporations,
-        'num_results': index
-    })
+    return result_dict
 
 
 @API.route('/export/')
 @jwt.requires_auth
 def corporation_search_export():
-    """Export a set of Corporation search results to Excel (.xlsx).
+    """Export a set of Corporation search results to Excel (.xlsx), CSV or newline-delimited JSON.
 
-    Uses the same parameters as corporation_search().
+    Uses the same parameters as corporation_search(), plus:
+    - format={'xlsx' (the default), 'csv' or 'ndjson'}
     """
     account_id = request.headers.get('X-Account-Id', None)
     if not authorized(jwt, account_id):
@@ -116,58 +160,16 @@ def corporation_search_export():
 
     # Query string arguments
     args = request.args
+    export_format = args.get('format', 'xlsx')
+    if export_format not in EXPORT_FORMATS:
+        return 'Invalid export format: {}'.format(export_format), 400
 
-    # Fetching results
-    results = Corporation.search_corporations(args, include_addr=False)
-    if current_app.config.get('IS_ORACLE'):
-        results = results.filter(
-            literal_column('rownum') <= 500
-        ).yield_per(50)
-    else:
-        results = results.limit(500)
-
-    # Exporting to Excel
-    workbook = Workbook()
-
-    export_dir = '/tmp'
-    with NamedTemporaryFile(mode='w+b', dir=export_dir, delete=True):
-
-        sheet = workbook.active
-
-        # Sheet headers (first row)
-        _ = sheet.cell(column=1, row=1, value='Inc/Reg #')
-        _ = sheet.cell(column=2, row=1, value='Entity Type')
-        _ = sheet.cell(column=3, row=1, value='Company Name')
-        _ = sheet.cell(column=4, row=1, value='Incorporated')
-        _ = sheet.cell(column=5, row=1, value='Company Status')
-        # _ = sheet.cell(column=6, row=1, value='Company Address')
-        # _ = sheet.cell(column=7, row=1, value='Postal Code')
-
-        index = 2
-        for row in results:
-            # Corporation.corp_num
-            _ = sheet.cell(column=1, row=index, value=row.corp_num)
-            # Corporation.corp_typ_cd
-            _ = sheet.cell(column=2, row=index, value=row.corp_typ_cd)
-            # CorpName.corp_nme
-            _ = sheet.cell(column=3, row=index, value=row.corp_nme)
-            # Corporation.recognition_dts
-            _ = sheet.cell(column=4, row=index, value=row.recognition_dts)
-            # CorpOpState.state_typ_cd
-            _ = sheet.cell(column=5, row=index, value=row.state_typ_cd)
-            # The company address isn't allowed to be displayed to Director Search users currently.
-            # Address.addr_line_1, Address.addr_line_2, Address.addr_line_3
-            # _ = sheet.cell(column=6, row=index, value=_merge_addr_fields(row))
-            # Address.postal_cd
-            # _ = sheet.cell(column=7, row=index, value=row.postal_cd)
-            index += 1
-
-        current_date = datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d %H:%M:%S')
-        filename = 'Corporation Search Results {date}.xlsx'.format(date=current_date)
-        full_filename_path = '{dir}/{filename}'.format(dir=export_dir, filename=filename)
-        workbook.save(filename=full_filename_path)
-
-        return send_from_directory(export_dir, filename, as_attachment=True)
+    # Fetching results, streamed off a server-side cursor
+    results = get_first_results(Corporation.search_corporations(args, include_addr=False)).yield_per(50)
+
+    rows = (_get_corporation_export_column_values(row) for row in results)
+    return get_export_response(
+        export_format, 'Corporation Search Results', _get_corporation_export_column_headers(), rows)
 
 
 @API.route('/<corp_id>')
@@ -182,9 +184,14 @@ def corporation(corp_id):
     if not corp:
         return jsonify({'message': 'Corporation with id {} could not be found.'.format(corp_id)}), 404
 
-    offices = Office.get_offices_by_corp_id(corp_id)
+    offices = Office.get_offices_by_corp_id(corp_id).all()
     names = CorpName.get_corp_name_by_corp_id(corp_id)
 
+    # The company address isn't allowed to be displayed to Director Search users currently. When it is, normalize
+    # every office's addresses in one query:
+    # addresses = Address.normalize_addrs(
+    #     [office.delivery_addr_id for office in offices] + [office.mailing_addr_id for office in offices])
+
     output = {}
     output['corpNum'] = corp.corp_num
     output['transitionDt'] = corp.transition_dt
@@ -193,8 +200,8 @@ def corporation(corp_id):
         output['offices'].append(
             {
                 # The company address isn't allowed to be displayed to Director Search users currently.
-                # 'deliveryAddr': Address.normalize_addr(office.delivery_addr_id),
-                # 'mailingAddr': Address.normalize_addr(office.mailing_addr_id),
+                # 'deliveryAddr': addresses.get(office.delivery_addr_id, ''),
+                # 'mailingAddr': addresses.get(office.mailing_addr_id, ''),
                 'deliveryAddr': '',
                 'mailingAddr': '',
                 'officeTypCd': _format_office_typ_cd(office.office_typ_cd),
@@ -14,27 +14,29 @@
 
 """API endpoints for searching for and retrieving information about directors (CorpParties)."""
 
-import datetime
+from functools import partial
 from http import HTTPStatus
 import logging
-from tempfile import NamedTemporaryFile
 
-from flask import Blueprint, current_app, request, jsonify, send_from_directory
-from sqlalchemy.sql import literal_column
-from openpyxl import Workbook
+from flask import Blueprint, current_app, g, request, jsonify, send_from_directory
 
 from search_api.auth import jwt, authorized
 from search_api.models.address import Address
 from search_api.models.corp_state import CorpState
 from search_api.models.corp_party import CorpParty
-from search_api.models.party_type import PartyType
 from search_api.models.corp_name import CorpName
 from search_api.models.office import Office
+from search_api.models.reference_data import get_description
+from search_api.utils.export import EXPORT_FORMATS, get_export_response
+from search_api.utils.export_jobs import DONE, ExportJobLimitError, get_export_jobs
 from search_api.utils.model_utils import (
     BadSearchValue,
     _get_corp_party_export_column_headers,
     _get_corp_party_export_column_values,
 )
+from search_api.utils.pagination import MAX_PAGED_RESULTS, get_first_results, get_page, seek
+from search_api.utils.search_cache import get_search_cache, get_search_cache_key
+from search_api.utils.search_count import count_search_results
 from search_api.utils.utils import convert_to_snake_case
 
 logger = logging.getLogger(__name__)
@@ -48,7 +50,7 @@ def corpparty_search():
 
     This function takes any number of field triples in the following format:
     - field={field name}
-    - operator={'exact', 'contains', 'startswith', 'nicknames', 'similar' or 'endswith'}
+    - operator={'exact', 'contains', 'startswith', 'nicknames', 'similar', 'phonetic' or 'endswith'}
     - value={search keyword}
 
     To include Address or CorpOpState info in the search results, set the additional_cols
@@ -59,6 +61,13 @@ def corpparty_search():
     - page={page number}
     - sort_type={'asc' or 'dsc'}
     - sort_value={field name to sort results by}
+
+    A search with similar, nicknames or phonetic clauses is ranked by how well each row matches them. Unsorted, the
+    best matches come first. Sorted or not, the 500 results are the best matches.
+
+    To page with a cursor instead of a page number, pass the `after` argument. An empty value returns the first
+    page, and each response includes the `next_cursor` to pass for the following page (null on the last page).
+    - after={cursor}
     """
     current_app.logger.info('Starting director search')
 
@@ -74,34 +83,79 @@ def corpparty_search():
     args = request.args
     fields = args.getlist('field')
     additional_cols = args.get('additional_cols')
+
+    search_cache = get_search_cache()
+    cache_key = get_search_cache_key('directors', args)
+    response = search_cache.get(cache_key)
+    if response is not None:
+        return jsonify(response)
+
     try:
         results = CorpParty.search_corp_parties(args)
     except BadSearchValue as e:
         return {'results': [], 'error': 'Invalid search: {}'.format(str(e))}
-    current_app.logger.info('Before query')
+
+    per_page = 50
+
+    # Keyset pagination: seek straight to the rows after the cursor, so any page only fetches per_page + 1 rows.
+    if 'after' in args:
+        try:
+            results, next_cursor = seek(results, CorpParty.get_search_sort_keys(args), args.get('after'), per_page)
+        except BadSearchValue as e:
+            return {'results': [], 'error': 'Invalid search: {}'.format(str(e))}
+
+        response = {
+            'results': [_get_corp_party_search_result(row, additional_cols, fields) for row in results],
+            'next_cursor': next_cursor,
+        }
+        search_cache.set(cache_key, response)
+        return jsonify(response)
 
     # Pagination
     page = int(args.get('page')) if 'page' in args else 1
 
-    per_page = 50
-    # Manually paginate results, because flask-sqlalchemy's paginate() method counts the total,
-    # which is slow for large tables. This has been addressed in flask-sqlalchemy but is unreleased.
-    # Ref: https://github.com/pallets/flask-sqlalchemy/pull/613
-    # results = results.limit(per_page).offset((page - 1) * per_page).all()
-    # update:
-    # We've switched to using ROWNUM rather than pagination, for performance reasons.
-    # for benchmarking, dump the query here and copy to benchmark.py
-    # This means queries with more than 500 results are invalid.
-    # from sqlalchemy.dialects import oracle
-    # results = results.limit(per_page).offset((page - 1) * per_page).all()
-    # oracle_dialect = oracle.dialect(max_identifier_length=30)
-    if current_app.config.get('IS_ORACLE'):  # raise Exception(results.statement.compile(dialect=oracle_dialect))
-        results = results.filter(literal_column('rownum') <= 500).yield_per(per_page)
-    else:
-        results = results.limit(500)
-
-    current_app.logger.info('After query')
+    # Fetch only the requested page, of the first 500 results, and don't count them: the total is
+    # corpparty_search_count()'s. For the query plans of the searches, run `python benchmark.py --plans`.
+    # A search with fuzzy clauses returns its 500 most relevant rows, in whatever order it's sorted by.
+    results = CorpParty.get_best_search_results(args, results, MAX_PAGED_RESULTS)
+    corp_parties = [
+        _get_corp_party_search_result(row, additional_cols, fields) for row in get_page(results, page, per_page)
+    ]
+
+    current_app.logger.info('Returning JSON results')
+
+    response = {'results': corp_parties}
+    search_cache.set(cache_key, response)
+    return jsonify(response)
+
+
+@API.route('/count/')
+@jwt.requires_auth
+def corpparty_search_count():
+    """Count the CorpParty search results. Uses the same arguments as corpparty_search().
 
+    Counting is separate from corpparty_search(), so fetching a page of results doesn't pay for it. Very large
+    counts are estimated, in which case num_results_estimated is true.
+    """
+    account_id = request.headers.get('X-Account-Id', None)
+    if not authorized(jwt, account_id):
+        return (
+            jsonify({'message': 'User is not authorized to access Director Search'}),
+            HTTPStatus.UNAUTHORIZED,
+        )
+
+    try:
+        num_results, estimated = count_search_results(CorpParty.search_corp_parties(request.args))
+    except BadSearchValue as e:
+        return {'num_results': 0, 'error': 'Invalid search: {}'.format(str(e))}
+
+    return jsonify({
+        'num_results': num_results,
+        'num_results_estimated': estimated,
+    })
+
+
+def _get_corp_party_search_result(row, additional_cols, fields):
     result_fields = [
         'corpPartyId',
         'firstNme',
@@ -114,32 +168,21 @@ def corpparty_search():
         'partyTypCd',
     ]
 
-    corp_parties = []
-    index = 0
-    for row in results:
-        if (page - 1) * per_page <= index < page * per_page:
-            result_dict = {key: getattr(row, convert_to_snake_case(key)) for key in result_fields}
-            result_dict['corpPartyId'] = int(result_dict['corpPartyId'])
-
-            additional_result_columns = CorpParty.add_additional_cols_to_search_results(additional_cols, fields, row)
-
-            result_dict = {**result_dict, **additional_result_columns}
+    result_dict = {key: getattr(row, convert_to_snake_case(key)) for key in result_fields}
+    result_dict['corpPartyId'] = int(result_dict['corpPartyId'])
 
-            corp_parties.append(result_dict)
-        index += 1
-
-    current_app.logger.info('Returning JSON results')
+    additional_result_columns = CorpParty.add_additional_cols_to_search_results(additional_cols, fields, row)
 
-    return jsonify({
-        'results': corp_parties,
-        'num_results': index
-    })
+    return {**result_dict, **additional_result_columns}
 
 
 @API.route('/export/')
 @jwt.requires_auth
 def corpparty_search_export():
-    """Export a list of CorpParty search results. Uses the same arguments as corpparty_search()."""
+    """Export a list of CorpParty search results. Uses the same arguments as corpparty_search(), plus:
+
+    - format={'xlsx' (the default), 'csv' or 'ndjson'}
+    """
     account_id = request.headers.get('X-Account-Id', None)
     if not authorized(jwt, account_id):
         return (
@@ -149,34 +192,118 @@ def corpparty_search_export():
 
     # Query string arguments
     args = request.args
+    export_format = args.get('format', 'xlsx')
+    if export_format not in EXPORT_FORMATS:
+        return 'Invalid export format: {}'.format(export_format), 400
+
+    # Fetching results, streamed off a server-side cursor
+    results = CorpParty.get_best_search_results(args, CorpParty.search_corp_parties(args), MAX_PAGED_RESULTS)
+    results = get_first_results(results).yield_per(50)
+
+    rows = (_get_corp_party_export_column_values(row, args) for row in results)
+    return get_export_response(
+        export_format, 'Director Search Results', _get_corp_party_export_column_headers(args), rows)
+
+
+@API.route('/export/jobs/', methods=['POST'])
+@jwt.requires_auth
+def create_corpparty_export_job():
+    """Export every result of a CorpParty search in the background, rather than the first 500.
+
+    Takes the same arguments as corpparty_search_export(), in the query string or a form body. Returns the new job's
+    status: poll it at /export/jobs/{job_id}, and once it's done, download the file from
+    /export/jobs/{job_id}/download.
+    """
+    account_id = request.headers.get('X-Account-Id', None)
+    if not authorized(jwt, account_id):
+        return (
+            jsonify({'message': 'User is not authorized to access Director Search'}),
+            HTTPStatus.UNAUTHORIZED,
+        )
+
+    args = request.values.copy()
+    export_format = args.get('format', 'xlsx')
+    if export_format not in EXPORT_FORMATS:
+        return 'Invalid export format: {}'.format(export_format), 400
 
-    # Fetching results
-    results = CorpParty.search_corp_parties(args)
-    if current_app.config.get('IS_ORACLE'):
-        results = results.filter(literal_column('rownum') <= 500).yield_per(50)
-    else:
-        results = results.limit(500)
+    try:
+        CorpParty.search_corp_parties(args)
+    except BadSearchValue as e:
+        return 'Invalid search: {}'.format(str(e)), 400
 
-    # Exporting to Excel
-    workbook = Workbook()
+    try:
+        job = get_export_jobs().submit(
+            account_id,
+            g.jwt_oidc_token_info.get('sub'),
+            export_format,
+            partial(_search_for_export_job, args),
+            _get_corp_party_export_column_headers(args),
+            partial(_get_corp_party_export_column_values, args=args),
+        )
+    except ExportJobLimitError as e:
+        return jsonify({'message': str(e)}), HTTPStatus.TOO_MANY_REQUESTS
 
-    export_dir = '/tmp'
-    with NamedTemporaryFile(mode='w+b', dir=export_dir, delete=True):
+    return jsonify(_get_export_job_result(job)), HTTPStatus.ACCEPTED
 
-        sheet = workbook.active
 
-        for index, column_header in enumerate(_get_corp_party_export_column_headers(args), start=1):
-            _ = sheet.cell(column=index, row=1, value=column_header)
+@API.route('/export/jobs/<job_id>')
+@jwt.requires_auth
+def get_corpparty_export_job(job_id):
+    """Get the status and progress of an export job."""
+    job = _get_own_export_job(job_id)
+    if not job:
+        return jsonify({'message': 'Export job {} could not be found.'.format(job_id)}), HTTPStatus.NOT_FOUND
 
-        for row_index, row in enumerate(results, start=2):
-            for column_index, column_value in enumerate(_get_corp_party_export_column_values(row, args), start=1):
-                _ = sheet.cell(column=column_index, row=row_index, value=column_value)
+    return jsonify(_get_export_job_result(job))
 
-        current_date = datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d %H:%M:%S')
-        filename = 'Director Search Results {date}.xlsx'.format(date=current_date)
-        workbook.save(filename='{dir}/{filename}'.format(dir=export_dir, filename=filename))
 
-        return send_from_directory(export_dir, filename, as_attachment=True)
+@API.route('/export/jobs/<job_id>/download')
+@jwt.requires_auth
+def download_corpparty_export_job(job_id):
+    """Download the file of a finished export job."""
+    job = _get_own_export_job(job_id)
+    if not job:
+        return jsonify({'message': 'Export job {} could not be found.'.format(job_id)}), HTTPStatus.NOT_FOUND
+
+    if job['status'] != DONE:
+        return jsonify({'message': 'Export job {} is {}.'.format(job_id, job['status'])}), HTTPStatus.CONFLICT
+
+    export_jobs = get_export_jobs()
+    _, mimetype, extension = EXPORT_FORMATS[job['format']]
+    return send_from_directory(
+        export_jobs.job_dir,
+        export_jobs.get_filename(job),
+        as_attachment=True,
+        attachment_filename='Director Search Results {}.{}'.format(job['created'][:19], extension),
+        mimetype=mimetype,
+    )
+
+
+def _search_for_export_job(args):
+    """Return an export job's search query and sort keys. It's run by the job, in the export job pool."""
+    return CorpParty.search_corp_parties(args), CorpParty.get_search_sort_keys(args)
+
+
+def _get_own_export_job(job_id):
+    """Return an export job, if it belongs to the current user."""
+    job = get_export_jobs().get(job_id)
+    if not job or job['owner'] != g.jwt_oidc_token_info.get('sub'):
+        return None
+    return job
+
+
+def _get_export_job_result(job):
+    return {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'format': job['format'],
+        'rows_written': job['rows_written'],
+        'total': job['total'],
+        'total_estimated': job['total_estimated'],
+        'created': job['created'],
+        'updated': job['updated'],
+        'error': job['error'],
+    }
 
 
 @API.route('/<corp_party_id>')
@@ -190,7 +317,8 @@ def get_corp_party_by_id(corp_party_id):
             HTTPStatus.UNAUTHORIZED,
         )
 
-    result = CorpParty.get_corporation_info_by_corp_party_id(corp_party_id)
+    # The detail is loaded in a fixed number of queries, however many offices the corporation has.
+    result = CorpParty.get_corp_party_detail_by_id(corp_party_id)
 
     if not result:
         return jsonify({'message': 'Director with id {} could not be found.'.format(corp_party_id)}), 404
@@ -198,17 +326,22 @@ def get_corp_party_by_id(corp_party_id):
     person = result[0]
     result_dict = {}
 
-    filing_description = CorpParty.get_filing_description_by_corp_party_id(corp_party_id)
-
     name = CorpName.get_corp_name_by_corp_id(person.corp_num)[0]
-    offices = Office.get_offices_by_corp_id(person.corp_num)
-    delivery_addr = Address.normalize_addr(person.delivery_addr_id)
-    mailing_addr = Address.normalize_addr(person.mailing_addr_id)
+    offices = Office.get_offices_by_corp_id(person.corp_num).all()
+
+    # Normalize every address the detail shows, the person's and their corporation's offices', in one query.
+    addresses = Address.normalize_addrs(
+        [person.delivery_addr_id, person.mailing_addr_id] +
+        [office.delivery_addr_id for office in offices] +
+        [office.mailing_addr_id for office in offices])
+
+    delivery_addr = addresses.get(person.delivery_addr_id, '')
+    mailing_addr = addresses.get(person.mailing_addr_id, '')
 
     states = CorpState.get_corp_states_by_corp_id(person.corp_num)
 
-    corp_delivery_addr = ';'.join([Address.normalize_addr(office.delivery_addr_id) for office in offices])
-    corp_mailing_addr = ';'.join([Address.normalize_addr(office.mailing_addr_id) for office in offices])
+    corp_delivery_addr = ';'.join([addresses.get(office.delivery_addr_id, '') for office in offices])
+    corp_mailing_addr = ';'.join([addresses.get(office.mailing_addr_id, '') for office in offices])
 
     result_dict['corpPartyId'] = int(person.corp_party_id)
     result_dict['firstNme'] = person.first_nme
@@ -219,8 +352,7 @@ def get_corp_party_by_id(corp_party_id):
     result_dict['corpNum'] = person.corp_num
     result_dict['corpNme'] = name.corp_nme
     result_dict['partyTypCd'] = person.party_typ_cd
-    result_dict['partyTypeDesc'] = PartyType.query.filter(
-        PartyType.party_typ_cd == person.party_typ_cd).one().short_desc
+    result_dict['partyTypeDesc'] = get_description('party_type', person.party_typ_cd)
     result_dict['corpPartyEmail'] = person.email_address
     result_dict['deliveryAddr'] = delivery_addr
     result_dict['mailingAddr'] = mailing_addr
@@ -228,11 +360,11 @@ def get_corp_party_by_id(corp_party_id):
     result_dict['corpMailingAddr'] = corp_mailing_addr
     result_dict['corpTypCd'] = result.corp_typ_cd
     result_dict['corpAdminEmail'] = result.admin_email
-    result_dict['fullDesc'] = filing_description[0].full_desc if filing_description else None
+    result_dict['fullDesc'] = get_description('filing_type', result.filing_typ_cd, 'full_desc')
 
     result_dict['states'] = [s.as_dict() for s in states]
 
-    offices_held = _get_offices_held_by_corp_party(corp_party_id)
+    offices_held = _get_offices_held_by_corp_party(corp_party_id, person)
 
     incorporator_name_types = [
         'APP',
@@ -258,7 +390,7 @@ def get_corp_party_by_id(corp_party_id):
     return jsonify({**result_dict, **offices_held})
 
 
-def _get_offices_held_by_corp_party(corp_party_id):
+def _get_offices_held_by_corp_party(corp_party_id, person=None):
     results = CorpParty.get_offices_held_by_corp_party_id(corp_party_id)
 
     if len(results) == 0:
@@ -270,14 +402,14 @@ def _get_offices_held_by_corp_party(corp_party_id):
 
         result_dict['corpPartyId'] = int(row.corp_party_id)
         result_dict['officerTypCd'] = row.officer_typ_cd
-        result_dict['shortDesc'] = row.short_desc
+        result_dict['shortDesc'] = get_description('officer_type', row.officer_typ_cd)
         result_dict['appointmentDt'] = row.appointment_dt
         result_dict['year'] = row.event_timestmp.year if row.event_timestmp else None
 
         offices.append(result_dict)
 
-    same_addr = CorpParty.get_corp_party_at_same_addr(corp_party_id)
-    same_name_and_company = CorpParty.get_corp_party_same_name_at_same_addr(corp_party_id)
+    same_addr = CorpParty.get_corp_party_at_same_addr(corp_party_id, person)
+    same_name_and_company = CorpParty.get_corp_party_same_name_at_same_addr(corp_party_id, person)
 
     results = {
         'offices': offices,
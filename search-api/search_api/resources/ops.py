@@ -15,10 +15,16 @@
 from http import HTTPStatus
 import time
 
-from flask import Blueprint, current_app
+from flask import Blueprint, Response, current_app
 from sqlalchemy import exc
 
+from search_api.auth import jwt
+from search_api.constants import OPS_ROLE
 from search_api.models.base import db
+from search_api.models.nickname import NickName
+from search_api.models.reference_data import get_reference_data
+from search_api.utils.metrics import get_metrics
+from search_api.utils.search_cache import get_search_cache
 
 
 API = Blueprint('OPS', __name__, url_prefix='/ops')
@@ -45,6 +51,48 @@ def sleepz():
     return {'message': 'api slept'}, HTTPStatus.OK
 
 
+@API.route('/nicknames/refresh', methods=['POST'])
+@jwt.requires_auth
+@jwt.has_one_of_roles([OPS_ROLE])
+def refresh_nicknames():
+    """Reload this worker's in-memory copy of the nickname table, and the other workers' when they next use it."""
+    try:
+        count = NickName.refresh_nicknames()
+    except exc.SQLAlchemyError:
+        return {'message': 'api is down'}, HTTPStatus.SERVICE_UNAVAILABLE
+
+    return {'message': 'nicknames refreshed', 'count': count}, HTTPStatus.OK
+
+
+@API.route('/reference-data/refresh', methods=['POST'])
+@jwt.requires_auth
+@jwt.has_one_of_roles([OPS_ROLE])
+def refresh_reference_data():
+    """Reload this worker's in-memory copy of the code tables, and the others' when they next use them.
+
+    Return this worker's new version.
+    """
+    try:
+        version = get_reference_data().refresh()
+    except exc.SQLAlchemyError:
+        return {'message': 'api is down'}, HTTPStatus.SERVICE_UNAVAILABLE
+
+    return {'message': 'reference data refreshed', 'version': version}, HTTPStatus.OK
+
+
+@API.route('/search-cache')
+def search_cache_stats():
+    """Return this worker's search cache hit and miss counts."""
+    return get_search_cache().get_stats(), HTTPStatus.OK
+
+
+@API.route('/metrics')
+def metrics():
+    """Return the Prometheus metrics: request, auth api and export latency, connection pool use and cache hits."""
+    data, content_type = get_metrics()
+    return Response(data, content_type=content_type)
+
+
 @API.route('/healthz')
 def healthz():
     """Return a JSON object stating the health of the Service and dependencies."""
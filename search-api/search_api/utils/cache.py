@@ -0,0 +1,120 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Small in-process caches shared by the API."""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """A thread-safe, size-bounded LRU cache whose entries expire after a time-to-live (in seconds)."""
+
+    def __init__(self, maxsize, ttl):
+        """Create a cache holding at most `maxsize` entries, each for `ttl` seconds by default."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the value cached for key, or default if it is missing or has expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Cache value for key, for ttl seconds if given, or the cache's default ttl otherwise."""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Remove key from the cache, if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        """Return the number of entries, including any that have expired but not been evicted yet."""
+        return len(self._entries)
+
+
+class _Flight:  # pylint: disable=too-few-public-methods
+    """A call in progress, and its outcome once done."""
+
+    def __init__(self):
+        """Create an in-progress call."""
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key, so only one runs and every caller shares its outcome.
+
+    Uses threading primitives, which gevent patches, so it coalesces greenlets as well as threads.
+    """
+
+    def __init__(self):
+        """Create a SingleFlight with no calls in progress."""
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """Return func(*args, **kwargs), or wait for and return the outcome of the same call already in progress.
+
+        If the call raises, every caller waiting on it gets the same exception.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func(*args, **kwargs)
+            return flight.result
+        except Exception as err:
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
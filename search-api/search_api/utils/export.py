@@ -0,0 +1,101 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Stream search results as a download, in any of the EXPORT_FORMATS.
+
+Each format is written a chunk of rows at a time as the rows are fetched, so the response starts before the query
+finishes and memory use doesn't grow with the number of rows.
+"""
+
+import csv
+import datetime
+import io
+import json
+import time
+
+from flask import Response, stream_with_context
+
+from search_api.utils.metrics import EXPORT_DURATION
+from search_api.utils.xlsx import MIMETYPE as XLSX_MIMETYPE, ROWS_PER_CHUNK, stream_xlsx
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def stream_csv(headers, rows):
+    """Yield the bytes of a CSV file: a row of headers, then each of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def drain():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(headers)
+    yield drain()
+
+    for row_number, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if row_number % ROWS_PER_CHUNK == 0:
+            yield drain()
+
+    yield drain()
+
+
+def stream_ndjson(headers, rows):
+    """Yield the bytes of a newline-delimited JSON file: an object per row, keyed by headers."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(headers, row)), default=_json_default))
+        if len(lines) == ROWS_PER_CHUNK:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+# Each format's writer, mimetype and file extension.
+EXPORT_FORMATS = {
+    'xlsx': (stream_xlsx, XLSX_MIMETYPE, 'xlsx'),
+    'csv': (stream_csv, 'text/csv', 'csv'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson', 'ndjson'),
+}
+
+
+def _timed(export_format, chunks):
+    start = time.perf_counter()
+    yield from chunks
+    EXPORT_DURATION.labels('stream', export_format).observe(time.perf_counter() - start)
+
+
+def get_export_response(export_format, title, headers, rows):
+    """Return a streamed download of rows in export_format, named after title and the current time.
+
+    Each row is a sequence of values in the same order as headers. export_format must be in EXPORT_FORMATS.
+    """
+    writer, mimetype, extension = EXPORT_FORMATS[export_format]
+
+    current_date = datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d %H:%M:%S')
+    filename = '{title} {date}.{extension}'.format(title=title, date=current_date, extension=extension)
+
+    return Response(
+        stream_with_context(_timed(export_format, writer(headers, rows))),
+        mimetype=mimetype,
+        headers={'Content-Disposition': 'attachment; filename="{}"'.format(filename)},
+    )
@@ -0,0 +1,272 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Run exports too large for a request (the export endpoints stop at 500 rows) as background jobs.
+
+A job pages through the whole search with keyset pagination, writing each page to its file as it goes, on a pool
+of EXPORT_JOB_WORKERS processes. They're started with spawn rather than fork, so they don't inherit the gevent
+monkey patching of a gunicorn worker: a job's database fetches and file encoding never yield, and would hold up every
+request on the worker if they ran in its event loop. A job's search and row functions are sent to the pool, so they
+must be picklable (module level functions, or partials of them).
+
+Each job's status is kept as JSON next to its file in EXPORT_JOB_DIR, so any worker on the host can report on the
+job and serve its file. Each account can have at most EXPORT_JOB_ACCOUNT_LIMIT jobs queued or running at once, which
+is checked under a lock file in EXPORT_JOB_DIR so it holds across the workers, and jobs are deleted EXPORT_JOB_TTL
+seconds after they were last updated.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import datetime
+import fcntl
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+import uuid
+
+from flask import current_app
+
+from search_api.models.base import db
+from search_api.utils.export import EXPORT_FORMATS
+from search_api.utils.metrics import EXPORT_DURATION
+from search_api.utils.pagination import seek
+from search_api.utils.search_count import count_search_results
+
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_JOB_ID = re.compile('^[0-9a-f]{32}$')
+
+# A dotfile, so _delete_expired() never removes it from under a worker that has it locked.
+_LOCK_FILE = '.submit.lock'
+
+
+class ExportJobLimitError(Exception):
+    """Exception class for an account that already has as many export jobs as it's allowed."""
+
+    pass  # pylint: disable=unnecessary-pass
+
+
+class ExportJobs:
+    """Submit export jobs, and look up their status and files."""
+
+    def __init__(self, run_mode, job_dir, max_workers, account_limit, page_size, ttl, stale_after):
+        """Create a pool of max_workers processes to run jobs, each with an app for run_mode.
+
+        With no workers, jobs run as they're submitted, in the current app context.
+        """
+        self.job_dir = job_dir
+        self.account_limit = account_limit
+        self.page_size = page_size
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self._executor = ProcessPoolExecutor(
+            max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(run_mode,),
+        ) if max_workers else None
+
+        os.makedirs(job_dir, exist_ok=True)
+
+    def submit(self, account_id, owner, export_format, search, headers, get_values):
+        """Queue an export job, and return its status.
+
+        :param search: a picklable function that returns the search query and its sort keys, as for seek().
+        :param headers: the export's column headers.
+        :param get_values: a picklable function that returns the export's column values for a row of the search.
+        :raises ExportJobLimitError: if the account already has EXPORT_JOB_ACCOUNT_LIMIT jobs queued or running.
+        """
+        with self._locked():
+            self._delete_expired()
+            active = [
+                job for job in self._load_all()
+                if job['account_id'] == account_id and job['status'] in (QUEUED, RUNNING)
+            ]
+            if len(active) >= self.account_limit:
+                raise ExportJobLimitError(
+                    'There can be at most {} export jobs in progress at once.'.format(self.account_limit))
+
+            now = _now()
+            job = {
+                'job_id': uuid.uuid4().hex,
+                'account_id': account_id,
+                'owner': owner,
+                'format': export_format,
+                'status': QUEUED,
+                'rows_written': 0,
+                'total': None,
+                'total_estimated': None,
+                'created': now,
+                'updated': now,
+                'error': None,
+            }
+            self._save(job)
+
+        if self._executor:
+            self._executor.submit(_run_in_worker, self.job_dir, self.page_size, job, search, headers, get_values)
+        else:
+            _run(self.job_dir, self.page_size, job, search, headers, get_values)
+
+        return self.get(job['job_id'])
+
+    def get(self, job_id):
+        """Return a job's status, or None if there is no such job."""
+        if not _JOB_ID.match(job_id):
+            return None
+        try:
+            return self._load(self._get_status_path(job_id))
+        except (OSError, ValueError):
+            return None
+
+    def get_filename(self, job):  # pylint: disable=no-self-use
+        """Return the name of a job's file, in job_dir."""
+        return _get_filename(job)
+
+    @contextmanager
+    def _locked(self):
+        """Hold an exclusive lock on the job directory, for every thread and process that submits jobs to it."""
+        with open(os.path.join(self.job_dir, _LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _get_status_path(self, job_id):
+        return _get_status_path(self.job_dir, job_id)
+
+    def _load(self, status_path):
+        with open(status_path) as status_file:
+            job = json.load(status_file)
+
+        # A job that hasn't been updated in a while was abandoned by a worker that stopped.
+        if job['status'] in (QUEUED, RUNNING) and time.time() - os.path.getmtime(status_path) > self.stale_after:
+            job['status'], job['error'] = FAILED, 'The export was interrupted.'
+        return job
+
+    def _load_all(self):
+        jobs = []
+        for status_path in glob.glob(os.path.join(self.job_dir, '*.json')):
+            try:
+                jobs.append(self._load(status_path))
+            except (OSError, ValueError):
+                pass
+        return jobs
+
+    def _save(self, job):
+        _save(self.job_dir, job)
+
+    def _delete_expired(self):
+        for path in glob.glob(os.path.join(self.job_dir, '*')):
+            try:
+                if time.time() - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def _init_worker(run_mode):
+    """Give a pool process an app context of its own, for the jobs it runs."""
+    from search_api import create_app  # pylint: disable=import-outside-toplevel, cyclic-import
+
+    create_app(run_mode).app_context().push()
+
+
+def _run_in_worker(*args):
+    """Run a job in a pool process, and end its database session."""
+    try:
+        _run(*args)
+    finally:
+        db.session.remove()
+
+
+def _run(job_dir, page_size, job, search, headers, get_values):
+    writer = EXPORT_FORMATS[job['format']][0]
+    path = os.path.join(job_dir, _get_filename(job))
+    start = time.perf_counter()
+
+    try:
+        query, keys = search()
+        total, estimated = count_search_results(query)
+        _update(job_dir, job, status=RUNNING, total=total, total_estimated=estimated)
+
+        def rows():
+            cursor = ''
+            while cursor is not None:
+                page, cursor = seek(query, keys, cursor, page_size)
+                for row in page:
+                    yield get_values(row)
+                _update(job_dir, job, rows_written=job['rows_written'] + len(page))
+
+        with open(path + '.part', 'wb') as export_file:
+            for chunk in writer(headers, rows()):
+                export_file.write(chunk)
+        os.replace(path + '.part', path)
+
+        _update(job_dir, job, status=DONE)
+        EXPORT_DURATION.labels('job', job['format']).observe(time.perf_counter() - start)
+    except Exception as err:  # pylint: disable=broad-except
+        logger.exception('Export job %s failed', job['job_id'])
+        _update(job_dir, job, status=FAILED, error=str(err))
+        if os.path.exists(path + '.part'):
+            os.remove(path + '.part')
+
+
+def _get_filename(job):
+    return '{}.{}'.format(job['job_id'], EXPORT_FORMATS[job['format']][2])
+
+
+def _get_status_path(job_dir, job_id):
+    return os.path.join(job_dir, '{}.json'.format(job_id))
+
+
+def _save(job_dir, job):
+    status_path = _get_status_path(job_dir, job['job_id'])
+    with open(status_path + '.part', 'w') as status_file:
+        json.dump(job, status_file)
+    os.replace(status_path + '.part', status_path)
+
+
+def _update(job_dir, job, **changes):
+    job.update(changes, updated=_now())
+    _save(job_dir, job)
+
+
+def _now():
+    return datetime.datetime.utcnow().isoformat()
+
+
+def get_export_jobs():
+    """Return this process's ExportJobs."""
+    if 'export_jobs' not in current_app.extensions:
+        config = current_app.config
+        current_app.extensions['export_jobs'] = ExportJobs(
+            config.get('RUN_MODE'),
+            config.get('EXPORT_JOB_DIR'),
+            config.get('EXPORT_JOB_WORKERS', 2),
+            config.get('EXPORT_JOB_ACCOUNT_LIMIT', 2),
+            config.get('EXPORT_JOB_PAGE_SIZE', 1000),
+            config.get('EXPORT_JOB_TTL', 86400),
+            config.get('EXPORT_JOB_STALE_AFTER', 900),
+        )
+    return current_app.extensions['export_jobs']
@@ -0,0 +1,126 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Prometheus metrics for GET /ops/metrics.
+
+Each gunicorn worker keeps its own metrics. To report them for every worker rather than whichever one serves the
+scrape, the prometheus_multiproc_dir environment variable names an empty directory: each worker then writes its
+metrics to files there, and /ops/metrics adds them up. gunicorn_config.py, which both ways of starting the API
+load (command-prod.sh and s2i's APP_CONFIG), sets it, empties it as gunicorn starts, and removes a stopped worker's
+gauges.
+"""
+
+import os
+import threading
+import time
+
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess)
+from sqlalchemy import event
+
+
+REQUEST_LATENCY = Histogram(
+    'search_api_request_duration_seconds', 'Time to handle a request, until its response starts.',
+    ['blueprint', 'route', 'method', 'status'])
+
+DB_POOL_WAIT = Histogram(
+    'search_api_db_pool_wait_seconds', 'Time waiting for a database connection from the pool.',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30))
+DB_POOL_CHECKED_OUT = Gauge(
+    'search_api_db_pool_checked_out', 'Database connections in use.', multiprocess_mode='livesum')
+DB_POOL_OVERFLOW = Gauge(
+    'search_api_db_pool_overflow', 'Database connections open beyond the pool size.', multiprocess_mode='livesum')
+
+CACHE_LOOKUPS = Counter('search_api_cache_lookups_total', 'Cache lookups, by cache and result.', ['cache', 'result'])
+
+AUTH_API_LATENCY = Histogram('search_api_auth_api_request_duration_seconds', 'Time for an auth api request.')
+
+EXPORT_DURATION = Histogram(
+    'search_api_export_duration_seconds', 'Time to write an export, by kind (stream or job) and format.',
+    ['kind', 'format'], buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600))
+
+# The seconds each thread (or greenlet, under gevent) has waited for database connections.
+_POOL_WAITS = threading.local()
+
+
+def get_pool_wait():
+    """Return the seconds the current thread has waited for database connections, as DB_POOL_WAIT observed them."""
+    return getattr(_POOL_WAITS, 'seconds', 0)
+
+
+def count_cache_lookup(cache, hit):
+    """Count a lookup in the named cache."""
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def _update_pool_gauges(pool):
+    # Only QueuePool counts its connections.
+    if hasattr(pool, 'overflow'):
+        DB_POOL_CHECKED_OUT.set(pool.checkedout())
+        DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+
+def instrument_pool(pool):
+    """Time the connection checkouts of an engine's pool, and count its connections.
+
+    Call it as the engine is created (see search_api/models/base.py), so the first checkout is timed too.
+    """
+    if getattr(pool, 'metrics_instrumented', False):
+        return
+    pool.metrics_instrumented = True
+
+    # SQLAlchemy has no event before a checkout, so time the pool's connect() itself.
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            connection = connect()
+        finally:
+            wait = time.perf_counter() - start
+            DB_POOL_WAIT.observe(wait)
+            _POOL_WAITS.seconds = getattr(_POOL_WAITS, 'seconds', 0) + wait
+        _update_pool_gauges(pool)
+        return connection
+
+    pool.connect = timed_connect
+    event.listen(pool, 'checkin', lambda *args: _update_pool_gauges(pool))
+
+
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+def _observe_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unknown'
+        REQUEST_LATENCY.labels(request.blueprint or '', route, request.method, response.status_code).observe(
+            time.perf_counter() - start)
+    return response
+
+
+def get_metrics():
+    """Return the metrics in Prometheus' text format, for every worker if prometheus_multiproc_dir is set."""
+    registry = REGISTRY
+    if 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def init_app(app):
+    """Time the app's requests."""
+    app.before_request(_start_request_timer)
+    app.after_request(_observe_request)
@@ -13,12 +13,42 @@
 # limitations under the License.
 """This module holds utility functions related to model fields and serialization."""
 
+from functools import reduce
+
 from flask import current_app
-from sqlalchemy import func, literal_column
+from sqlalchemy import false, func, literal_column
+from sqlalchemy.sql.expression import case
 
 from search_api.constants import STATE_TYP_CD_ACT, STATE_TYP_CD_HIS, ADDITIONAL_COLS_ADDRESS, ADDITIONAL_COLS_ACTIVE
 from search_api.utils.utils import convert_to_snake_case
+from search_api.models.base import db
+from search_api.models.name_key import NameKey, get_soundex
 from search_api.models.nickname import NickName
+from search_api.models.name_gram import NameGram
+from search_api.utils.similarity import (
+    SCORED_OPERATORS,
+    SIMILARITY_THRESHOLD,
+    get_phonetic_search_expr,
+    get_score_expr,
+    get_similar_search_expr,
+    is_name_table_filled,
+)
+
+
+# The fields anyNme searches.
+NAME_FIELDS = ('firstNme', 'middleNme', 'lastNme')
+
+# The fields the similar operator searches with the name_gram table.
+SIMILAR_FIELDS = NAME_FIELDS
+
+# The fields the phonetic operator searches, by the Soundex keys in the name_key table. For anyNme, it searches
+# these alone.
+PHONETIC_FIELDS = ('firstNme', 'lastNme')
+
+
+def _get_name_fields(operator):
+    """Return the fields anyNme searches with an operator."""
+    return PHONETIC_FIELDS if operator == 'phonetic' else NAME_FIELDS
 
 
 def _merge_addr_fields(row):
@@ -30,6 +60,40 @@ def _merge_addr_fields(row):
     return address
 
 
+def _normalize_postal_cd(field):
+    """Return an expression of field upper-cased and without spaces, so 'v8w 1a1' and 'V8W1A1' are the same."""
+    return func.replace(func.upper(field), ' ', '')
+
+
+def _get_upper_index(name, column, where=None):
+    """Return an index of upper(column), which the search filters and sorts on, for a model's __table_args__.
+
+    On Postgres it uses text_pattern_ops, so startswith (LIKE 'X%') can use it as well as exact, whatever the
+    database's collation. Set where to index only the rows the search considers.
+    """
+    label = 'upper_{}'.format(column.name)
+    return db.Index(
+        name, func.upper(column).label(label),
+        postgresql_ops={label: 'text_pattern_ops'}, postgresql_where=where, sqlite_where=where)
+
+
+def _get_trigram_index(name, column, where=None, upper_cased=False):
+    """Return a pg_trgm GIN index of upper(column), which serves its LIKE '%X%' searches, for __table_args__.
+
+    Set upper_cased to index the column as it is, by name, as the corp_party_search columns are already
+    upper-cased. The pg_trgm extension is installed by migration d4b1f7e2c386. These are Postgres indexes: on
+    SQLite, where a plain index would duplicate the upper() one, the index is empty (WHERE 0) and never used.
+    """
+    options = {'postgresql_using': 'gin', 'sqlite_where': false()}
+    if upper_cased:
+        return db.Index(name, column, postgresql_ops={column: 'gin_trgm_ops'}, **options)
+
+    label = 'upper_{}'.format(column.name)
+    return db.Index(
+        name, func.upper(column).label(label), postgresql_ops={label: 'gin_trgm_ops'}, postgresql_where=where,
+        **options)
+
+
 def _is_addr_search(fields):
     return 'addrLine1' in fields or 'addr' in fields or 'postalCd' in fields
 
@@ -57,15 +121,37 @@ def _get_model_by_field(field_name):
     raise Exception('invalid field: {}'.format(field_name))
 
 
-def _get_filter(field_name, operator, value, end_recursion=False):
-    """Generate a SQL search expression given a filter specified by the user."""
+def _get_search_table_field(field_name):
+    """Return the corp_party_search column for a field, and whether it is already upper-cased."""
+    # local import to prevent circular import
+    from search_api.models.corp_party_search import CorpPartySearch  # noqa # pylint: disable=import-outside-toplevel, cyclic-import
+
+    columns = CorpPartySearch.__table__.columns
+    column_name = convert_to_snake_case(field_name)
+
+    if 'upper_' + column_name in columns:
+        return getattr(CorpPartySearch, 'upper_' + column_name), True
+    if column_name in columns:
+        return getattr(CorpPartySearch, column_name), False
+
+    raise Exception('invalid field: {}'.format(field_name))
+
+
+def _get_filter(field_name, operator, value, end_recursion=False, denormalized=False):
+    """Generate a SQL search expression given a filter specified by the user.
+
+    Set denormalized to search the corp_party_search table instead of the tables it's built from.
+    """
     value = value.upper()
 
     if field_name == 'anyNme':
-        return (
-            _get_filter('firstNme', operator, value) |
-            _get_filter('middleNme', operator, value) |
-            _get_filter('lastNme', operator, value))
+        return reduce(
+            lambda accumulator, name_filter: accumulator | name_filter,
+            [_get_filter(name, operator, value, denormalized=denormalized) for name in _get_name_fields(operator)])
+
+    if field_name == 'addr' and denormalized:
+        # The address lines are merged into one column.
+        return _generate_field_filter(_get_search_table_field('addr')[0], 'text', value, upper_cased=True)
 
     # This currently hangs, so we never call it from the front-end.
     # It seems a boolean OR with multiple CONTAINS() calls in Oracle does not resolve currently.
@@ -87,54 +173,157 @@ def _get_filter(field_name, operator, value, end_recursion=False):
             operator = 'excludes'
             value = STATE_TYP_CD_ACT
 
+    if field_name == 'postalCd' and denormalized:
+        # The postal codes are stored without spaces.
+        value = value.replace(' ', '')
+        return _generate_field_filter(_get_search_table_field('postalCd')[0], 'exact', value, upper_cased=True)
+
+    if field_name == 'postalCd' and not current_app.config.get('IS_ORACLE'):
+        # As the postal code index is normalized.
+        from search_api.models.address import Address  # pylint: disable=import-outside-toplevel
+
+        if len(value) < 2:
+            raise BadSearchValue('Search value must be at least 2 letters long.')
+        return _normalize_postal_cd(Address.postal_cd) == value.replace(' ', '')
+
     if field_name == 'postalCd' and not end_recursion:
         return (
             _get_filter('postalCd', 'exact', value[:3] + ' ' + value[3:6], True) |
             _get_filter('postalCd', 'exact', value, True))
 
-    model = _get_model_by_field(field_name)
+    field, upper_cased = _get_field(field_name, denormalized)
 
     if len(value) < 2:
         raise BadSearchValue('Search value must be at least 2 letters long.')
 
-    if model:
-        field = getattr(model, convert_to_snake_case(field_name))
-        return _generate_field_filter(field, operator, value)
+    if operator == 'similar' and _is_similar_indexed(field_name):
+        return get_similar_search_expr(field, value, upper_cased)
 
-    raise Exception('invalid field: {}'.format(field_name))
+    if operator == 'phonetic':
+        return _get_phonetic_filter(field_name, field, value, upper_cased, denormalized)
+
+    return _generate_field_filter(field, operator, value, upper_cased)
 
 
-def _generate_field_filter(field, operator, value):
+def _is_similar_indexed(field_name):
+    """Return whether the similar search of a field can use the name_gram table, rather than utl_match."""
+    return field_name in SIMILAR_FIELDS and is_name_table_filled(NameGram)
+
+
+def _get_field(field_name, denormalized=False):
+    """Return the column a field searches, and whether it is already upper-cased."""
+    if denormalized:
+        return _get_search_table_field(field_name)
+    return getattr(_get_model_by_field(field_name), convert_to_snake_case(field_name)), False
+
+
+def _get_phonetic_filter(field_name, field, value, upper_cased, denormalized):
+    """Return an expression matching the names in field that sound like value: that have the same Soundex key.
+
+    They're the most similar of the names with the key, as they're scored (see get_phonetic_names). corp_party_search
+    has the keys of the first and last names, so those are compared to the value's key as well. It needs the
+    name_key table, which isn't part of the COLIN schema on Oracle.
+    """
+    if field_name not in PHONETIC_FIELDS:
+        raise BadSearchValue('Only first and last names can be searched by how they sound.')
+    if not is_name_table_filled(NameKey):
+        raise BadSearchValue('Searching names by how they sound is not available.')
+    if not get_soundex(value):
+        raise BadSearchValue('Search value must have at least one letter.')
+
+    if denormalized:
+        # local import to prevent circular import
+        from search_api.models.corp_party_search import CorpPartySearch  # noqa # pylint: disable=import-outside-toplevel, cyclic-import
+
+        # The key narrows the rows through its index, to those of the names the search matches.
+        key_column = getattr(CorpPartySearch, convert_to_snake_case(field_name) + '_key')
+        return (key_column == get_soundex(value)) & get_phonetic_search_expr(field, value.upper(), upper_cased)
+
+    return get_phonetic_search_expr(field, value.upper(), upper_cased)
+
+
+def _get_similarity_score(clauses, denormalized=False):
+    """Return an expression of a row's relevance to the fuzzy clauses on names, or None if there are none.
+
+    It's the sum of the scores of the similar, nicknames and phonetic clauses: how similar the row's name is to each
+    clause's value, from 1 to 100 if the clause matches it, otherwise 0. See search_api.utils.similarity.
+    """
+    scores = []
+    for field_name, operator, value in clauses:
+        if operator not in SCORED_OPERATORS:
+            continue
+        for name in _get_name_fields(operator) if field_name == 'anyNme' else (field_name,):
+            if name in _get_name_fields(operator):
+                field, upper_cased = _get_field(name, denormalized)
+                if operator == 'similar' and not _is_similar_indexed(name):
+                    # As the filter does: score with utl_match, and 0 for the rows it doesn't match.
+                    similarity = func.utl_match.jaro_winkler_similarity(field, value.upper())
+                    scores.append(case([(similarity > SIMILARITY_THRESHOLD, similarity)], else_=0))
+                else:
+                    scores.append(get_score_expr(operator, field, value.upper(), upper_cased))
+
+    return reduce(lambda accumulator, score: accumulator + score, scores) if scores else None
+
+
+def _get_filters(clauses, mode, denormalized=False):
+    """Combine the filters of (field, operator, value) clauses: with AND for mode=ALL, otherwise with OR."""
+    # Determine if we will combine clauses with OR or AND. mode=ALL means we use AND. Default mode is OR
+    if mode == 'ALL':
+
+        def filter_reducer(accumulator, filter_value):
+            return accumulator & _get_filter(*filter_value, denormalized=denormalized)
+
+    else:
+
+        def filter_reducer(accumulator, filter_value):
+            return accumulator | _get_filter(*filter_value, denormalized=denormalized)
+
+    # We use reduce here to join all the items in clauses with the & operator or the | operator.
+    # Similar to if we did "|".join(clause), but calling the boolean operator instead.
+    return reduce(filter_reducer, clauses[1:], _get_filter(*clauses[0], denormalized=denormalized))
+
+
+def _contains(upper_field, value):
+    """Return an expression matching an upper-cased field that contains value.
+
+    On Postgres, the pg_trgm (trigram) GIN indexes of the upper-cased columns serve this LIKE, as they do endswith
+    and wildcard, so it doesn't scan the table. They need values of at least 3 characters to narrow the search.
+    """
+    return upper_field.like('%' + value + '%')
+
+
+def _generate_field_filter(field, operator, value, upper_cased=False):
+    # Columns that are already upper-cased are compared as they are, so their indexes can be used.
+    upper_field = field if upper_cased else func.upper(field)
 
     if operator == 'text':
         # On Oracle, allow indexed text search.
         if current_app.config.get('IS_ORACLE'):
             expr = func.contains(field, value) > literal_column('0')
         else:
-            expr = func.upper(field).like('%' + value + '%')
+            expr = _contains(upper_field, value)
     # Note: The Oracle back-end performs better with UPPER() compared to LOWER() case casting.
     elif operator == 'contains':
-        expr = func.upper(field).like('%' + value + '%')
+        expr = _contains(upper_field, value)
     elif operator == 'exact':
-        expr = func.upper(field) == value
+        expr = upper_field == value
     elif operator == 'endswith':
-        expr = func.upper(field).like('%' + value)
+        expr = upper_field.like('%' + value)
     elif operator == 'startswith':
-        expr = func.upper(field).like(value + '%')
+        expr = upper_field.like(value + '%')
     elif operator == 'wildcard':
         # We support entering * or % as wildcards, but the actual wildcard is %
         value = value.replace('*', '%')
-        expr = func.upper(field).like(value)
+        expr = upper_field.like(value)
     elif operator == 'excludes':
-        expr = func.upper(field) != value
+        expr = upper_field != value
         # TODO: this is a relatively expensive op, we may want to enforce it's only used in
         # combination with other queries.
-        # TODO: we should consider sorting by similarity (sum of any filters using it) by
-        # default, if the user chooses any similarity filter.
     elif operator == 'similar':
-        expr = func.utl_match.jaro_winkler_similarity(field, value) > 85
+        # Names are searched with search_api.utils.similarity instead, on any database.
+        expr = func.utl_match.jaro_winkler_similarity(field, value) > SIMILARITY_THRESHOLD
     elif operator == 'nicknames':
-        expr = NickName.get_nickname_search_expr(field, value)
+        expr = NickName.get_nickname_search_expr(field, value, upper_cased)
     else:
         raise Exception('invalid operator: {}'.format(operator))
 
@@ -150,14 +339,25 @@ def _get_sort_field(field_name):
     raise Exception('invalid sort field: {}'.format(field_name))
 
 
-def _sort_by_field(sort_type, sort_value):
-    field = _get_sort_field(sort_value)
+def _get_sort_expr(sort_value, denormalized=False):
+    if denormalized:
+        field, upper_cased = _get_search_table_field(sort_value)
+        if upper_cased:
+            return field
+    else:
+        field = _get_sort_field(sort_value)
 
     # by convention, in our database, dates end with _dts or _dt (converted to snake case)
     if not sort_value.endswith('Dt') and not sort_value.endswith('Dts'):
         # Note: The Oracle back-end performs better with UPPER() compared to LOWER() case casting.
         field = func.upper(field)
 
+    return field
+
+
+def _sort_by_field(sort_type, sort_value, denormalized=False):
+    field = _get_sort_expr(sort_value, denormalized)
+
     if sort_type == 'dsc':
         field = field.desc()
     return field
@@ -218,3 +418,13 @@ def _get_corp_party_export_column_values(row, args):
         columns.insert(6, _get_state_typ_cd_display_value(row.state_typ_cd))
 
     return columns
+
+
+def _get_corporation_export_column_headers():
+    # The company address isn't allowed to be displayed to Director Search users currently, so there are no
+    # 'Company Address' (_merge_addr_fields(row)) or 'Postal Code' (row.postal_cd) columns.
+    return ['Inc/Reg #', 'Entity Type', 'Company Name', 'Incorporated', 'Company Status']
+
+
+def _get_corporation_export_column_values(row):
+    return [row.corp_num, row.corp_typ_cd, row.corp_nme, row.recognition_dts, row.state_typ_cd]
@@ -0,0 +1,214 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Keyset (seek) pagination for the search endpoints.
+
+Instead of fetching the first N rows and discarding everything before the requested page, each page
+remembers the sort key of its last row in an opaque cursor. The next page filters on "sort key comes
+after the cursor", so the database can seek straight to it through an index and page 10 costs the same
+as page 1.
+
+A sort is described as a list of (expression, descending) keys. The last key must be unique (a primary
+key), so that rows sharing the same leading sort values are never skipped or repeated between pages.
+
+Cursors carry the sort they were created for (the columns and directions of its keys), and are signed with the
+app's CURSOR_SECRET_KEY, so a client can neither forge a position nor reuse a cursor with a different sort.
+
+Page-numbered requests fetch just their page with get_page(), within the first MAX_PAGED_RESULTS rows, and the
+exports the same rows with get_first_results().
+"""
+
+import base64
+import binascii
+import datetime
+import hashlib
+import hmac
+import json
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import Column, Date, DateTime, and_, or_
+from sqlalchemy.sql.expression import false, nullsfirst, nullslast
+from sqlalchemy.sql.visitors import iterate
+
+from search_api.utils.model_utils import BadSearchValue
+
+
+SEEK_KEY_LABEL = 'seek_key_{}'
+
+# The rows the page-numbered searches can page through: later pages are empty. Page further with a cursor.
+MAX_PAGED_RESULTS = 500
+
+
+def _serialize_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else str(value)
+    return value
+
+
+def _deserialize_value(value, expr):
+    if value is not None and isinstance(expr.type, (Date, DateTime)):
+        if 'T' in value:
+            return datetime.datetime.fromisoformat(value)
+        return datetime.date.fromisoformat(value)
+    return value
+
+
+def _describe_key(expr):
+    # A key is described by the kind of expression and the columns it sorts on, not by its SQL: a similarity score's
+    # SQL has parameters for the names it matches, and those change whenever the cached names are refreshed.
+    if hasattr(expr, '__clause_element__'):
+        expr = expr.__clause_element__()
+    columns = sorted({
+        '{}.{}'.format(element.table.name, element.name) for element in iterate(expr, {}) if isinstance(element, Column)
+    })
+    return '{}({})'.format(getattr(expr, 'name', None) or type(expr).__name__, ','.join(columns))
+
+
+def _describe_sort(keys):
+    return [[_describe_key(expr), 'dsc' if descending else 'asc'] for expr, descending in keys]
+
+
+def _sign(payload):
+    secret = current_app.config.get('CURSOR_SECRET_KEY') or current_app.config['SECRET_KEY']
+    if isinstance(secret, str):
+        secret = secret.encode('utf-8')
+    return hmac.new(secret, payload, hashlib.sha256).digest()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def encode_cursor(keys, values):
+    """Encode the sort key values of the last row on a page as an opaque, signed cursor."""
+    payload = json.dumps(
+        {'sort': _describe_sort(keys), 'after': [_serialize_value(v) for v in values]},
+        separators=(',', ':')
+    ).encode('utf-8')
+    return '{}.{}'.format(_b64encode(payload), _b64encode(_sign(payload)))
+
+
+def decode_cursor(cursor, keys):
+    """Decode a cursor created by encode_cursor() back into sort key values for the given keys.
+
+    :raise: BadSearchValue: if the cursor was tampered with, or was created for a different sort.
+    """
+    try:
+        payload, signature = cursor.split('.')
+        payload = _b64decode(payload)
+        if not hmac.compare_digest(_b64decode(signature), _sign(payload)):
+            raise ValueError('bad cursor signature')
+
+        cursor = json.loads(payload.decode('utf-8'))
+        if cursor['sort'] != _describe_sort(keys) or len(cursor['after']) != len(keys):
+            raise ValueError('cursor does not match the sort keys')
+
+        return [_deserialize_value(value, expr) for value, (expr, _) in zip(cursor['after'], keys)]
+    except (binascii.Error, KeyError, TypeError, ValueError):
+        raise BadSearchValue('Invalid cursor.')
+
+
+def _order_by_key(expr, descending):
+    # NULLs always sort as the largest value (the Oracle and Postgres default), so _after() is the same
+    # on every back-end.
+    if descending:
+        return nullsfirst(expr.desc())
+    return nullslast(expr.asc())
+
+
+def _equal(expr, value):
+    if value is None:
+        return expr.is_(None)
+    return expr == value
+
+
+def _after(expr, descending, value):
+    if descending:
+        if value is None:
+            return expr.isnot(None)
+        return expr < value
+
+    if value is None:
+        return false()
+    return or_(expr > value, expr.is_(None))
+
+
+def keyset_filter(keys, values):
+    """Return an expression matching the rows that sort strictly after the given sort key values.
+
+    For keys (a, b, c) this is: a > :a OR (a = :a AND (b > :b OR (b = :b AND c > :c))).
+    """
+    (expr, descending), value = keys[-1], values[-1]
+    expr_filter = _after(expr, descending, value)
+    for (expr, descending), value in zip(reversed(keys[:-1]), reversed(values[:-1])):
+        expr_filter = or_(_after(expr, descending, value), and_(_equal(expr, value), expr_filter))
+    return expr_filter
+
+
+def seek(query, keys, cursor, per_page):
+    """Fetch the page of results that follows `cursor` (or the first page, if there is no cursor).
+
+    Only per_page + 1 rows are fetched: the extra row tells us whether there is a next page.
+
+    :return: a tuple of the rows on the page, and the cursor for the next page (None on the last page).
+    """
+    query = query.add_columns(*[expr.label(SEEK_KEY_LABEL.format(i)) for i, (expr, _) in enumerate(keys)])
+    query = query.order_by(None).order_by(*[_order_by_key(expr, descending) for expr, descending in keys])
+
+    if cursor:
+        query = query.filter(keyset_filter(keys, decode_cursor(cursor, keys)))
+
+    rows = query.limit(per_page + 1).all()
+    if len(rows) <= per_page:
+        return rows, None
+
+    rows = rows[:per_page]
+    next_cursor = encode_cursor(keys, [getattr(rows[-1], SEEK_KEY_LABEL.format(i)) for i in range(len(keys))])
+    return rows, next_cursor
+
+
+def get_page_query(query, page, per_page, max_results=MAX_PAGED_RESULTS):
+    """Return query limited to a page of its rows (numbered from 1), or None if the page is past max_results rows.
+
+    On Oracle, SQLAlchemy bounds the page with ROWNUM, outside the ordered query.
+    """
+    offset = (page - 1) * per_page
+    limit = min(per_page, max_results - offset)
+    if page < 1 or limit <= 0:
+        return None
+    return query.limit(limit).offset(offset)
+
+
+def get_page(query, page, per_page, max_results=MAX_PAGED_RESULTS):
+    """Return the rows of a page of query (numbered from 1), fetching only that page, not those before it.
+
+    Only the first max_results rows are paged through.
+    """
+    page_query = get_page_query(query, page, per_page, max_results)
+    return [] if page_query is None else page_query.all()
+
+
+def get_first_results(query, max_results=MAX_PAGED_RESULTS):
+    """Return query limited to its first max_results rows, in its order.
+
+    On Oracle, SQLAlchemy applies the limit with ROWNUM outside the ordered query. Filtering on ROWNUM in the query
+    itself would take max_results arbitrary rows, since ROWNUM is assigned before ORDER BY.
+    """
+    return query.limit(max_results)
@@ -0,0 +1,244 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Capture the query plan of each director search filter, and flag plans that got worse.
+
+Each field/operator combination that _get_filter supports on the active database is compiled into the first page
+of the director search, as the search endpoint fetches it, and explained: with EXPLAIN (FORMAT JSON) on Postgres,
+EXPLAIN QUERY PLAN on SQLite and EXPLAIN PLAN on Oracle. The plans are normalized to their operations, tables and
+indexes, without costs or row estimates, so plans from different runs can be compared. A plan regresses if it
+fully scans a large table that it didn't before, or no longer uses an index it did. Without an earlier plan to
+compare with, every full scan of a large table is flagged. Run it with `python benchmark.py --plans`.
+"""
+
+import uuid
+
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from werkzeug.datastructures import ImmutableMultiDict
+
+from search_api.models.base import db
+from search_api.models.name_key import NameKey
+from search_api.utils.model_utils import NAME_FIELDS, PHONETIC_FIELDS, _is_similar_indexed
+from search_api.utils.pagination import MAX_PAGED_RESULTS, get_page_query
+from search_api.utils.similarity import is_name_table_filled
+
+
+# Tables with millions of rows in production, which a search must never scan in full.
+LARGE_TABLES = ('corp_party', 'address', 'event', 'filing', 'corporation', 'corp_name', 'corp_state', 'office')
+
+# The operators each field can be searched with, and a value to search for. Address lines are always searched
+# with 'text', and postal codes with 'exact'.
+SEARCH_FIELDS = {
+    **{field: ('SMITH', 'SM*TH') for field in NAME_FIELDS + ('anyNme',)},
+    'corpNme': ('PACIFIC', 'PAC*FIC'),
+    'corpNum': ('BC0000001', 'BC*1'),
+    'addrLine1': ('MAIN', None),
+    'postalCd': ('V8W1A1', None),
+    'stateTypCd': ('ACT', None),
+}
+OPERATORS = ('exact', 'startswith', 'contains', 'endswith', 'wildcard', 'excludes', 'similar', 'nicknames', 'phonetic')
+
+_SORT = [('mode', 'ALL'), ('sort_type', 'dsc'), ('sort_value', 'lastNme'), ('additional_cols', 'none')]
+
+# The rows on a page of the director search.
+_PER_PAGE = 50
+
+
+class Explain(Executable, ClauseElement):
+    """Explain a statement: EXPLAIN (FORMAT JSON) on Postgres, EXPLAIN QUERY PLAN on SQLite, EXPLAIN PLAN on Oracle.
+
+    On Oracle the plan is written to PLAN_TABLE under statement_id, rather than returned.
+    """
+
+    def __init__(self, statement, statement_id=None):
+        """Wrap the statement to explain."""
+        self.statement = statement
+        self.statement_id = statement_id
+
+
+@compiles(Explain, 'postgresql')
+def _compile_explain_postgresql(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
+
+@compiles(Explain, 'sqlite')
+def _compile_explain_sqlite(element, compiler, **kw):
+    return 'EXPLAIN QUERY PLAN ' + compiler.process(element.statement, **kw)
+
+
+@compiles(Explain, 'oracle')
+def _compile_explain_oracle(element, compiler, **kw):
+    return "EXPLAIN PLAN SET STATEMENT_ID = '{}' FOR {}".format(
+        element.statement_id, compiler.process(element.statement, **kw))
+
+
+def _get_postgresql_plan(statement):
+    plan, access = [], []
+
+    # A bitmap index scan's table is on the bitmap heap scan above it.
+    def visit(node, depth, table=None):
+        table = node.get('Relation Name', table)
+        line = node['Node Type']
+        if 'Index Name' in node:
+            line += ' using ' + node['Index Name']
+        if 'Relation Name' in node:
+            line += ' on ' + node['Relation Name']
+        plan.append('  ' * depth + line)
+
+        if node['Node Type'] == 'Seq Scan':
+            access.append({'scan': 'full', 'table': node['Relation Name'], 'index': None})
+        elif 'Index Name' in node:
+            access.append({'scan': 'index', 'table': table, 'index': node['Index Name']})
+        for child in node.get('Plans', []):
+            visit(child, depth + 1, table)
+
+    visit(db.session.execute(Explain(statement)).scalar()[0]['Plan'], 0)
+    return plan, access
+
+
+def _get_sqlite_plan(statement):
+    plan, access, depths = [], [], {0: -1}
+    for node_id, parent, _, detail in db.session.execute(Explain(statement)):
+        depths[node_id] = depths.get(parent, -1) + 1
+        # Older SQLite says 'SCAN TABLE x', newer says 'SCAN x'.
+        detail = detail.replace(' TABLE ', ' ')
+        plan.append('  ' * depths[node_id] + detail)
+
+        words = detail.split()
+        if words[0] == 'SCAN' and len(words) > 1 and 'INDEX' not in words:
+            access.append({'scan': 'full', 'table': words[1], 'index': None})
+        elif words[0] in ('SCAN', 'SEARCH') and 'INDEX' in words:
+            index = words[words.index('INDEX') + 1]
+            access.append({'scan': 'full' if words[0] == 'SCAN' else 'index', 'table': words[1], 'index': index})
+        elif words[0] == 'SEARCH':
+            access.append({'scan': 'index', 'table': words[1], 'index': 'primary key'})
+    return plan, access
+
+
+def _get_oracle_plan(statement):
+    statement_id = uuid.uuid4().hex[:30]
+    db.session.execute(Explain(statement, statement_id))
+    rows = db.session.execute(
+        'SELECT depth, operation, options, object_name FROM plan_table WHERE statement_id = :statement_id ORDER BY id',
+        {'statement_id': statement_id},
+    ).fetchall()
+    db.session.execute('DELETE FROM plan_table WHERE statement_id = :statement_id', {'statement_id': statement_id})
+
+    plan, access = [], []
+    for depth, operation, options, object_name in rows:
+        plan.append('  ' * depth + ' '.join(part for part in (operation, options, object_name) if part))
+        name = object_name.lower() if object_name else None
+        if operation == 'TABLE ACCESS' and options == 'FULL':
+            access.append({'scan': 'full', 'table': name, 'index': None})
+        elif operation.startswith('INDEX') or operation == 'DOMAIN INDEX':
+            access.append({'scan': 'full' if options in ('FULL SCAN', 'FAST FULL SCAN') else 'index',
+                           'table': None, 'index': name})
+    return plan, access
+
+
+def get_plan(statement):
+    """Return the normalized plan of a statement on the active database.
+
+    :return: a dict of 'plan', a line per operation, and 'access', how each table or index is read: a dict of
+        'scan' ('full' or 'index'), 'table' and 'index', either of which may be None.
+    """
+    get = {
+        'postgresql': _get_postgresql_plan,
+        'sqlite': _get_sqlite_plan,
+        'oracle': _get_oracle_plan,
+    }[db.engine.dialect.name]
+    plan, access = get(statement)
+    return {'plan': plan, 'access': access}
+
+
+def get_search_cases():
+    """Return the director search arguments of each supported field/operator combination, by 'field operator'."""
+    cases = {}
+    for field, (value, wildcard_value) in SEARCH_FIELDS.items():
+        if 'addrLine' in field:
+            operators = ('text',)
+        elif field in ('postalCd', 'stateTypCd'):
+            operators = ('exact',)
+        else:
+            operators = [
+                operator for operator in OPERATORS
+                if (operator != 'nicknames' or field in NAME_FIELDS + ('anyNme',)) and
+                (operator != 'phonetic' or field in PHONETIC_FIELDS + ('anyNme',))
+            ]
+
+        for operator in operators:
+            search_value = wildcard_value if operator == 'wildcard' else value
+            cases['{} {}'.format(field, operator)] = [('field', field), ('operator', operator), ('value', search_value)]
+    return cases
+
+
+def _is_supported(field, operator):
+    """Return whether the active database can search a field with an operator."""
+    if operator == 'similar' and db.engine.dialect.name != 'oracle':
+        # Without the name_gram table, the similar search uses Oracle's utl_match.
+        return all(_is_similar_indexed(name) for name in (NAME_FIELDS if field == 'anyNme' else (field,)))
+    if operator == 'phonetic':
+        return is_name_table_filled(NameKey)
+    return True
+
+
+def _get_search_statement(args):
+    # local import to prevent circular import
+    from search_api.models.corp_party import CorpParty  # pylint: disable=import-outside-toplevel, cyclic-import
+
+    # The first page, as the search endpoint fetches it: the limit affects the plan.
+    args = ImmutableMultiDict(args + _SORT)
+    query = CorpParty.get_best_search_results(args, CorpParty.search_corp_parties(args), MAX_PAGED_RESULTS)
+    return get_page_query(query, 1, _PER_PAGE).statement
+
+
+def capture_plans():
+    """Return the plan and SQL of each search case the database supports, by case.
+
+    A case that fails anyway has an 'error'.
+    """
+    plans = {}
+    for name, args in get_search_cases().items():
+        if not _is_supported(args[0][1], args[1][1]):
+            continue
+        try:
+            statement = _get_search_statement(args)
+            plans[name] = dict(get_plan(statement), sql=str(statement.compile(dialect=db.engine.dialect)))
+        except Exception as err:  # pylint: disable=broad-except
+            db.session.rollback()
+            plans[name] = {'error': str(err).splitlines()[0]}
+    return plans
+
+
+def find_regressions(plan, baseline=None):
+    """Return how a plan is worse than its baseline: new full scans of large tables, and indexes no longer used.
+
+    Without a baseline, every full scan of a large table is returned.
+    """
+    def full_scans(access):
+        return {item['table'] for item in access if item['scan'] == 'full' and item['table'] in LARGE_TABLES}
+
+    def indexes(access):
+        return {item['index'] for item in access if item['scan'] == 'index'}
+
+    regressions = [
+        'full scan of {}'.format(table)
+        for table in sorted(full_scans(plan['access']) - full_scans(baseline['access'] if baseline else []))
+    ]
+    if baseline:
+        regressions += [
+            'no longer uses index {}'.format(index)
+            for index in sorted(indexes(baseline['access']) - indexes(plan['access']))
+        ]
+    return regressions
@@ -0,0 +1,146 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Time the SQL statements each request runs, and report them in its Server-Timing header and log.
+
+For a sample of QUERY_TIMING_SAMPLE_RATE of requests, each statement's execution is timed, and the request's
+statement count, total database time, slowest statement and rows are reported. The Server-Timing header holds what
+ran before the response started; the log line, written when the request ends, also holds what ran while the
+response was streamed (as exports do). Any statement slower than QUERY_TIMING_SLOW_MS is logged whether or not its
+request is sampled, and outside requests too.
+
+Rows are counted as the database driver reports them (cursor.rowcount): psycopg2 reports the rows each SELECT
+returned, cx_Oracle the rows fetched so far, and SQLite none.
+"""
+
+import logging
+import random
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+_START_TIMES = 'query_timing_start_times'
+
+
+class QueryTiming:
+    """The statements a request ran: how many, how long they took, the slowest, and their cursors' row counts."""
+
+    def __init__(self):
+        """Start with no statements."""
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+        self._cursors = []
+
+    def add(self, statement, seconds, cursor):
+        """Record a statement that took seconds to execute."""
+        self.count += 1
+        self.seconds += seconds
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+        self._cursors.append(cursor)
+
+    @property
+    def rows(self):
+        """Return the rows the statements returned or changed, as far as the driver reports them."""
+        rows = 0
+        for cursor in self._cursors:
+            try:
+                rows += max(cursor.rowcount, 0)
+            except Exception:  # pylint: disable=broad-except; a closed cursor may not say.
+                pass
+        return rows
+
+    def get_server_timing(self):
+        """Return the Server-Timing header value: the total and slowest statement times, in milliseconds."""
+        return 'db;dur={:.1f};desc="{} queries", db-slowest;dur={:.1f}'.format(
+            self.seconds * 1000, self.count, self.slowest_seconds * 1000)
+
+    def get_log_fields(self):
+        """Return the timing as fields for a structured log."""
+        return {
+            'queries': self.count,
+            'db_ms': round(self.seconds * 1000, 1),
+            'rows': self.rows,
+            'slowest_ms': round(self.slowest_seconds * 1000, 1),
+            'slowest_sql': ' '.join(self.slowest_statement.split()) if self.slowest_statement else None,
+        }
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):  # noqa # pylint: disable=unused-argument, too-many-arguments
+    conn.info.setdefault(_START_TIMES, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):  # noqa # pylint: disable=unused-argument, too-many-arguments
+    start_times = conn.info.get(_START_TIMES)
+    if not start_times:
+        return
+    seconds = time.perf_counter() - start_times.pop()
+
+    timing = g.get('query_timing') if has_request_context() else None
+    if timing is not None:
+        timing.add(statement, seconds, cursor)
+
+    slow_ms = current_app.config.get('QUERY_TIMING_SLOW_MS', 1000) if has_app_context() else 1000
+    if slow_ms is not None and seconds * 1000 >= slow_ms:
+        (current_app.logger if has_app_context() else logger).warning(
+            'slow query: %.1fms: %s', seconds * 1000, ' '.join(statement.split()),
+            extra={'db_ms': round(seconds * 1000, 1), 'sql': statement})
+
+
+def _handle_error(context):
+    # The statement failed, so _after_cursor_execute won't be called for it.
+    start_times = context.connection.info.get(_START_TIMES) if context.connection else None
+    if start_times:
+        start_times.pop()
+
+
+def _start_timing():
+    if random.random() < current_app.config.get('QUERY_TIMING_SAMPLE_RATE', 1.0):
+        g.query_timing = QueryTiming()
+
+
+def _add_server_timing(response):
+    timing = g.get('query_timing')
+    if timing is not None:
+        response.headers.add('Server-Timing', timing.get_server_timing())
+    return response
+
+
+def _log_timing(exception=None):  # pylint: disable=unused-argument
+    timing = g.pop('query_timing', None)
+    if not timing or not timing.count:
+        return
+
+    fields = dict(timing.get_log_fields(), method=request.method, path=request.path, endpoint=request.endpoint)
+    message = ' '.join('{}={}'.format(name, value) for name, value in fields.items() if name != 'slowest_sql')
+    current_app.logger.info('%s slowest_sql="%s"', message, fields['slowest_sql'] or '', extra=fields)
+
+
+def init_app(app):
+    """Time the statements every engine runs, and report them for the app's requests."""
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    app.before_request(_start_timing)
+    app.after_request(_add_server_timing)
+    app.teardown_request(_log_timing)
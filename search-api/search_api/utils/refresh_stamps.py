@@ -0,0 +1,49 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Stamps that tell every worker to reload its in-memory copy of a table.
+
+Each process keeps its own copy of the small, static tables (the nicknames and the code tables). A refresh through
+/ops reaches only the worker that serves it, so it also touches the table's stamp, a file in REFRESH_STAMP_DIR, and
+each worker reloads its copy the next time it uses it with a newer stamp. Checking a stamp is a stat() of the file,
+not a query. The stamps are shared by the workers on a host, or by every pod if REFRESH_STAMP_DIR is on a shared
+volume.
+"""
+
+import os
+import time
+
+from flask import current_app
+
+
+def _get_stamp_path(name):
+    return os.path.join(current_app.config.get('REFRESH_STAMP_DIR', '/tmp/refresh-stamps'), name)
+
+
+def get_stamp(name):
+    """Return the time a stamp was last touched, in nanoseconds, or 0 if it never was."""
+    try:
+        return os.stat(_get_stamp_path(name)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def touch_stamp(name):
+    """Touch a stamp, so every worker reloads its copy of the table. Return the new stamp."""
+    path = _get_stamp_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Always move the stamp forward, even if the clock hasn't since it was last touched.
+    stamp = max(time.time_ns(), get_stamp(name) + 1)
+    with open(path, 'a'):
+        os.utime(path, ns=(stamp, stamp))
+    return get_stamp(name)
@@ -0,0 +1,143 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Cache search responses, so repeating a search (paging back and forth, or re-sorting) doesn't run it again.
+
+Responses are cached by a canonical form of the search's arguments, so equivalent searches share an entry. The
+back-end is set by SEARCH_CACHE_BACKEND:
+- 'memory': an LRU cache in each process (the default).
+- 'filesystem': files under SEARCH_CACHE_DIR, shared by every worker on the host.
+- 'redis': the Redis server at SEARCH_CACHE_REDIS_URL, shared by every worker. Needs the redis package.
+- 'none': don't cache.
+Entries expire after SEARCH_CACHE_TTL seconds, and at most SEARCH_CACHE_SIZE are kept (Redis evicts by its own
+maxmemory policy instead).
+"""
+
+import hashlib
+import json
+import threading
+
+from flask import current_app
+
+from search_api.utils.cache import TTLCache
+from search_api.utils.metrics import count_cache_lookup
+
+
+class SearchCache:
+    """A search response cache over a back-end with get(key) and set(key, value, ttl), counting hits and misses."""
+
+    def __init__(self, backend, ttl):
+        """Wrap a back-end, caching entries for ttl seconds."""
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the response cached for key, or None."""
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        count_cache_lookup('search', value is not None)
+        return value
+
+    def set(self, key, value):
+        """Cache a response for key."""
+        self.backend.set(key, value, self.ttl)
+
+    def get_stats(self):
+        """Return this process's hit and miss counts, and its hit ratio."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / lookups if lookups else None,
+        }
+
+
+class _NoCache:
+    """A back-end that caches nothing."""
+
+    def get(self, key):  # pylint: disable=unused-argument, no-self-use
+        """Return None: nothing is cached."""
+        return None
+
+    def set(self, key, value, ttl=None):  # pylint: disable=unused-argument, no-self-use
+        """Discard the value."""
+
+
+def _create_backend(config):
+    backend = config.get('SEARCH_CACHE_BACKEND', 'memory')
+    size = config.get('SEARCH_CACHE_SIZE', 1000)
+    ttl = config.get('SEARCH_CACHE_TTL', 60)
+
+    if backend == 'memory':
+        return TTLCache(size, ttl)
+
+    if backend == 'none' or not ttl:
+        return _NoCache()
+
+    # The shared back-ends come with Werkzeug.
+    from werkzeug.contrib.cache import FileSystemCache, RedisCache  # pylint: disable=import-outside-toplevel
+
+    if backend == 'filesystem':
+        return FileSystemCache(config.get('SEARCH_CACHE_DIR'), threshold=size, default_timeout=ttl)
+
+    if backend == 'redis':
+        import redis  # pylint: disable=import-outside-toplevel
+
+        client = redis.from_url(config.get('SEARCH_CACHE_REDIS_URL'))
+        return RedisCache(client, default_timeout=ttl, key_prefix='search:')
+
+    raise ValueError('Invalid SEARCH_CACHE_BACKEND: `{}`'.format(backend))
+
+
+def get_search_cache():
+    """Return this process's SearchCache."""
+    if 'search_cache' not in current_app.extensions:
+        current_app.extensions['search_cache'] = SearchCache(
+            _create_backend(current_app.config), current_app.config.get('SEARCH_CACHE_TTL', 60))
+    return current_app.extensions['search_cache']
+
+
+def get_search_cache_key(endpoint, args):
+    """Return the cache key of a search: the endpoint's name, and a hash of its arguments in canonical form.
+
+    Values are upper-cased, as the filters upper-case them, and the field/operator/value triples are sorted, as
+    neither mode=ALL nor mode=ANY depends on their order. Everything else that affects the response (the mode,
+    sort, additional columns, page or cursor) is included as-is.
+    """
+    clauses = sorted(
+        (field, operator, value.upper())
+        for field, operator, value in zip(args.getlist('field'), args.getlist('operator'), args.getlist('value'))
+    )
+    search = {
+        'clauses': clauses,
+        'mode': 'ALL' if args.get('mode') == 'ALL' else 'ANY',
+        'query': args.get('query', '').upper(),
+        'search_field': args.get('search_field', 'corpNme'),
+        'sort_type': args.get('sort_type'),
+        'sort_value': args.get('sort_value'),
+        'additional_cols': args.get('additional_cols'),
+        'page': args.get('page', '1'),
+        'after': args.get('after'),
+    }
+    digest = hashlib.sha256(json.dumps(search, sort_keys=True).encode('utf-8')).hexdigest()
+    return '{}:{}'.format(endpoint, digest)
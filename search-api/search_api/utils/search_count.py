@@ -0,0 +1,79 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Count the results of a search separately from fetching a page of them.
+
+The count runs as SELECT COUNT(*) over the search's joins and filters only, without its ORDER BY or projection,
+and is cached per distinct statement, so paging through (or re-sorting) a search doesn't count it again.
+
+Counting every match of a broad search over millions of rows is expensive, so at most SEARCH_COUNT_BUDGET rows
+are counted. Beyond that, Postgres returns the planner's row estimate, and other back-ends return the budget
+itself as a lower bound. Either way the count is flagged as estimated.
+"""
+
+from flask import current_app
+from sqlalchemy import func, literal_column
+
+from search_api.models.base import db
+from search_api.utils.cache import TTLCache
+from search_api.utils.query_plans import Explain
+
+
+def _get_count_cache():
+    if 'search_count_cache' not in current_app.extensions:
+        current_app.extensions['search_count_cache'] = TTLCache(
+            current_app.config.get('SEARCH_COUNT_CACHE_SIZE', 1000),
+            current_app.config.get('SEARCH_COUNT_CACHE_TTL', 300),
+        )
+    return current_app.extensions['search_count_cache']
+
+
+def _cache_key(statement):
+    compiled = statement.compile(dialect=db.engine.dialect)
+    return str(compiled), tuple(sorted((k, repr(v)) for k, v in compiled.params.items()))
+
+
+def _estimate_count(statement):
+    plan = db.session.execute(Explain(statement)).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_search_results(query):
+    """Count the rows matched by a search query.
+
+    :return: a tuple of the count, and whether it is an estimate rather than an exact count.
+    """
+    statement = query.order_by(None).with_entities(literal_column('1').label('one')).statement
+
+    cache = _get_count_cache()
+    key = _cache_key(statement)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    budget = current_app.config.get('SEARCH_COUNT_BUDGET')
+    if budget:
+        bounded = statement.limit(budget + 1).alias('bounded')
+        count = db.session.query(func.count()).select_from(bounded).scalar()
+        if count <= budget:
+            result = (count, False)
+        elif db.engine.dialect.name == 'postgresql':
+            result = (max(_estimate_count(statement), count), True)
+        else:
+            result = (budget, True)
+    else:
+        count = db.session.query(func.count()).select_from(statement.alias('unbounded')).scalar()
+        result = (count, False)
+
+    cache.set(key, result)
+    return result
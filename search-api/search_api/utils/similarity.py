@@ -0,0 +1,223 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Find the names similar to a search value, for the similar operator, without scoring every row.
+
+The candidates are the names that share at least a third of the value's bigrams, and at least two, looked up in
+the name_gram table. At most MAX_SIMILAR_CANDIDATES of them, those sharing the most bigrams, are scored, with
+Jaro-Winkler as Oracle's utl_match.jaro_winkler_similarity does (0 to 100), and those scoring over
+SIMILARITY_THRESHOLD are kept. The search then matches the field against that list of names, which the upper(name)
+indexes serve, so it works on any database and never scores the whole table.
+
+The name_gram table isn't part of the COLIN schema, so on Oracle, or wherever it hasn't been filled, the similar
+search scores every row with utl_match.jaro_winkler_similarity instead. See is_name_table_filled().
+
+The same scores rank the results of the fuzzy operators (similar, nicknames and phonetic): each name a fuzzy
+clause matches scores its Jaro-Winkler similarity to the clause's value, and a row scores the sum over its clauses.
+"""
+
+from flask import current_app
+from sqlalchemy import func, literal
+from sqlalchemy.sql.expression import case
+
+from search_api.models.base import db
+from search_api.models.name_gram import NameGram, get_grams
+from search_api.models.name_key import NameKey, get_soundex
+from search_api.models.nickname import NickName
+from search_api.utils.cache import TTLCache
+
+
+# The lowest score a similar name has, as utl_match.jaro_winkler_similarity(field, value) > 85 did.
+SIMILARITY_THRESHOLD = 85
+
+# The most similar names the similar and phonetic searches match: Oracle allows at most 1000 values in an IN list.
+MAX_SIMILAR_NAMES = 1000
+
+# The fewest bigrams a candidate shares with the value. A third of a short value's bigrams is one, which a value
+# like 'AL' shares with most of the names.
+MIN_SHARED_GRAMS = 2
+
+# The most candidates scored for a value, those that share the most bigrams with it.
+MAX_SIMILAR_CANDIDATES = 5000
+
+
+def jaro(first, second):
+    """Return the Jaro similarity of two strings, from 0 (nothing in common) to 1 (the same)."""
+    if first == second:
+        return 1.0
+    if not first or not second:
+        return 0.0
+
+    window = max(max(len(first), len(second)) // 2 - 1, 0)
+    first_matched = [False] * len(first)
+    second_matched = [False] * len(second)
+
+    matches = 0
+    for i, char in enumerate(first):
+        for j in range(max(0, i - window), min(i + window + 1, len(second))):
+            if not second_matched[j] and second[j] == char:
+                first_matched[i] = second_matched[j] = True
+                matches += 1
+                break
+
+    if not matches:
+        return 0.0
+
+    # Count the matched characters that are out of order.
+    second_chars = (char for char, matched in zip(second, second_matched) if matched)
+    transpositions = sum(
+        char != next(second_chars) for char, matched in zip(first, first_matched) if matched) / 2
+
+    return (matches / len(first) + matches / len(second) + (matches - transpositions) / matches) / 3
+
+
+def jaro_winkler(first, second, prefix_scale=0.1):
+    """Return the Jaro-Winkler similarity of two strings: Jaro, raised for a common prefix of up to 4 characters."""
+    similarity = jaro(first, second)
+
+    prefix = 0
+    for first_char, second_char in zip(first[:4], second[:4]):
+        if first_char != second_char:
+            break
+        prefix += 1
+
+    return similarity + prefix * prefix_scale * (1 - similarity)
+
+
+def get_similarity(first, second):
+    """Return the Jaro-Winkler similarity of two strings as an integer from 0 to 100, as Oracle's utl_match does."""
+    return int(jaro_winkler(first, second) * 100)
+
+
+def _find_similar_names(value):
+    grams = get_grams(value)
+    min_shared = min(len(grams), max(MIN_SHARED_GRAMS, len(grams) // 3))
+    candidates = set(NameGram.get_candidates(value, min_shared, MAX_SIMILAR_CANDIDATES)) | {value}
+    similar = [(name, score) for name, score in _score_names(value, candidates) if score > SIMILARITY_THRESHOLD]
+    return tuple(similar[:MAX_SIMILAR_NAMES])
+
+
+def _find_phonetic_names(value):
+    # A common key has thousands of names. Score those closest to the value's length, and keep the most similar.
+    names = (
+        db.session.query(NameKey.name)
+        .filter(NameKey.soundex == get_soundex(value))
+        .order_by(func.abs(func.length(NameKey.name) - len(value)), NameKey.name)
+        .limit(MAX_SIMILAR_CANDIDATES)
+    )
+    return _score_names(value, [name for name, in names])[:MAX_SIMILAR_NAMES]
+
+
+def _score_names(value, names):
+    # A name the search matches scores at least 1, so it ranks above the rows that match none of the fuzzy clauses.
+    # Every name is scored, so the scores cover exactly the names the filter matches.
+    return tuple(sorted(
+        ((name, max(1, get_similarity(value, name))) for name in names),
+        key=lambda name_score: (-name_score[1], name_score[0])))
+
+
+def _get_cached(cache_name, value, find):
+    if cache_name not in current_app.extensions:
+        current_app.extensions[cache_name] = TTLCache(1000, current_app.config.get('SIMILAR_NAMES_CACHE_TTL', 300))
+    cache = current_app.extensions[cache_name]
+
+    names = cache.get(value)
+    if names is None:
+        names = find(value)
+        cache.set(value, names)
+    return names
+
+
+def _is_filled(table_name):
+    if not db.engine.dialect.has_table(db.session.connection(), table_name):
+        return False
+    return db.session.query(db.metadata.tables[table_name]).first() is not None
+
+
+def is_name_table_filled(model):
+    """Return whether a name table (NameGram or NameKey) exists and has rows, so the searches can use it.
+
+    Never on Oracle, where the tables aren't part of the schema. The answer is cached for SIMILAR_NAMES_CACHE_TTL
+    seconds.
+    """
+    if current_app.config.get('IS_ORACLE'):
+        return False
+    return _get_cached('name_tables', model.__tablename__, _is_filled)
+
+
+def get_similar_names(value):
+    """Return the (name, score) pairs of the names similar to an upper-cased value, most similar first.
+
+    The value itself is always included. Results are cached for SIMILAR_NAMES_CACHE_TTL seconds.
+    """
+    return _get_cached('similar_names', value, _find_similar_names)
+
+
+def get_phonetic_names(value):
+    """Return the (name, score) pairs of the names that sound like an upper-cased value, most similar first.
+
+    They're the MAX_SIMILAR_NAMES most similar names with the value's Soundex key, which the phonetic filter matches.
+    Results are cached for SIMILAR_NAMES_CACHE_TTL seconds.
+    """
+    return _get_cached('phonetic_names', value, _find_phonetic_names)
+
+
+def get_nickname_names(value):
+    """Return the (name, score) pairs of the nicknames of an upper-cased value, and itself, most similar first."""
+    return _score_names(value, NickName.get_aliases(value))
+
+
+# The names each fuzzy operator matches, and their scores.
+SCORED_OPERATORS = {
+    'similar': get_similar_names,
+    'nicknames': get_nickname_names,
+    'phonetic': get_phonetic_names,
+}
+
+
+def get_similar_search_expr(field, value, upper_cased=False):
+    """Generate an expression to return instances where a field is similar to the value.
+
+    Set upper_cased if the field is already upper-cased.
+    """
+    if not upper_cased:
+        field = func.upper(field)
+    return field.in_([name for name, _ in get_similar_names(value)])
+
+
+def get_phonetic_search_expr(field, value, upper_cased=False):
+    """Generate an expression to return instances where a field sounds like the value: see get_phonetic_names().
+
+    Set upper_cased if the field is already upper-cased.
+    """
+    if not upper_cased:
+        field = func.upper(field)
+    return field.in_([name for name, _ in get_phonetic_names(value)])
+
+
+def get_score_expr(operator, field, value, upper_cased=False):
+    """Generate an expression of how well a field matches the value with a fuzzy operator, from 0 to 100.
+
+    It's the score of the field's name in SCORED_OPERATORS[operator](value), or 0 if the operator doesn't match it.
+    The names are matched a score at a time, with an IN list of the names with that score, so the expression has a
+    parameter per name and per score, not a branch per name.
+    """
+    if not upper_cased:
+        field = func.upper(field)
+    names_by_score = {}
+    for name, score in SCORED_OPERATORS[operator](value):
+        names_by_score.setdefault(score, []).append(name)
+    if not names_by_score:
+        return literal(0)
+    return case(
+        [(field.in_(names), score) for score, names in sorted(names_by_score.items(), reverse=True)], else_=0)
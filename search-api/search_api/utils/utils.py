@@ -19,3 +19,12 @@ import re
 def convert_to_snake_case(name):
     """Convert a string from camelCase to snake_case."""
     return re.sub(r'(?<!^)(?=[A-Z0-9])', '_', name).lower()
+
+
+def percentile(values, percent):
+    """Return the percent'th percentile of values, interpolating between the closest ranks."""
+    values = sorted(values)
+    rank = (len(values) - 1) * percent / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
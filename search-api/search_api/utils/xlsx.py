@@ -0,0 +1,195 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Stream an Excel (.xlsx) workbook of one sheet, row by row, as it's written.
+
+An .xlsx file is a zip of XML parts. The fixed parts are written first, then the sheet's rows are compressed into
+the zip as they arrive, and the zip's bytes are yielded as they're produced. So the response starts before the
+query has finished, and memory use doesn't grow with the number of rows. openpyxl's write-only mode can't do this,
+as it only produces the file when the workbook is saved.
+"""
+
+import datetime
+from decimal import Decimal
+import re
+from xml.sax.saxutils import escape
+import zipfile
+
+from openpyxl.utils import get_column_letter
+
+
+MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# How many rows to write between yielding the zip's output.
+ROWS_PER_CHUNK = 100
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{title}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+# Cell styles: 0 is the default, 1 formats dates and 2 formats datetimes.
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="2">'
+    '<numFmt numFmtId="164" formatCode="yyyy-mm-dd"/>'
+    '<numFmt numFmtId="165" formatCode="yyyy-mm-dd h:mm:ss"/>'
+    '</numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2">'
+    '<fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill>'
+    '</fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+
+_SHEET_END = '</sheetData></worksheet>'
+
+_EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+
+# Control characters aren't allowed in XML, even escaped.
+_ILLEGAL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class _StreamBuffer:
+    """A write-only file that holds what's written to it until it's drained.
+
+    It can't tell() or seek(), so zipfile writes to it as a stream.
+    """
+
+    def __init__(self):
+        """Create an empty buffer."""
+        self._chunks = []
+
+    def write(self, data):
+        """Hold data until the next drain()."""
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        """Do nothing: the data is held until drained."""
+
+    def drain(self):
+        """Return everything written since the last drain()."""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _get_cell_xml(ref, value):
+    # pylint: disable=too-many-return-statements
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '<c r="{}" t="b"><v>{:d}</v></c>'.format(ref, value)
+    if isinstance(value, (int, float, Decimal)):
+        return '<c r="{}"><v>{}</v></c>'.format(ref, value)
+    if isinstance(value, datetime.datetime):
+        serial = (value.replace(tzinfo=None) - _EXCEL_EPOCH).total_seconds() / 86400
+        return '<c r="{}" s="2"><v>{}</v></c>'.format(ref, serial)
+    if isinstance(value, datetime.date):
+        serial = (value - _EXCEL_EPOCH.date()).days
+        return '<c r="{}" s="1"><v>{}</v></c>'.format(ref, serial)
+
+    text = escape(_ILLEGAL_CHARACTERS.sub('', str(value)))
+    return '<c r="{}" t="inlineStr"><is><t xml:space="preserve">{}</t></is></c>'.format(ref, text)
+
+
+def _get_row_xml(row_number, values):
+    cells = ''.join(
+        _get_cell_xml('{}{}'.format(get_column_letter(column_number), row_number), value)
+        for column_number, value in enumerate(values, start=1)
+    )
+    return '<row r="{}">{}</row>'.format(row_number, cells).encode('utf-8')
+
+
+def stream_xlsx(headers, rows, title='Sheet'):
+    """Yield the bytes of an .xlsx workbook with one sheet: a row of headers, then each of rows.
+
+    Each row is a sequence of values, which may be strings, numbers, dates, datetimes, booleans or None.
+    """
+    buffer = _StreamBuffer()
+
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK.format(title=escape(title, {'"': '&quot;'})))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', _STYLES)
+        yield buffer.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', mode='w') as sheet:
+            sheet.write(_SHEET_START.encode('utf-8'))
+            sheet.write(_get_row_xml(1, headers))
+
+            for row_number, row in enumerate(rows, start=2):
+                sheet.write(_get_row_xml(row_number, row))
+                if row_number % ROWS_PER_CHUNK == 0:
+                    data = buffer.drain()
+                    if data:
+                        yield data
+
+            sheet.write(_SHEET_END.encode('utf-8'))
+
+    yield buffer.drain()
@@ -17,8 +17,16 @@
 Test-Suite to ensure that the /entities endpoint is working as expected.
 """
 
+import csv
+import io
 import json
 from jsonschema import validate
+from openpyxl import load_workbook
+from sqlalchemy import event
+
+from search_api.models.base import db
+from search_api.models.corporation import Corporation
+from search_api.utils.model_utils import BadSearchValue
 
 from tests.utilities.factory_utils import factory_auth_header
 from tests.utilities.factory_scenarios import TestJwtClaims
@@ -55,19 +63,163 @@ def test_search_directors_sort(client, jwt, session):  # pylint:disable=unused-a
     )
     assert len(dictionary['results']) == 3
     assert dictionary['results'][0]['middleNme'] == 'Lewis'
+    # The total is counted by /count/ instead.
+    assert 'numResults' not in dictionary
+
+    dictionary = _dir_search(
+        client,
+        jwt,
+        '?field=firstNme&operator=contains&value=ad&mode=ALL&page=2&sort_type=asc&'
+        'sort_value=middleNme&additional_cols=none',
+    )
+    assert dictionary['results'] == []
+
+
+def test_search_directors_cursor(client, jwt, session):  # pylint:disable=unused-argument
+    """Assert that directors can be paged through with a cursor."""
+    dictionary = _dir_search(
+        client,
+        jwt,
+        '?field=firstNme&operator=contains&value=ad&mode=ALL&sort_type=asc&'
+        'sort_value=middleNme&additional_cols=none&after=',
+    )
+    assert len(dictionary['results']) == 3
+    assert dictionary['results'][0]['middleNme'] == 'Lewis'
+    assert dictionary['nextCursor'] is None
+
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.staff_role)
+    rv = client.get('/api/v1/directors/?field=firstNme&operator=contains&value=ad&after=garbage', headers=headers)
+    assert json.loads(rv.data)['results'] == []
+
+
+def test_search_directors_count(client, jwt, session):  # pylint:disable=unused-argument
+    """Assert that director search results can be counted."""
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.staff_role)
+    rv = client.get('/api/v1/directors/count/?field=firstNme&operator=contains&value=ad&mode=ALL', headers=headers)
+
+    assert rv.status_code == http_status.HTTP_200_OK
+    assert json.loads(rv.data) == {'numResults': 3, 'numResultsEstimated': False}
+
+    rv = client.get('/api/v1/directors/count/?field=firstNme&operator=contains&value=a&mode=ALL', headers=headers)
+    assert rv.status_code == http_status.HTTP_200_OK
+    assert json.loads(rv.data) == {
+        'numResults': 0, 'error': 'Invalid search: Search value must be at least 2 letters long.'}
+
+
+def test_search_directors_cached(client, jwt, session):  # pylint:disable=unused-argument
+    """Assert that repeating an equivalent director search returns the cached response, without querying."""
+    statements = []
+
+    def record_statement(conn, cursor, statement, *args):  # pylint:disable=unused-argument
+        if statement.startswith('SELECT'):
+            statements.append(statement)
+
+    first = _dir_search(
+        client,
+        jwt,
+        '?field=firstNme&operator=contains&value=ad&field=lastNme&operator=contains&value=a&mode=ALL&page=1',
+    )
+
+    event.listen(db.engine, 'before_cursor_execute', record_statement)
+    try:
+        second = _dir_search(
+            client,
+            jwt,
+            '?field=lastNme&operator=contains&value=A&field=firstNme&operator=contains&value=AD&mode=ALL',
+        )
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_statement)
+
+    assert second == first
+    assert statements == []
 
 
 def test_search_directors_xlsx_export(client, jwt, session):  # pylint:disable=unused-argument
     """Assert that directors can be searched via GET."""
     headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.no_role)
 
-    client.get(
+    rv = client.get(
         '/api/v1/directors/export/?field=firstNme&operator=exact&value=Lillian&mode=ALL&page=1&sort_type=asc&'
         'sort_value=lastNme&additional_cols=none',
         headers=headers,
         content_type='application/json',
     )
 
+    assert rv.status_code == http_status.HTTP_200_OK
+    assert rv.is_streamed
+    sheet = load_workbook(io.BytesIO(rv.data)).active
+    rows = list(sheet.values)
+    assert rows[0][:3] == ('Surname', 'First Name', 'Middle Name')
+    assert len(rows) > 1
+    assert all(row[1] == 'Lillian' for row in rows[1:])
+
+
+def test_search_directors_csv_export(client, jwt, session):  # pylint:disable=unused-argument
+    """Assert that director search results can be exported as CSV and newline-delimited JSON."""
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.no_role)
+    params = '?field=firstNme&operator=exact&value=Lillian&mode=ALL&sort_type=asc&sort_value=lastNme'
+
+    rv = client.get('/api/v1/directors/export/{}&format=csv'.format(params), headers=headers)
+    assert rv.status_code == http_status.HTTP_200_OK
+    assert rv.mimetype == 'text/csv'
+    rows = list(csv.reader(io.StringIO(rv.data.decode('utf-8'))))
+    assert rows[0][:3] == ['Surname', 'First Name', 'Middle Name']
+    assert len(rows) > 1
+    assert all(row[1] == 'Lillian' for row in rows[1:])
+
+    rv = client.get('/api/v1/directors/export/{}&format=ndjson'.format(params), headers=headers)
+    assert rv.status_code == http_status.HTTP_200_OK
+    lines = [json.loads(line) for line in rv.data.decode('utf-8').splitlines()]
+    assert len(lines) == len(rows) - 1
+    assert all(line['First Name'] == 'Lillian' for line in lines)
+
+    rv = client.get('/api/v1/directors/export/{}&format=pdf'.format(params), headers=headers)
+    assert rv.status_code == http_status.HTTP_400_BAD_REQUEST
+
+
+def test_search_directors_export_job(
+        app, client, jwt, session, tmp_path, monkeypatch):  # pylint:disable=unused-argument
+    """Assert that every director search result can be exported by a job, and its file downloaded."""
+    monkeypatch.setitem(app.config, 'EXPORT_JOB_DIR', str(tmp_path))
+    monkeypatch.setitem(app.config, 'EXPORT_JOB_PAGE_SIZE', 2)
+    monkeypatch.delitem(app.extensions, 'export_jobs', raising=False)
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.no_role)
+
+    rv = client.post(
+        '/api/v1/directors/export/jobs/?field=firstNme&operator=contains&value=ad&mode=ALL&format=csv',
+        headers=headers)
+    assert rv.status_code == http_status.HTTP_202_ACCEPTED
+    job = json.loads(rv.data)
+    assert job['status'] == 'done'
+    assert job['rowsWritten'] == job['total'] == 3
+
+    rv = client.get('/api/v1/directors/export/jobs/{}'.format(job['jobId']), headers=headers)
+    assert json.loads(rv.data)['status'] == 'done'
+
+    rv = client.get('/api/v1/directors/export/jobs/{}/download'.format(job['jobId']), headers=headers)
+    assert rv.status_code == http_status.HTTP_200_OK
+    rows = list(csv.reader(io.StringIO(rv.data.decode('utf-8'))))
+    assert len(rows) == 4
+
+    other_user = factory_auth_header(jwt=jwt, claims=TestJwtClaims.staff_role)
+    rv = client.get('/api/v1/directors/export/jobs/{}'.format(job['jobId']), headers=other_user)
+    assert rv.status_code == http_status.HTTP_404_NOT_FOUND
+
+
+def test_search_directors_export_job_limit(
+        app, client, jwt, session, tmp_path, monkeypatch):  # pylint:disable=unused-argument
+    """Assert that an account can't have more than EXPORT_JOB_ACCOUNT_LIMIT export jobs in progress."""
+    monkeypatch.setitem(app.config, 'EXPORT_JOB_DIR', str(tmp_path))
+    monkeypatch.setitem(app.config, 'EXPORT_JOB_ACCOUNT_LIMIT', 1)
+    monkeypatch.delitem(app.extensions, 'export_jobs', raising=False)
+    (tmp_path / '{}.json'.format('0' * 32)).write_text(json.dumps({'account_id': '1', 'status': 'running'}))
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.no_role)
+    headers['X-Account-Id'] = '1'
+
+    rv = client.post('/api/v1/directors/export/jobs/?field=firstNme&operator=contains&value=ad', headers=headers)
+
+    assert rv.status_code == http_status.HTTP_429_TOO_MANY_REQUESTS
+
 
 def test_search_directors_first_name_exact(client, jwt, session):  # pylint:disable=unused-argument
     """Assert that directors can be searched via GET."""
@@ -169,6 +321,44 @@ def test_search_corporations_name(client, jwt, session):  # pylint: disable=unus
     assert len(dictionary['results']) == 1
 
 
+def test_search_corporations_cursor(client, jwt, session):  # pylint: disable=unused-argument
+    """Check we can page through corps with a cursor."""
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.no_role)
+
+    rv = client.get('/api/v1/businesses/?query=pembina&sort_type=dsc&sort_value=corpNme&after=', headers=headers)
+
+    assert rv.status_code == http_status.HTTP_200_OK
+    dictionary = json.loads(rv.data)
+    validate(dictionary, schema=CORPSEARCH_SCHEMA)
+    assert dictionary['results'][0]['corpNum'] == '1234567890'
+    assert dictionary['nextCursor'] is None
+
+    rv = client.get('/api/v1/businesses/?query=pembina&after=forged', headers=headers)
+    assert rv.status_code == http_status.HTTP_400_BAD_REQUEST
+
+
+def test_search_corporations_count(client, jwt, session):  # pylint: disable=unused-argument
+    """Check we can count corp search results."""
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.no_role)
+    rv = client.get('/api/v1/businesses/count/?query=pembina', headers=headers)
+
+    assert rv.status_code == http_status.HTTP_200_OK
+    assert json.loads(rv.data) == {'numResults': 1, 'numResultsEstimated': False}
+
+
+def test_search_corporations_count_bad_search(client, jwt, session, monkeypatch):  # pylint: disable=unused-argument
+    """Check that a bad corp search is refused when counted, as when searched."""
+    def search_corporations(args, include_addr=False):
+        raise BadSearchValue('Bad value.')
+
+    monkeypatch.setattr(Corporation, 'search_corporations', staticmethod(search_corporations))
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.no_role)
+    rv = client.get('/api/v1/businesses/count/?query=pembina', headers=headers)
+
+    assert rv.status_code == http_status.HTTP_400_BAD_REQUEST
+    assert rv.data == b'Invalid search: Bad value.'
+
+
 def test_search_corporations_xlsx_export(client, jwt, session):  # pylint: disable=unused-argument
     """Check we can export corps."""
     headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.no_role)
@@ -180,6 +370,20 @@ def test_search_corporations_xlsx_export(client, jwt, session):  # pylint: disab
     )
 
     assert rv.status_code == http_status.HTTP_200_OK
+    rows = list(load_workbook(io.BytesIO(rv.data)).active.values)
+    assert rows[0] == ('Inc/Reg #', 'Entity Type', 'Company Name', 'Incorporated', 'Company Status')
+    assert [row[2] for row in rows[1:]] == ['Pembina Pipeline']
+
+
+def test_search_corporations_ndjson_export(client, jwt, session):  # pylint: disable=unused-argument
+    """Check we can export corps as newline-delimited JSON."""
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.no_role)
+
+    rv = client.get('/api/v1/businesses/export/?query=pembina&format=ndjson', headers=headers)
+
+    assert rv.status_code == http_status.HTTP_200_OK
+    lines = [json.loads(line) for line in rv.data.decode('utf-8').splitlines()]
+    assert [line['Company Name'] for line in lines] == ['Pembina Pipeline']
 
 
 def test_get_director(client, jwt, session):  # pylint:disable=unused-argument
@@ -228,6 +432,25 @@ def test_get_director(client, jwt, session):  # pylint:disable=unused-argument
 #     assert 'sameNameAndCompany' in dictionary
 
 
+def test_get_director_query_count(client, jwt, session):  # pylint:disable=unused-argument
+    """Assert that a director is retrieved in a fixed number of queries."""
+    statements = []
+
+    def record_statement(conn, cursor, statement, *args):  # pylint:disable=unused-argument
+        if statement.startswith('SELECT'):
+            statements.append(statement)
+
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.no_role)
+    event.listen(db.engine, 'before_cursor_execute', record_statement)
+    try:
+        rv = client.get('/api/v1/directors/22', headers=headers, content_type='application/json')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_statement)
+
+    assert rv.status_code == http_status.HTTP_200_OK
+    assert len(statements) <= 8
+
+
 def test_search_directors(client, jwt, session):  # pylint:disable=unused-argument
     """Assert that directors can be searched via GET."""
     dictionary = _dir_search(
@@ -0,0 +1,141 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests to assure the authorization check.
+
+Test-Suite to ensure that the DIR_SEARCH authorization check against the auth api is working as expected.
+"""
+
+import threading
+import time
+
+from flask import g
+import requests
+
+from search_api.auth import _get_auth_api_session, authorized, jwt
+
+
+class _AuthApiResponse:  # pylint: disable=too-few-public-methods
+    """A canned auth api response."""
+
+    def __init__(self, status_code, body):
+        """Create a response with the given status and JSON body."""
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        """Return the JSON body."""
+        return self.body
+
+
+def _mock_auth_api(app, monkeypatch, response):
+    """Point the app at a mocked auth api, and return the list of urls it is called with."""
+    calls = []
+
+    def get(url, headers, timeout):  # pylint: disable=unused-argument
+        assert timeout == app.config['AUTH_API_TIMEOUT']
+        calls.append(url)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    app.config.update(DEBUG=False, TESTING=False, AUTH_API_URL='http://auth-api')
+    with app.app_context():
+        monkeypatch.setattr(_get_auth_api_session(), 'get', get)
+    return calls
+
+
+def test_authorized_is_cached(app_request, monkeypatch):
+    """Assert that the auth api is only asked once per token and account."""
+    calls = _mock_auth_api(app_request, monkeypatch, _AuthApiResponse(200, {'orgMembership': 'MEMBER'}))
+
+    with app_request.test_request_context(headers={'Authorization': 'Bearer token'}):
+        assert authorized(jwt, '1')
+        assert authorized(jwt, '1')
+        assert len(calls) == 1
+
+        assert authorized(jwt, '2')
+        assert len(calls) == 2
+
+    with app_request.test_request_context(headers={'Authorization': 'Bearer other-token'}):
+        assert authorized(jwt, '1')
+        assert len(calls) == 3
+
+
+def test_concurrent_authorized_checks_are_coalesced(app_request, monkeypatch):
+    """Assert that concurrent checks for the same token and account share one auth api call."""
+    release = threading.Event()
+    response = _AuthApiResponse(200, {'orgMembership': 'MEMBER'})
+    calls = _mock_auth_api(app_request, monkeypatch, response)
+
+    def slow_json():
+        release.wait(5)
+        return response.body
+
+    monkeypatch.setattr(response, 'json', slow_json)
+    results = []
+
+    def check():
+        with app_request.test_request_context(headers={'Authorization': 'Bearer token'}):
+            results.append(authorized(jwt, '1'))
+
+    threads = [threading.Thread(target=check) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [True] * 5
+    assert len(calls) == 1
+
+
+def test_unauthorized_is_cached(app_request, monkeypatch):
+    """Assert that refusals are cached, but outages are not."""
+    calls = _mock_auth_api(app_request, monkeypatch, _AuthApiResponse(403, {}))
+
+    with app_request.test_request_context(headers={'Authorization': 'Bearer token'}):
+        assert not authorized(jwt, '1')
+        assert not authorized(jwt, '1')
+        assert len(calls) == 1
+
+    calls = _mock_auth_api(app_request, monkeypatch, _AuthApiResponse(503, {}))
+
+    with app_request.test_request_context(headers={'Authorization': 'Bearer token'}):
+        assert not authorized(jwt, '2')
+        assert not authorized(jwt, '2')
+        assert len(calls) == 2
+
+
+def test_auth_api_timeout(app_request, monkeypatch):
+    """Assert that the auth api is called with a timeout, and that a check that times out is refused uncached."""
+    app_request.config['AUTH_API_TIMEOUT'] = 0.5
+    calls = _mock_auth_api(app_request, monkeypatch, requests.exceptions.ReadTimeout())
+
+    with app_request.test_request_context(headers={'Authorization': 'Bearer token'}):
+        assert not authorized(jwt, '1')
+        assert not authorized(jwt, '1')
+        assert len(calls) == 2
+
+
+def test_authorized_cache_respects_token_expiry(app_request, monkeypatch):
+    """Assert that an answer is not cached beyond the expiry of the token."""
+    calls = _mock_auth_api(app_request, monkeypatch, _AuthApiResponse(200, {'orgMembership': 'MEMBER'}))
+
+    with app_request.test_request_context(headers={'Authorization': 'Bearer token'}):
+        g.jwt_oidc_token_info = {'exp': time.time() - 1}
+        assert authorized(jwt, '1')
+        assert authorized(jwt, '1')
+        assert len(calls) == 2
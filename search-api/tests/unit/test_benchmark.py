@@ -0,0 +1,52 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the benchmark harness."""
+
+import pytest
+
+import benchmark
+
+
+def test_run(app, session):  # pylint:disable=unused-argument
+    """Each scenario reports its timings, rows and SQL, or its error."""
+    with app.app_context():
+        results = benchmark.run(app, ['exact', 'detail', 'export'], iterations=2, warmup=0)
+
+    exact = results['scenarios']['exact']
+    assert exact['iterations'] == 2
+    assert exact['rows'] > 0
+    assert exact['queries'] == len(exact['sql'])
+    assert any('corp_party' in statement.lower() for statement in exact['sql'])
+    assert exact['first_row_ms']['p50'] <= exact['total_ms']['p50']
+    assert set(exact['total_ms']) == {'p50', 'p95', 'p99'}
+    assert 'error' not in results['scenarios']['detail']
+    assert 'error' not in results['scenarios']['export']
+
+
+def test_pages(app, session, monkeypatch):  # pylint:disable=unused-argument
+    """Rows are fetched a page at a time, as the search endpoints page them."""
+    monkeypatch.setattr(benchmark, 'PER_PAGE', 2)
+    with app.app_context():
+        query = benchmark.CorpParty.query.order_by(benchmark.CorpParty.corp_party_id)
+        rows = list(benchmark._pages(query))  # pylint: disable=protected-access
+        assert [row.corp_party_id for row in rows] == \
+            [row.corp_party_id for row in query.limit(benchmark.MAX_PAGED_RESULTS)]
+
+
+def test_main_unknown_scenario(capsys):
+    """An unknown scenario is refused before anything runs."""
+    with pytest.raises(SystemExit) as excinfo:
+        benchmark.main(['exact', 'nope'])
+    assert excinfo.value.code == 2
+    assert 'unknown scenario: nope' in capsys.readouterr().err
@@ -0,0 +1,82 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the synthetic data generator."""
+
+from generate_data import Generator
+from search_api.models.corporation import Corporation
+
+
+class _RecordingLoader:
+    """A loader that keeps the generated rows, by table name, instead of loading them."""
+
+    def __init__(self):
+        """Start with no rows."""
+        self.rows = {}
+
+    def add(self, model, **row):
+        """Keep a row."""
+        self.rows.setdefault(model.__tablename__, []).append(row)
+
+    def flush(self):
+        """Do nothing: the rows are kept."""
+
+
+def test_generate(app, session):  # pylint:disable=unused-argument
+    """The generated rows refer to each other, with IDs after the existing rows."""
+    loader = _RecordingLoader()
+    with app.app_context():
+        Generator(loader, seed=1).generate(300)
+    rows = loader.rows
+
+    assert len(rows['corp_party']) == 300
+    assert len(rows['address']) > len(rows['corp_party'])
+
+    corp_nums = {row['corp_num'] for row in rows['corporation']}
+    assert corp_nums == {row['corp_num'] for row in rows['corp_state']}
+    assert corp_nums == {row['corp_num'] for row in rows['corp_name']}
+    addr_ids = {row['addr_id'] for row in rows['address']}
+    event_ids = {row['event_id'] for row in rows['event']}
+    assert event_ids == {row['event_id'] for row in rows['filing']}
+    party_ids = {row['corp_party_id'] for row in rows['corp_party']}
+    assert {row['corp_party_id'] for row in rows['offices_held']} == party_ids
+
+    # bootstrap.py's rows have IDs from 0 to 29.
+    assert min(party_ids) == min(addr_ids) == min(event_ids) == 30
+
+    for party in rows['corp_party']:
+        assert party['corp_num'] in corp_nums
+        assert party['start_event_id'] in event_ids
+        assert party['end_event_id'] is None or party['end_event_id'] in event_ids
+        assert party['mailing_addr_id'] is None or party['mailing_addr_id'] in addr_ids
+        assert party['delivery_addr_id'] is None or party['delivery_addr_id'] in addr_ids
+
+    # The same seed generates the same rows.
+    again = _RecordingLoader()
+    with app.app_context():
+        Generator(again, seed=1).generate(300)
+    assert again.rows == rows
+
+
+def test_generate_corp_nums(app, session):  # pylint:disable=unused-argument
+    """Corporation numbers follow the largest existing generated number, whatever its prefix."""
+    loader = _RecordingLoader()
+    with app.app_context():
+        session.add(Corporation(corp_num='C0000042', corp_typ_cd='ULC'))
+        session.add(Corporation(corp_num='BC0000500', corp_typ_cd='BC'))
+        session.add(Corporation(corp_num='A00000999', corp_typ_cd='A'))
+        session.flush()
+        Generator(loader, seed=1).generate(30)
+
+    numbers = [int(row['corp_num'][-7:]) for row in loader.rows['corporation']]
+    assert numbers == list(range(501, 501 + len(numbers)))
@@ -0,0 +1,74 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the load test."""
+
+import loadtest
+from search_api.utils.metrics import DB_POOL_WAIT
+
+
+def test_load_requests():
+    """Requests are read from JSONL and from access logs."""
+    lines = [
+        '{"path": "/api/v1/directors/", "params": {"field": "lastNme", "value": "smith"}}\n',
+        '{"method": "post", "path": "/api/v1/directors/export/jobs/?format=csv", "params": [["value", "a b"]]}\n',
+        '127.0.0.1 - - [01/Jan/2020:00:00:00 +0000] "GET /api/v1/businesses/?query=energy HTTP/1.1" 200 512\n',
+        'Starting gunicorn 20.0.4\n',
+    ]
+    assert loadtest.load_requests(lines) == [
+        ('GET', '/api/v1/directors/?field=lastNme&value=smith'),
+        ('POST', '/api/v1/directors/export/jobs/?format=csv&value=a+b'),
+        ('GET', '/api/v1/businesses/?query=energy'),
+    ]
+
+
+def test_benchmark_skips_token(app, client, session, monkeypatch):  # pylint:disable=unused-argument
+    """With BENCHMARK set, requests need no token."""
+    assert client.get('/api/v1/directors/30').status_code == 401
+
+    monkeypatch.setitem(app.config, 'BENCHMARK', True)
+    assert client.get('/api/v1/directors/1').status_code == 200
+
+
+class _Client:
+    """A client whose requests fail for paths with 'fail' in them."""
+
+    def request(self, method, path):  # pylint: disable=unused-argument, no-self-use
+        """Return a status code, and a database connection wait."""
+        return (500 if 'fail' in path else 200), 0.001
+
+
+def test_run(app):
+    """Each request is replayed and counted against its endpoint."""
+    results = loadtest.Results(app)
+    replay = [('GET', '/ops/healthz'), ('GET', '/api/v1/directors/1'), ('GET', '/fail')]
+    elapsed = loadtest.run(_Client(), results, replay, concurrency=4, total_requests=30)
+    summary = results.summarize(elapsed)
+
+    assert set(summary) == {'OPS.healthz', 'DIRECTORS_API.get_corp_party_by_id', '/fail'}
+    assert summary['OPS.healthz']['requests'] == 10
+    assert summary['OPS.healthz']['error_rate'] == 0
+    assert summary['/fail']['error_rate'] == 1
+    assert summary['OPS.healthz']['pool_wait_ms']['mean'] == 1.0
+    assert set(summary['OPS.healthz']['latency_ms']) == {'p50', 'p95', 'p99'}
+
+
+def test_in_process_client_pool_wait(app, monkeypatch):
+    """The in-process client reports the connection wait the pool's metrics observed for its request."""
+    observed = []
+    monkeypatch.setattr(DB_POOL_WAIT, 'observe', observed.append)
+
+    status, pool_wait = loadtest.InProcessClient(app).request('GET', '/ops/healthz')
+    assert status == 200
+    assert observed
+    assert pool_wait == sum(observed)
@@ -7,12 +7,28 @@ Test suite to ensure that the Entity model routines are working as expected.
 """
 
 import datetime
-from sqlalchemy import func
+
+import pytest
+from sqlalchemy import event, func
+from sqlalchemy.dialects import oracle
 from werkzeug.datastructures import ImmutableMultiDict
 
+from search_api.models import address
+from search_api.models.address import Address
+from search_api.models.base import db
 from search_api.models.corporation import Corporation
+from search_api.models.corp_name import CorpName
 from search_api.models.corp_party import CorpParty
+from search_api.models.corp_party_search import CorpPartySearch
+from search_api.models.event import Event
+from search_api.models.name_key import NameKey, get_soundex
+from search_api.models import nickname
 from search_api.models.nickname import NickName
+from search_api.models.officer_type import OfficerType
+from search_api.models.reference_data import ReferenceData, get_description, get_reference_data
+from search_api.utils.model_utils import BadSearchValue
+from search_api.utils.pagination import get_first_results, get_page, seek
+from search_api.utils.search_count import count_search_results
 
 
 DEFAULT_DATE = datetime.datetime.now() + datetime.timedelta(weeks=-1)
@@ -43,6 +59,44 @@ def test_corporation_search(session):  # pylint: disable=unused-argument
     # assert results.count() == 1
 
 
+def test_corporation_search_seek(session):  # pylint: disable=unused-argument
+    """Assert that Corporation search cursors page through results and reject tampering."""
+    args = ImmutableMultiDict([('query', 'an')])
+    keys = Corporation.get_search_sort_keys(args)
+
+    expected, _ = seek(Corporation.search_corporations(args), keys, None, 100)
+    rows, next_cursor = seek(Corporation.search_corporations(args), keys, None, 2)
+    assert [r.corp_num for r in rows] == [r.corp_num for r in expected[:2]]
+
+    rows, _ = seek(Corporation.search_corporations(args), keys, next_cursor, 2)
+    assert [r.corp_num for r in rows] == [r.corp_num for r in expected[2:4]]
+
+    payload, signature = next_cursor.split('.')
+    with pytest.raises(BadSearchValue):
+        seek(Corporation.search_corporations(args), keys, payload[:-2] + '.' + signature, 2)
+
+    # A cursor is only valid for the sort it was created with.
+    args = ImmutableMultiDict([('query', 'an'), ('sort_type', 'dsc'), ('sort_value', 'corpNme')])
+    with pytest.raises(BadSearchValue):
+        seek(Corporation.search_corporations(args), Corporation.get_search_sort_keys(args), next_cursor, 2)
+
+
+def test_normalize_addrs(session, monkeypatch):  # pylint: disable=unused-argument
+    """Assert that Addresses are normalized in bulk, in chunks, tolerating missing ids."""
+    monkeypatch.setattr(address, 'IN_CLAUSE_LIMIT', 2)
+
+    addresses = Address.normalize_addrs([1, 2, 2, 3, None, 999999])
+
+    assert addresses == {
+        1: '106 Saint-Georges Rue, La Prairie, QC',
+        2: 'PO Box 273, Beiseker, AB',
+        3: '1586 Des Erables Rue, Chicoutimi, QC',
+        999999: '',
+    }
+    assert Address.normalize_addr(2) == addresses[2]
+    assert Address.normalize_addr(None) == ''
+
+
 def test_corp_party_search(session):  # pylint: disable=unused-argument
     """Assert that CorpParty entities can be found by name."""
     args = ImmutableMultiDict(
@@ -63,6 +117,141 @@ def test_corp_party_search(session):  # pylint: disable=unused-argument
     assert results[1].last_nme == 'Patterson'
 
 
+def test_corp_party_search_seek(session):  # pylint: disable=unused-argument
+    """Assert that keyset pagination returns every CorpParty search result once, in sort order."""
+    for sort in ([], [('sort_type', 'dsc'), ('sort_value', 'middleNme')]):
+        args = ImmutableMultiDict(
+            [('field', 'anyNme'), ('operator', 'contains'), ('value', 'an'), ('mode', 'ALL')] + sort)
+        keys = CorpParty.get_search_sort_keys(args)
+
+        expected, next_cursor = seek(CorpParty.search_corp_parties(args), keys, None, 100)
+        assert next_cursor is None
+        assert len(expected) > 3
+
+        paged = []
+        next_cursor = None
+        while True:
+            rows, next_cursor = seek(CorpParty.search_corp_parties(args), keys, next_cursor, 2)
+            assert len(rows) <= 2
+            paged.extend(rows)
+            if not next_cursor:
+                break
+
+        assert [r.corp_party_id for r in paged] == [r.corp_party_id for r in expected]
+
+
+def test_corp_party_search_page(session):  # pylint: disable=unused-argument
+    """Assert that a page of CorpParty search results is fetched on its own, within the first max_results rows."""
+    args = ImmutableMultiDict([('field', 'anyNme'), ('operator', 'contains'), ('value', 'an'), ('mode', 'ALL')])
+    expected = [r.corp_party_id for r in CorpParty.search_corp_parties(args)]
+
+    pages = [get_page(CorpParty.search_corp_parties(args), page, 2) for page in range(1, len(expected) // 2 + 2)]
+    assert [r.corp_party_id for rows in pages for r in rows] == expected
+    assert [r.corp_party_id for r in get_page(CorpParty.search_corp_parties(args), 2, 2, max_results=3)] == \
+        expected[2:3]
+    assert get_page(CorpParty.search_corp_parties(args), 3, 2, max_results=3) == []
+
+
+def test_corp_party_search_first_results(session):  # pylint: disable=unused-argument
+    """Assert that the exported rows are the first in the search's order, on Oracle too."""
+    args = ImmutableMultiDict([('field', 'anyNme'), ('operator', 'contains'), ('value', 'an'), ('mode', 'ALL'),
+                               ('sort_type', 'dsc'), ('sort_value', 'lastNme')])
+    expected = [r.corp_party_id for r in CorpParty.search_corp_parties(args)]
+    assert [r.corp_party_id for r in get_first_results(CorpParty.search_corp_parties(args), 2)] == expected[:2]
+
+    # ROWNUM is applied outside the ordered query, not before its ORDER BY.
+    sql = str(get_first_results(CorpParty.search_corp_parties(args), 2).statement.compile(dialect=oracle.dialect()))
+    assert sql.index('ORDER BY') < sql.index('ROWNUM')
+
+
+def test_corp_party_search_count(app, session, monkeypatch):  # pylint: disable=unused-argument
+    """Assert that CorpParty search results are counted exactly within the budget, and estimated beyond it."""
+    args = ImmutableMultiDict([('field', 'anyNme'), ('operator', 'contains'), ('value', 'an'), ('mode', 'ALL')])
+    expected = CorpParty.search_corp_parties(args).count()
+
+    app.extensions.pop('search_count_cache', None)
+    assert count_search_results(CorpParty.search_corp_parties(args)) == (expected, False)
+
+    # Cached per query, so changing the budget has no effect until the cache is cleared.
+    monkeypatch.setitem(app.config, 'SEARCH_COUNT_BUDGET', 2)
+    assert count_search_results(CorpParty.search_corp_parties(args)) == (expected, False)
+
+    app.extensions.pop('search_count_cache', None)
+    assert count_search_results(CorpParty.search_corp_parties(args)) == (2, True)
+    app.extensions.pop('search_count_cache', None)
+
+
+def test_corp_party_search_denormalized(session):  # pylint: disable=unused-argument
+    """Assert that searching the corp_party_search table finds the same CorpParty rows as the joins do."""
+    result = CorpPartySearch.refresh()
+    assert result['full']
+    assert result['rows'] == CorpParty.query_corp_parties(
+        ImmutableMultiDict([('field', 'partyTypCd'), ('operator', 'excludes'), ('value', 'XX')])).count()
+
+    searches = [
+        [('field', 'lastNme'), ('operator', 'exact'), ('value', 'patterson')],
+        [('field', 'anyNme'), ('operator', 'contains'), ('value', 'an'), ('additional_cols', 'address')],
+        [('field', 'firstNme'), ('operator', 'nicknames'), ('value', 'lily')],
+        [('field', 'corpNme'), ('operator', 'startswith'), ('value', 'pem'), ('additional_cols', 'active')],
+        [('field', 'postalCd'), ('operator', 'exact'), ('value', 'v0b1g3')],
+        [('field', 'addr'), ('operator', 'text'), ('value', '58a ave')],
+        [('field', 'anyNme'), ('operator', 'contains'), ('value', 'an'), ('field', 'stateTypCd'),
+         ('operator', 'exact'), ('value', 'ACT'), ('mode', 'ALL'), ('sort_type', 'dsc'), ('sort_value', 'corpNme')],
+    ]
+    for search in searches:
+        args = ImmutableMultiDict(search)
+        expected = sorted(tuple(row) for row in CorpParty.query_corp_parties(args, denormalized=False))
+        rows = CorpParty.query_corp_parties(args, denormalized=True).all()
+        assert expected
+        assert sorted(tuple(row) for row in rows) == expected
+
+        paged, _ = seek(CorpParty.query_corp_parties(args, denormalized=True),
+                        CorpParty.get_search_sort_keys(args, denormalized=True), None, 100)
+        assert [row.corp_party_id for row in paged] == [row.corp_party_id for row in rows]
+
+
+def test_corp_party_search_refresh(session):  # pylint: disable=unused-argument
+    """Assert that a refresh reloads only the corporations with new events."""
+    CorpPartySearch.refresh()
+    party = CorpPartySearch.query.first()
+    count = CorpPartySearch.query.count()
+
+    event_id = db.session.query(func.max(Event.event_id)).scalar() + 1
+    db.session.add(Event(event_id=event_id, corp_num=party.corp_num))
+    CorpParty.query.filter(CorpParty.corp_party_id == party.corp_party_id).update(
+        {'end_event_id': event_id}, synchronize_session=False)
+
+    result = CorpPartySearch.refresh()
+    assert not result['full']
+    assert result['corporations'] == 1
+    assert result['last_event_id'] == event_id
+    assert not CorpPartySearch.query.filter(CorpPartySearch.corp_party_id == party.corp_party_id).count()
+    assert CorpPartySearch.query.count() == count - 1
+
+    assert CorpPartySearch.refresh()['corporations'] == 0
+
+
+def test_corp_party_search_one_name(session):  # pylint: disable=unused-argument
+    """Assert that a party of a corporation with several current names is loaded once, with its CO name."""
+    party = CorpParty.query.filter(
+        CorpParty.end_event_id == None).first()  # noqa: E711 # pylint: disable=singleton-comparison
+    name = CorpName.query.filter(CorpName.corp_num == party.corp_num).one()
+    session.add(CorpName(corp_num=party.corp_num, corp_name_seq_num=1, corp_nme='0123456 B.C. LTD.',
+                         corp_name_typ_cd='NB'))
+    session.add(CorpName(corp_num=party.corp_num, corp_name_seq_num=3, corp_nme='LATER NAME LTD.',
+                         corp_name_typ_cd='CO'))
+    session.flush()
+
+    CorpPartySearch.refresh(full=True)
+    rows = CorpPartySearch.query.filter(CorpPartySearch.corp_party_id == party.corp_party_id).all()
+    assert [row.corp_nme for row in rows] == [name.corp_nme]
+
+    event_id = db.session.query(func.max(Event.event_id)).scalar() + 1
+    db.session.add(Event(event_id=event_id, corp_num=party.corp_num))
+    assert CorpPartySearch.refresh()['corporations'] == 1
+    assert CorpPartySearch.query.filter(CorpPartySearch.corp_party_id == party.corp_party_id).count() == 1
+
+
 def test_corp_party_same_addr(session):  # pylint: disable=unused-argument
     """Assert that CorpParty entities at same address can be found."""
     results = CorpParty.get_corp_party_at_same_addr(1)
@@ -86,3 +275,152 @@ def test_corp_party_nicknames(session):
 
     results = CorpParty.query.filter(func.upper(CorpParty.first_nme).in_(alias_list))
     assert results.count() == 2
+
+
+def test_get_soundex():
+    """Assert that names are given their American Soundex keys."""
+    assert get_soundex('Smith') == get_soundex('SMYTH') == 'S530'
+    assert get_soundex('Robert') == get_soundex('Rupert') == 'R163'
+    assert get_soundex('Ashcraft') == 'A261'
+    assert get_soundex('Tymczak') == 'T522'
+    assert get_soundex('Pfister') == 'P236'
+    assert get_soundex("O'Hara") == 'O600'
+    assert get_soundex('Li') == 'L000'
+    assert get_soundex('-') == ''
+
+
+def test_corp_party_phonetic(app, session, monkeypatch):  # pylint: disable=unused-argument
+    """Assert that CorpParty entities can be found by how their names sound, with or without corp_party_search."""
+    party = CorpParty.query.filter(CorpParty.last_nme == 'Little').one()
+    session.add(CorpParty(
+        corp_party_id=db.session.query(func.max(CorpParty.corp_party_id)).scalar() + 1,
+        corp_num=party.corp_num,
+        party_typ_cd=party.party_typ_cd,
+        start_event_id=party.start_event_id,
+        mailing_addr_id=party.mailing_addr_id,
+        first_nme='Jon',
+        last_nme='Smith',
+    ))
+    CorpPartySearch.refresh()
+    assert NameKey.refresh() > 0
+    assert NameKey.refresh() == 0
+
+    args = ImmutableMultiDict([('field', 'lastNme'), ('operator', 'phonetic'), ('value', 'Smyth')])
+    results = CorpParty.search_corp_parties(args).all()
+    assert [row.last_nme for row in results] == ['Smith']
+
+    # The rows loaded before their names had keys are backfilled.
+    assert not CorpParty.query_corp_parties(args, denormalized=True).count()
+    assert CorpPartySearch.fill_name_keys() > 0
+    assert CorpPartySearch.fill_name_keys() == 0
+    denormalized = CorpParty.query_corp_parties(args, denormalized=True).all()
+    assert sorted(row.corp_party_id for row in denormalized) == sorted(row.corp_party_id for row in results)
+
+    args = ImmutableMultiDict([('field', 'anyNme'), ('operator', 'phonetic'), ('value', 'Lyttle')])
+    assert [row.last_nme for row in CorpParty.search_corp_parties(args)] == ['Little']
+
+    for field in ('corpNme', 'middleNme'):
+        args = ImmutableMultiDict([('field', field), ('operator', 'phonetic'), ('value', 'Smyth')])
+        with pytest.raises(BadSearchValue):
+            CorpParty.search_corp_parties(args)
+
+    # There's no name_key table on Oracle.
+    monkeypatch.delitem(app.extensions, 'name_tables', raising=False)
+    monkeypatch.setitem(app.config, 'IS_ORACLE', True)
+    args = ImmutableMultiDict([('field', 'lastNme'), ('operator', 'phonetic'), ('value', 'Smyth')])
+    with pytest.raises(BadSearchValue, match='not available'):
+        CorpParty.search_corp_parties(args)
+
+
+def test_nickname_aliases(session):  # pylint: disable=unused-argument
+    """Assert that nicknames are expanded from the in-memory nickname table, without querying the database."""
+    assert NickName.refresh_nicknames() == 4
+    assert NickName.get_aliases('LILI') == frozenset({'LILLIAN', 'LILY', 'LILI'})
+    assert NickName.get_aliases('GEORGE') == frozenset({'GEORGE'})
+    assert NickName.get_aliases('NOBODY') == frozenset()
+
+    statements = []
+
+    def record_statement(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record_statement)
+    try:
+        expr = NickName.get_nickname_search_expr(CorpParty.first_nme, 'LILY')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_statement)
+
+    assert statements == []
+    assert CorpParty.query.filter(expr).count() == 2
+
+
+def test_nickname_groups():
+    """Assert that a name in several nickname groups has the aliases of all of them."""
+    aliases = nickname._get_alias_map(  # pylint: disable=protected-access
+        [(1, 'BOB'), (1, 'ROBERT'), (2, 'ROBERT'), (2, 'ROB')])
+    assert aliases['ROBERT'] == frozenset({'BOB', 'ROBERT', 'ROB'})
+    assert aliases['BOB'] == frozenset({'BOB', 'ROBERT'})
+
+
+def test_nickname_refresh_stamp(app, session, tmp_path, monkeypatch):  # pylint: disable=unused-argument
+    """Assert that a refresh in one worker makes the others reload their nicknames."""
+    monkeypatch.setitem(app.config, 'REFRESH_STAMP_DIR', str(tmp_path))
+    other_worker = nickname.NickNameCache(0)
+    assert 'LIL' not in other_worker.get_aliases('LILI')
+
+    name_id = session.query(NickName.name_id).filter(NickName.name == 'LILI').scalar()
+    session.add(NickName(name_id=name_id, name='LIL'))
+    session.flush()
+    assert 'LIL' not in other_worker.get_aliases('LILI')
+
+    NickName.refresh_nicknames()
+    assert 'LIL' in other_worker.get_aliases('LILI')
+
+
+def test_reference_data(session):  # pylint: disable=unused-argument
+    """Assert that code descriptions are looked up in the in-memory code tables, without querying the database."""
+    get_reference_data().refresh()
+
+    statements = []
+
+    def record_statement(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record_statement)
+    try:
+        assert get_description('party_type', 'DIR') == 'Director'
+        assert get_description('officer_type', 'SEC ') == 'Secretary'
+        assert get_description('corp_op_state', 'HIS', 'full_desc') == 'Historical'
+        assert get_description('party_type', 'XYZ') is None
+        assert get_description('filing_type', None) is None
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_statement)
+
+    assert statements == []
+
+
+def test_reference_data_refresh_stamp(app, session, tmp_path, monkeypatch):  # pylint: disable=unused-argument
+    """Assert that a refresh in one worker makes the others reload their code tables."""
+    monkeypatch.setitem(app.config, 'REFRESH_STAMP_DIR', str(tmp_path))
+    other_worker = ReferenceData(0)
+    assert other_worker.get('officer_type', 'VP') is None
+    version = other_worker.version
+
+    session.add(OfficerType(officer_typ_cd='VP', short_desc='Vice President'))
+    session.flush()
+    assert other_worker.get('officer_type', 'VP') is None
+
+    get_reference_data().refresh()
+    assert other_worker.get('officer_type', 'VP')['short_desc'] == 'Vice President'
+    assert other_worker.version == version + 1
+
+
+def test_reference_data_padded_codes(session):
+    """Assert that CHAR-padded codes are kept as is for IN lists, and found by their stripped value."""
+    session.add(OfficerType(officer_typ_cd='VP ', short_desc='Vice President'))
+    session.flush()
+    get_reference_data().refresh()
+
+    assert 'VP ' in get_reference_data().get_codes('officer_type')
+    assert 'VP' not in get_reference_data().get_codes('officer_type')
+    assert get_description('officer_type', 'VP') == 'Vice President'
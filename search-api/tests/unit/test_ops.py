@@ -17,6 +17,12 @@
 Test-Suite to ensure that the /ops endpoint is working as expected.
 """
 
+from prometheus_client import REGISTRY
+
+from search_api.models.base import db
+from tests.utilities.factory_utils import factory_auth_header
+from tests.utilities.factory_scenarios import TestJwtClaims
+
 
 def test_ops_healthz_success(client):
     """Assert that the service is healthy if it can successfully access the database."""
@@ -42,3 +48,67 @@ def test_ops_readyz(client):
 
     assert rv.status_code == 200
     assert rv.json == {'message': 'api is ready'}
+
+
+def test_ops_refresh_nicknames(client, jwt, session):  # pylint: disable=unused-argument
+    """Assert that the nickname table can be reloaded, only with the ops role."""
+    rv = client.post('/ops/nicknames/refresh')
+    assert rv.status_code == 401
+
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.staff_role)
+    rv = client.post('/ops/nicknames/refresh', headers=headers)
+    assert rv.status_code == 401
+
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.system_role)
+    rv = client.post('/ops/nicknames/refresh', headers=headers)
+
+    assert rv.status_code == 200
+    assert rv.json == {'message': 'nicknames refreshed', 'count': 4}
+
+
+def test_ops_refresh_reference_data(client, jwt, session):  # pylint: disable=unused-argument
+    """Assert that the code tables can be reloaded, only with the ops role, and get a new version each time."""
+    rv = client.post('/ops/reference-data/refresh')
+    assert rv.status_code == 401
+
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.staff_role)
+    rv = client.post('/ops/reference-data/refresh', headers=headers)
+    assert rv.status_code == 401
+
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.system_role)
+    rv = client.post('/ops/reference-data/refresh', headers=headers)
+    assert rv.status_code == 200
+    version = rv.json['version']
+
+    rv = client.post('/ops/reference-data/refresh', headers=headers)
+    assert rv.json == {'message': 'reference data refreshed', 'version': version + 1}
+
+
+def test_ops_metrics(client, jwt, session):  # pylint: disable=unused-argument
+    """Asserts that request latency, connection pool and cache metrics are reported."""
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.staff_role)
+    client.get('/api/v1/directors/?field=lastNme&operator=exact&value=patterson&mode=ALL&sort_type=dsc&'
+               'sort_value=lastNme&additional_cols=none', headers=headers)
+
+    rv = client.get('/ops/metrics')
+
+    assert rv.status_code == 200
+    assert rv.content_type.startswith('text/plain')
+    metrics = rv.data.decode('utf-8')
+    assert ('search_api_request_duration_seconds_count{blueprint="DIRECTORS_API",method="GET",'
+            'route="/api/v1/directors/",status="200"}') in metrics
+    assert 'search_api_cache_lookups_total{cache="search",result="miss"}' in metrics
+    assert 'search_api_db_pool_checked_out' in metrics
+    assert 'search_api_export_duration_seconds' in metrics
+
+
+def test_ops_metrics_first_checkout(app_request):
+    """Assert that a new engine's first connection checkout is timed."""
+    def checkouts():
+        return REGISTRY.get_sample_value('search_api_db_pool_wait_seconds_count') or 0
+
+    before = checkouts()
+    with app_request.app_context():
+        db.engine.execute('SELECT 1')
+
+    assert checkouts() == before + 1
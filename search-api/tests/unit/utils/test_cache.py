@@ -0,0 +1,114 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests to assure the cache utilities.
+
+Test-Suite to ensure that the in-process caches are working as expected.
+"""
+
+import threading
+import time
+
+import pytest
+
+from search_api.utils.cache import SingleFlight, TTLCache
+
+
+def test_ttl_cache_expiry():
+    """Assert that cached values expire after their time-to-live."""
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('long', 1)
+    cache.set('short', 2, ttl=0.01)
+
+    assert cache.get('long') == 1
+    assert cache.get('short') == 2
+
+    time.sleep(0.02)
+    assert cache.get('long') == 1
+    assert cache.get('short') is None
+
+
+def test_ttl_cache_lru_eviction():
+    """Assert that the least recently used entry is evicted when the cache is full."""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def _run_concurrently(func, count):
+    """Call func from count threads at once, and return the results."""
+    results = [None] * count
+
+    def run(i):
+        try:
+            results[i] = func()
+        except ValueError as err:
+            results[i] = err
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_single_flight_coalesces_calls():
+    """Assert that concurrent calls with the same key share one call and its result."""
+    single_flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    threads, results = _run_concurrently(lambda: single_flight.do('key', slow_call), 5)
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ['result'] * 5
+
+    # Once the call finishes, the next one runs again.
+    assert single_flight.do('key', slow_call) == 'result'
+    assert len(calls) == 2
+
+
+def test_single_flight_shares_errors():
+    """Assert that every caller waiting on a failed call gets its exception."""
+    single_flight = SingleFlight()
+    release = threading.Event()
+
+    def failing_call():
+        release.wait(5)
+        raise ValueError('failed')
+
+    threads, results = _run_concurrently(lambda: single_flight.do('key', failing_call), 3)
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert all(isinstance(result, ValueError) for result in results)
+    with pytest.raises(ValueError):
+        single_flight.do('key', failing_call)
@@ -0,0 +1,100 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests to assure the export job utilities.
+
+Test-Suite to ensure that export jobs are submitted as expected.
+"""
+
+import fcntl
+from functools import partial
+import os
+import threading
+import time
+
+import pytest
+
+from search_api.utils.export_jobs import FAILED, QUEUED, ExportJobLimitError, ExportJobs
+
+
+def _failing_search():
+    raise ValueError('no search')
+
+
+def _slow_search(job_dir):
+    """Record the process the job runs in, then take long enough to be seen running."""
+    with open(os.path.join(job_dir, 'search.pid'), 'w') as pid_file:
+        pid_file.write(str(os.getpid()))
+    while not os.path.exists(os.path.join(job_dir, 'search.done')):
+        time.sleep(0.05)
+    raise ValueError('no search')
+
+
+def test_job_runs_outside_the_worker(client, tmp_path):
+    """Assert that a running job is in a process of its own, and doesn't hold up requests to the worker."""
+    jobs = ExportJobs('testing', str(tmp_path), 1, 1, 2, 3600, 3600)
+    try:
+        job = jobs.submit('1', 'owner', 'csv', partial(_slow_search, str(tmp_path)), [], None)
+        deadline = time.time() + 60
+        while not (tmp_path / 'search.pid').exists() and time.time() < deadline:
+            time.sleep(0.05)
+        assert int((tmp_path / 'search.pid').read_text()) != os.getpid()
+
+        start = time.perf_counter()
+        rv = client.get('/ops/readyz')
+        assert rv.status_code == 200
+        assert time.perf_counter() - start < 1
+        assert jobs.get(job['job_id'])['status'] == QUEUED
+
+        (tmp_path / 'search.done').touch()
+        while jobs.get(job['job_id'])['status'] != FAILED and time.time() < deadline:
+            time.sleep(0.05)
+        assert jobs.get(job['job_id'])['error'] == 'no search'
+    finally:
+        jobs._executor.shutdown()  # pylint: disable=protected-access
+
+
+def test_submit_waits_for_lock_file(tmp_path):
+    """Assert that a job is only submitted while no other process holds the job directory's lock file."""
+    jobs = ExportJobs('testing', str(tmp_path), 0, 1, 2, 3600, 3600)
+    submitted = []
+
+    def submit():
+        submitted.append(jobs.submit('1', 'owner', 'csv', _failing_search, [], None))
+
+    # Another worker process, as far as flock is concerned, since it's a separate open file.
+    with open(str(tmp_path / '.submit.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        thread = threading.Thread(target=submit)
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+        assert not submitted
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    thread.join(5)
+    assert submitted[0]['status'] == FAILED
+    assert (tmp_path / '.submit.lock').exists()
+
+
+def test_submit_account_limit(tmp_path):
+    """Assert that an account can't have more than account_limit jobs in progress."""
+    jobs = ExportJobs('testing', str(tmp_path), 0, 1, 2, 3600, 3600)
+    job = jobs.submit('1', 'owner', 'csv', _failing_search, [], None)
+    job['status'] = 'running'
+    jobs._save(job)  # pylint: disable=protected-access
+
+    with pytest.raises(ExportJobLimitError):
+        jobs.submit('1', 'owner', 'csv', _failing_search, [], None)
+    assert jobs.submit('2', 'owner', 'csv', _failing_search, [], None)['status'] == FAILED
@@ -0,0 +1,93 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the query plan capture."""
+
+from search_api.models.base import db
+from search_api.models.corp_party import CorpParty
+from search_api.utils import query_plans
+from search_api.utils.query_plans import capture_plans, find_regressions, get_plan, get_search_cases
+
+
+def test_get_search_cases():
+    """Each field has the operators it supports."""
+    cases = get_search_cases()
+    assert cases['lastNme wildcard'] == [('field', 'lastNme'), ('operator', 'wildcard'), ('value', 'SM*TH')]
+    assert 'anyNme nicknames' in cases
+    assert 'corpNme nicknames' not in cases
+    assert 'addrLine1 text' in cases and 'addrLine1 exact' not in cases
+
+
+def test_get_plan(app, session):  # pylint:disable=unused-argument
+    """SQLite's plan is normalized to its lines, and how each table is read."""
+    with app.app_context():
+        plan = get_plan(CorpParty.query.filter(CorpParty.corp_party_id == 1).statement)
+        assert plan['access'] == [{'scan': 'index', 'table': 'corp_party', 'index': 'primary key'}]
+
+        plan = get_plan(CorpParty.query.filter(CorpParty.last_nme == 'SMITH').statement)
+        assert plan['plan'] == ['SCAN corp_party']
+        assert plan['access'] == [{'scan': 'full', 'table': 'corp_party', 'index': None}]
+
+
+def test_get_postgresql_plan(monkeypatch):
+    """A bitmap index scan is reported against the table of the bitmap heap scan above it."""
+    explained = [{'Plan': {
+        'Node Type': 'Bitmap Heap Scan', 'Relation Name': 'corp_party',
+        'Plans': [{'Node Type': 'Bitmap Index Scan', 'Index Name': 'ix_corp_party_upper_last_nme_trgm'}],
+    }}]
+
+    class _Result:  # pylint: disable=too-few-public-methods
+        def scalar(self):  # pylint: disable=no-self-use
+            return explained
+
+    monkeypatch.setattr(db, 'session', type('Session', (), {'execute': lambda self, statement: _Result()})())
+
+    plan, access = query_plans._get_postgresql_plan(None)  # pylint: disable=protected-access
+    assert plan == ['Bitmap Heap Scan on corp_party', '  Bitmap Index Scan using ix_corp_party_upper_last_nme_trgm']
+    assert access == [{'scan': 'index', 'table': 'corp_party', 'index': 'ix_corp_party_upper_last_nme_trgm'}]
+
+
+def test_capture_plans(app, session):  # pylint:disable=unused-argument
+    """Every case is explained, or reports why it can't be on this database."""
+    with app.app_context():
+        plans = capture_plans()
+
+    # utl_match is Oracle's, so the similar search of fields without the name_gram table is skipped.
+    assert set(plans) == set(get_search_cases()) - {'corpNme similar', 'corpNum similar'}
+    assert 'corp_party' in plans['lastNme exact']['sql']
+    # The upper(last_nme) index makes exact a range scan, but contains still reads every row.
+    assert {'scan': 'index', 'table': 'corp_party', 'index': 'ix_corp_party_upper_last_nme'} in \
+        plans['lastNme exact']['access']
+    assert not find_regressions(plans['lastNme exact'])
+    assert find_regressions(plans['lastNme contains']) == ['full scan of corp_party']
+    assert not any('error' in plan for plan in plans.values())
+    # The first page, as the search endpoint fetches it.
+    assert plans['lastNme exact']['sql'].endswith('LIMIT ? OFFSET ?')
+
+
+def test_find_regressions():
+    """New full scans of large tables, and lost indexes, are regressions."""
+    indexed = {'access': [
+        {'scan': 'index', 'table': 'corp_party', 'index': 'ix_corp_party_upper_last_nme'},
+        {'scan': 'full', 'table': 'corp_op_state', 'index': None},
+    ]}
+    scanned = {'access': [
+        {'scan': 'full', 'table': 'corp_party', 'index': None},
+        {'scan': 'full', 'table': 'corp_op_state', 'index': None},
+    ]}
+    assert not find_regressions(indexed)
+    assert not find_regressions(indexed, indexed)
+    assert not find_regressions(scanned, scanned)
+    assert find_regressions(indexed, scanned) == []
+    assert find_regressions(scanned, indexed) == [
+        'full scan of corp_party', 'no longer uses index ix_corp_party_upper_last_nme']
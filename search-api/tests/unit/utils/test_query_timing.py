@@ -0,0 +1,69 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the per-request SQL timing."""
+
+import logging
+import re
+
+import pytest
+
+from tests.utilities.factory_utils import factory_auth_header
+from tests.utilities.factory_scenarios import TestJwtClaims
+
+
+@pytest.fixture(autouse=True)
+def app_logger(app, monkeypatch):
+    """Enable the app's logger, which test_logging's logging setup disables."""
+    monkeypatch.setattr(app.logger, 'disabled', False)
+
+
+def test_server_timing(app, client, jwt, session, caplog):  # pylint:disable=unused-argument
+    """A request's statements are counted and timed in its Server-Timing header and log."""
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.staff_role)
+    with caplog.at_level(logging.INFO, logger='search_api'):
+        rv = client.get('/api/v1/directors/1', headers=headers)
+
+    assert rv.status_code == 200
+    match = re.match(r'db;dur=[\d.]+;desc="(\d+) queries", db-slowest;dur=[\d.]+$', rv.headers['Server-Timing'])
+    assert match
+    queries = int(match.group(1))
+    assert queries > 1
+
+    record = caplog.records[-1]
+    assert record.queries == queries
+    assert record.endpoint == 'DIRECTORS_API.get_corp_party_by_id'
+    assert record.slowest_sql.startswith('SELECT')
+    assert 'queries={}'.format(queries) in record.getMessage()
+
+
+def test_server_timing_sampled(app, client, jwt, session, monkeypatch):  # pylint:disable=unused-argument
+    """Requests outside the sample aren't timed."""
+    monkeypatch.setitem(app.config, 'QUERY_TIMING_SAMPLE_RATE', 0)
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.staff_role)
+    rv = client.get('/api/v1/directors/1', headers=headers)
+
+    assert rv.status_code == 200
+    assert 'Server-Timing' not in rv.headers
+
+
+def test_slow_query_logged(app, client, jwt, session, monkeypatch, caplog):  # pylint:disable=unused-argument
+    """Statements slower than QUERY_TIMING_SLOW_MS are logged, sampled or not."""
+    monkeypatch.setitem(app.config, 'QUERY_TIMING_SAMPLE_RATE', 0)
+    monkeypatch.setitem(app.config, 'QUERY_TIMING_SLOW_MS', 0)
+    headers = factory_auth_header(jwt=jwt, claims=TestJwtClaims.staff_role)
+    with caplog.at_level(logging.WARNING, logger='search_api'):
+        client.get('/api/v1/directors/1', headers=headers)
+
+    slow = [record for record in caplog.records if record.getMessage().startswith('slow query')]
+    assert any('corp_party' in record.sql for record in slow)
@@ -0,0 +1,66 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests to assure the search response cache."""
+
+from werkzeug.datastructures import ImmutableMultiDict
+
+from search_api.utils.cache import TTLCache
+from search_api.utils.search_cache import SearchCache, _create_backend, get_search_cache_key
+
+
+def _key(*args):
+    return get_search_cache_key('directors', ImmutableMultiDict(args))
+
+
+def test_search_cache_key():
+    """Assert that equivalent searches share a key, and different ones don't."""
+    key = _key(('field', 'firstNme'), ('operator', 'exact'), ('value', 'Lili'),
+               ('field', 'lastNme'), ('operator', 'contains'), ('value', 'ad'), ('mode', 'ALL'))
+
+    assert key == _key(('field', 'lastNme'), ('operator', 'contains'), ('value', 'AD'),
+                       ('field', 'firstNme'), ('operator', 'exact'), ('value', 'LILI'), ('mode', 'ALL'),
+                       ('page', '1'))
+    assert key != _key(('field', 'firstNme'), ('operator', 'exact'), ('value', 'Lili'),
+                       ('field', 'lastNme'), ('operator', 'contains'), ('value', 'ad'), ('mode', 'ALL'),
+                       ('page', '2'))
+    assert key != _key(('field', 'firstNme'), ('operator', 'exact'), ('value', 'Lili'),
+                       ('field', 'lastNme'), ('operator', 'contains'), ('value', 'ad'))
+    assert key.startswith('directors:')
+
+
+def test_search_cache_stats():
+    """Assert that cache hits and misses are counted."""
+    cache = SearchCache(TTLCache(10, 60), 60)
+
+    assert cache.get('a') is None
+    cache.set('a', {'results': []})
+    assert cache.get('a') == {'results': []}
+    assert cache.get_stats() == {'backend': 'TTLCache', 'hits': 1, 'misses': 1, 'hit_ratio': 0.5}
+
+
+def test_search_cache_filesystem(tmp_path):
+    """Assert that the filesystem back-end, shared between processes, caches responses."""
+    config = {'SEARCH_CACHE_BACKEND': 'filesystem', 'SEARCH_CACHE_DIR': str(tmp_path), 'SEARCH_CACHE_TTL': 60}
+    cache = SearchCache(_create_backend(config), 60)
+    cache.set('directors:abc', {'results': [{'corpNum': '1'}]})
+
+    other_process_cache = SearchCache(_create_backend(config), 60)
+    assert other_process_cache.get('directors:abc') == {'results': [{'corpNum': '1'}]}
+
+
+def test_search_cache_none():
+    """Assert that the 'none' back-end caches nothing."""
+    cache = SearchCache(_create_backend({'SEARCH_CACHE_BACKEND': 'none'}), 60)
+    cache.set('a', 1)
+    assert cache.get('a') is None
@@ -0,0 +1,181 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the similar search."""
+
+from werkzeug.datastructures import ImmutableMultiDict
+
+from search_api.models.base import db
+from search_api.models.corp_party import CorpParty
+from search_api.models.corp_party_search import CorpPartySearch
+from search_api.models.name_gram import NameGram, get_grams
+from search_api.utils.model_utils import _get_filter, _get_similarity_score
+from search_api.utils.pagination import decode_cursor, seek
+from search_api.utils import similarity
+from search_api.utils.similarity import (
+    get_nickname_names,
+    get_score_expr,
+    get_similar_names,
+    get_similarity,
+    is_name_table_filled,
+    jaro_winkler,
+)
+
+
+def test_jaro_winkler():
+    """Jaro-Winkler scores as Oracle's utl_match does."""
+    assert round(jaro_winkler('MARTHA', 'MARHTA'), 4) == 0.9611
+    assert round(jaro_winkler('DWAYNE', 'DUANE'), 4) == 0.84
+    assert round(jaro_winkler('DIXON', 'DICKSONX'), 4) == 0.8133
+    assert jaro_winkler('SMITH', 'SMITH') == 1
+    assert jaro_winkler('SMITH', '') == 0
+    assert get_similarity('MARTHA', 'MARHTA') == 96
+
+
+def test_get_grams():
+    """A name's bigrams mark its first and last letters."""
+    assert get_grams('SMITH') == {'#S', 'SM', 'MI', 'IT', 'TH', 'H#'}
+
+
+def test_similar_search(app, session):  # pylint: disable=unused-argument
+    """Similar names are found through the name_gram table, and the most similar come first."""
+    with app.app_context():
+        # bootstrap indexes the names.
+        assert NameGram.refresh() == 0
+
+        similar = get_similar_names('PATERSON')
+        assert similar[0] == ('PATERSON', 100)
+        assert ('PATTERSON', 97) in similar
+        assert ('PATTISON', 88) in similar
+        assert all(score > 85 for _, score in similar)
+
+        args = ImmutableMultiDict([('field', 'lastNme'), ('operator', 'similar'), ('value', 'Paterson')])
+        results = CorpParty.search_corp_parties(args).all()
+        scores = [dict(similar)[row.last_nme.upper()] for row in results]
+        assert scores[0] == 97
+        assert scores == sorted(scores, reverse=True)
+
+        keys = CorpParty.get_search_sort_keys(args)
+        paged, cursor = seek(CorpParty.search_corp_parties(args), keys, None, 2)
+        while cursor:
+            rows, cursor = seek(CorpParty.search_corp_parties(args), keys, cursor, 2)
+            paged.extend(rows)
+        assert [row.corp_party_id for row in paged] == [row.corp_party_id for row in results]
+
+        CorpPartySearch.refresh()
+        denormalized = CorpParty.query_corp_parties(args, denormalized=True).all()
+        assert [row.corp_party_id for row in denormalized] == [row.corp_party_id for row in results]
+
+
+def test_similar_cursor(app, session, monkeypatch):  # pylint: disable=unused-argument
+    """A similar search's cursor stays valid when the names the search matches change."""
+    args = ImmutableMultiDict([('field', 'lastNme'), ('operator', 'similar'), ('value', 'Paterson')])
+    with app.app_context():
+        _, cursor = seek(CorpParty.search_corp_parties(args), CorpParty.get_search_sort_keys(args), None, 1)
+        names = get_similar_names('PATERSON')
+        monkeypatch.setitem(similarity.SCORED_OPERATORS, 'similar', lambda value: names + (('PETERS', 86),))
+        keys = CorpParty.get_search_sort_keys(args)
+        assert decode_cursor(cursor, keys)
+        rows, _ = seek(CorpParty.search_corp_parties(args), keys, cursor, 100)
+        assert rows
+
+
+def test_similar_candidates(app, session, monkeypatch):  # pylint: disable=unused-argument
+    """A short value's candidates share at least two bigrams with it, and only the closest are scored."""
+    with app.app_context():
+        assert set(NameGram.get_candidates('AL', 2)) == {
+            name for name in NameGram.get_candidates('AL', 1) if len(get_grams(name) & get_grams('AL')) >= 2}
+        assert NameGram.get_candidates('PATERSON', 1, 2) == ['PATTERSON', 'PATTRERSON']
+
+        scored = []
+        monkeypatch.setattr(similarity, 'MAX_SIMILAR_CANDIDATES', 2)
+        monkeypatch.setattr(similarity, '_score_names', lambda value, names: scored.extend(names) or ())
+        similarity._find_similar_names('PATERSON')  # pylint: disable=protected-access
+        # And the value itself.
+        assert sorted(scored) == ['PATERSON', 'PATTERSON', 'PATTRERSON']
+
+
+def test_ranked_search(app, session):  # pylint: disable=unused-argument
+    """A search with fuzzy clauses keeps its best-scoring rows, however it's sorted."""
+    with app.app_context():
+        args = ImmutableMultiDict([('field', 'firstNme'), ('operator', 'nicknames'), ('value', 'Lili')])
+        assert get_nickname_names('LILI') == (('LILI', 100), ('LILLIAN', 90), ('LILY', 88))
+        assert [row.first_nme for row in CorpParty.search_corp_parties(args)] == ['Lillian', 'Lily']
+
+        args = ImmutableMultiDict([
+            ('field', 'lastNme'), ('operator', 'similar'), ('value', 'Paterson'),
+            ('sort_type', 'asc'), ('sort_value', 'lastNme'),
+        ])
+        assert CorpParty.search_corp_parties(args).first().last_nme == 'Patten'
+
+        for denormalized in (False, True):
+            CorpPartySearch.refresh()
+            results = CorpParty.query_corp_parties(args, denormalized)
+            best = CorpParty.get_best_search_results(args, results, 3, denormalized).all()
+            # The three closest to PATERSON (97, 97 and 92), in the order asked for, rather than the first three.
+            assert [row.last_nme.upper() for row in best] == ['PATTERSON', 'PATTERSON', 'PATTRERSON']
+
+        args = ImmutableMultiDict([('field', 'lastNme'), ('operator', 'exact'), ('value', 'Patten')])
+        results = CorpParty.search_corp_parties(args)
+        assert CorpParty.get_best_search_results(args, results, 3) is results
+
+
+def test_phonetic_scores(app, session, monkeypatch):  # pylint: disable=unused-argument
+    """The phonetic search matches the MAX_SIMILAR_NAMES most similar names with the key, and scores each of them."""
+    with app.app_context():
+        clauses = [('firstNme', 'phonetic', 'Jane')]
+        args = ImmutableMultiDict([('field', 'firstNme'), ('operator', 'phonetic'), ('value', 'Jane')])
+        for max_names, names in ((1000, {'JANE', 'JOHANNA'}), (1, {'JANE'})):
+            monkeypatch.setattr(similarity, 'MAX_SIMILAR_NAMES', max_names)
+            monkeypatch.delitem(app.extensions, 'phonetic_names', raising=False)
+
+            for denormalized in (False, True):
+                CorpPartySearch.refresh()
+                results = CorpParty.query_corp_parties(args, denormalized).add_columns(
+                    _get_similarity_score(clauses, denormalized).label('score')).all()
+                assert {row.first_nme.upper() for row in results} == names
+                assert all(row.score >= 1 for row in results)
+                assert results[0].first_nme.upper() == 'JANE'
+
+
+def test_score_expr_by_score(app, session, monkeypatch):  # pylint: disable=unused-argument
+    """The score expression has a branch per score, each matching the names with that score."""
+    names = [('PATERSON', 100), ('PATTERSON', 90), ('PETERSON', 90), ('PATTISON', 80), ('PETTERSON', 80)]
+    monkeypatch.setitem(similarity.SCORED_OPERATORS, 'similar', lambda value: names)
+    with app.app_context():
+        expr = get_score_expr('similar', CorpParty.last_nme, 'PATERSON')
+        assert [score.value for _, score in expr.whens] == [100, 90, 80]
+        assert len(expr.compile().params) == len(names) + 3 + 1
+        session.add(CorpParty(corp_party_id=9001, last_nme='Petterson'))
+        session.add(CorpParty(corp_party_id=9002, last_nme='Smith'))
+        scores = dict(db.session.query(CorpParty.corp_party_id, expr).filter(CorpParty.corp_party_id > 9000))
+        assert scores == {9001: 80, 9002: 0}
+
+
+def test_similar_search_without_name_gram(app, session, monkeypatch):  # pylint: disable=unused-argument
+    """Without a filled name_gram table, and always on Oracle, similar names are scored with utl_match."""
+    with app.app_context():
+        monkeypatch.delitem(app.extensions, 'name_tables', raising=False)
+        assert is_name_table_filled(NameGram)
+        assert 'utl_match' not in str(_get_filter('lastNme', 'similar', 'Paterson'))
+
+        NameGram.query.delete()
+        monkeypatch.delitem(app.extensions, 'name_tables')
+        assert not is_name_table_filled(NameGram)
+        assert 'utl_match' in str(_get_filter('lastNme', 'similar', 'Paterson'))
+        assert 'utl_match' in str(_get_similarity_score([('lastNme', 'similar', 'Paterson')]))
+
+        db.session.rollback()
+        monkeypatch.delitem(app.extensions, 'name_tables')
+        monkeypatch.setitem(app.config, 'IS_ORACLE', True)
+        assert not is_name_table_filled(NameGram)
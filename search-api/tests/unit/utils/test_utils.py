@@ -0,0 +1,30 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the general utility functions."""
+
+from search_api.utils.utils import convert_to_snake_case, percentile
+
+
+def test_convert_to_snake_case():
+    """Field names are converted from camelCase."""
+    assert convert_to_snake_case('addrLine1') == 'addr_line_1'
+    assert convert_to_snake_case('lastNme') == 'last_nme'
+
+
+def test_percentile():
+    """Percentiles interpolate between the closest ranks."""
+    values = [4, 1, 3, 2, 5]
+    assert percentile(values, 50) == 3
+    assert percentile(values, 95) == 4.8
+    assert percentile([7], 99) == 7
@@ -0,0 +1,54 @@
+# Copyright © 2020 Province of British Columbia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests to assure the streaming .xlsx writer."""
+
+import datetime
+import io
+
+from openpyxl import load_workbook
+
+from search_api.utils.xlsx import stream_xlsx
+
+
+def test_stream_xlsx():
+    """Assert that the streamed workbook can be read back, with each type of value."""
+    rows = [
+        ['Smith & <Sons>\x01', 12, datetime.date(2020, 3, 4), datetime.datetime(2020, 3, 4, 5, 6, 7), None, True],
+    ]
+    chunks = list(stream_xlsx(['Name', 'Count', 'Date', 'Timestamp', 'Empty', 'Flag'], rows, title='Results'))
+
+    sheet = load_workbook(io.BytesIO(b''.join(chunks))).active
+    assert sheet.title == 'Results'
+    assert list(sheet.values) == [
+        ('Name', 'Count', 'Date', 'Timestamp', 'Empty', 'Flag'),
+        ('Smith & <Sons>', 12, datetime.datetime(2020, 3, 4), datetime.datetime(2020, 3, 4, 5, 6, 7), None, True),
+    ]
+
+
+def test_stream_xlsx_before_rows():
+    """Assert that the workbook's first bytes are yielded before any row is fetched."""
+    fetched = []
+
+    def rows():
+        for i in range(1000):
+            fetched.append(i)
+            yield [i]
+
+    workbook = stream_xlsx(['Number'], rows())
+    first_chunk = next(workbook)
+    assert first_chunk.startswith(b'PK')
+    assert fetched == []
+
+    sheet = load_workbook(io.BytesIO(first_chunk + b''.join(workbook))).active
+    assert sheet.max_row == 1001
@@ -46,6 +46,16 @@ class TestJwtClaims(dict, Enum):
         'realm_access': {'roles': ['dirsearch']},
     }
 
+    system_role = {
+        'iss': 'https://example.localdomain/auth/realms/example',
+        'aud': 'flask-jwt-oidc-test-client',
+        'sub': 'f7a4a1d3-73a8-4cbc-a40f-bb1145302066',
+        'firstname': 'Test',
+        'lastname': 'Service Account',
+        'preferred_username': 'service-account-search',
+        'realm_access': {'roles': ['system']},
+    }
+
     wrong_role = {
         'iss': 'https://example.localdomain/auth/realms/example',
         'aud': 'flask-jwt-oidc-test-client',
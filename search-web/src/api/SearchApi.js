@@ -10,6 +10,10 @@ export function corpPartySearch(query, opts) {
   return ApiService.get(`${DIRECTOR_SEARCH_PREFIX}/?${query}`, opts);
 }
 
+export function corpPartySearchCount(query, opts) {
+  return ApiService.get(`${DIRECTOR_SEARCH_PREFIX}/count/?${query}`, opts);
+}
+
 export function corpPartySearchDetail(id) {
   return ApiService.get(`${DIRECTOR_SEARCH_PREFIX}/${id}`);
 }
@@ -29,6 +33,13 @@ export function corporationSearch(params, cancelToken) {
   });
 }
 
+export function corporationSearchCount(params, cancelToken) {
+  return ApiService.get(`${CORPORATION_SEARCH_PREFIX}/count/`, {
+    cancelToken,
+    params
+  });
+}
+
 export function exportCorpPartySearch(queryString) {
   return ApiService({
     url: `${EXPORT_CORPPARTY_URL}/?${queryString}`,
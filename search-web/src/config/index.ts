@@ -1,5 +1,8 @@
 export const BACKEND_URL = process.env.VUE_APP_BACKEND_HOST;
 
+// The search results that can be paged through. Narrow the search, or export it, to see the rest.
+export const MAX_RESULTS = 500;
+
 export const FIELD_VALUES = [
   { text: "First Name", value: "firstNme" },
   { text: "Last Name", value: "lastNme" },
@@ -17,9 +20,15 @@ export const OPERATOR_VALUES = [
   { text: "Exact Match", value: "exact" },
   { text: "Wildcard (% or *)", value: "wildcard" },
   { text: "Nicknames", value: "nicknames" },
-  { text: "Similar", value: "similar" }
+  { text: "Similar", value: "similar" },
+  { text: "Sounds Like", value: "phonetic" }
 ];
 
+// The "Sounds Like" search needs the API's name_key table, which only the Postgres deployments have.
+export const PHONETIC_SEARCH_ENABLED =
+  process.env.VUE_APP_PHONETIC_SEARCH_ENABLED === "true";
+export const PHONETIC_FIELDS = ["firstNme", "lastNme"];
+
 export const TERM_VALUES = {
   stateTypCd: [
     { text: "Active", value: "ACT" },